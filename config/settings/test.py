@@ -3,6 +3,7 @@ With these settings, tests play faster.
 """
 
 from .base import *  # noqa: F403
+from .base import DATABASES
 from .base import TEMPLATES
 from .base import env
 
@@ -16,6 +17,11 @@ SECRET_KEY = env(
 # https://docs.djangoproject.com/en/dev/ref/settings/#test-runner
 TEST_RUNNER = "django.test.runner.DiscoverRunner"
 
+# DATABASES
+# ------------------------------------------------------------------------------
+# A file backed test database waits for locks instead of failing, so threaded tests can share it
+DATABASES["default"]["TEST"] = {"NAME": "test_db.sql"}
+
 # PASSWORDS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#password-hashers
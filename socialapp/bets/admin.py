@@ -5,6 +5,8 @@ from django.urls import re_path
 
 from socialapp.bets.forms import BetCompletionForm
 from socialapp.bets.models import Bet, Vote
+from socialapp.users import balance
+from socialapp.users.models import CoinTransaction
 
 
 @admin.register(Vote)
@@ -39,20 +41,21 @@ class BetAdmin(admin.ModelAdmin):
         winning_answer = "a" if form.data.get("a") else "b"
         winning_ratio = bet.ratio_1 if winning_answer == "a" else bet.ratio_2
 
+        if not Bet.objects.filter(id=bet.id, rewards_granted=False).update(rewards_granted=True):
+            self.message_user(request, "Bet already paid", level=messages.ERROR)
+            return HttpResponseRedirect("/admin/bets/bet")
+
         winning_votes = bet.filter_votes_for(winning_answer)
         losing_votes = bet.exclude_votes_for(winning_answer)
-        for vote in winning_votes:
-            reward_for_user = vote.amount * winning_ratio
+        for vote in winning_votes.select_related("user"):
+            reward_for_user = int(vote.amount * winning_ratio)
 
-            vote.user.coins += reward_for_user
-            vote.user.save(update_fields=["coins"])
+            balance.credit(vote.user, reward_for_user, reason=CoinTransaction.Reason.BET_PAYOUT)
 
             vote.has_won = True
             vote.reward = reward_for_user - vote.amount
-            vote.save()
+            vote.save(update_fields=["has_won", "reward"])
         losing_votes.update(has_won=False)
-        bet.rewards_granted = True
-        bet.save()
         self.message_user(request, "ok")
         return HttpResponseRedirect(request.build_absolute_uri().split("/calculate")[0])
 
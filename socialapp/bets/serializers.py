@@ -1,12 +1,14 @@
 from datetime import timedelta
 
 from django.core.validators import MinValueValidator
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import serializers
 
 from socialapp.bets.models import Bet, Vote
 from socialapp.meetings.models import Meeting, Attendance, Place
-from socialapp.users.models import User
+from socialapp.users import balance
+from socialapp.users.models import User, CoinTransaction
 from socialapp.users.serializers import UserListSerializer
 from socialapp.utils import DetailException
 
@@ -80,7 +82,6 @@ class BetVoteSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = validated_data["user"]
-        user.coins -= validated_data["amount"]
-        user.save(update_fields=["coins"])
-        return super().create(validated_data)
+        with transaction.atomic():
+            balance.debit(validated_data["user"], validated_data["amount"], reason=CoinTransaction.Reason.BET)
+            return super().create(validated_data)
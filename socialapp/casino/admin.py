@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.http import HttpResponseRedirect
 
-from socialapp.casino.models import Spin, Game, Symbol
+from socialapp.casino.models import Spin, Game, Symbol, CasinoStats
 
 
 @admin.register(Symbol)
@@ -15,6 +15,12 @@ class SpinAdmin(admin.ModelAdmin):
     list_filter = ("user", "game")
 
 
+@admin.register(CasinoStats)
+class CasinoStatsAdmin(admin.ModelAdmin):
+    list_display = ("user", "game", "wins", "loses", "coins_won", "coins_lost")
+    list_filter = ("game",)
+
+
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
     list_display = ("id", "name")
@@ -0,0 +1,182 @@
+"""
+Return to player (RTP) of the casino games. The exact expected returns are read off the same tables and
+methods the games settle bets with. The Monte Carlo simulations replay them with NumPy to also get the
+variance and how fast a bankroll runs dry. NumPy is optional, it is too heavy for the Vercel bundle, so
+without it only the exact numbers are available.
+"""
+from socialapp.casino.models import Bells, HighCard, Roulette, Symbol
+from socialapp.casino.serializers import HighCardResultSerializer
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+CARD_VALUES = tuple(sorted(HighCard.MULTIPLIERS))
+CARD_SUITS = len(HighCard.SUITS)
+HIGH_CARD_BETS = ("low", "equal", "high")
+BEST_BET = "best"
+# player rounds simulated at once, keeps the reward matrix of a chunk around a few dozen MB
+SIMULATION_CHUNK = 2_000_000
+
+
+def roulette_expected_returns() -> dict[str, float]:
+    """Expected payout of every roulette bet per coin staked; straight up bets are the same for every number"""
+    balls = len(Roulette.PAYOUT_TABLE)
+    returns = {
+        bet.value: sum(payouts[bet] for payouts in Roulette.PAYOUT_TABLE) / balls
+        for bet in Roulette.CHOICES
+        if bet != Roulette.CHOICES.NUMBER
+    }
+    straight_up = [sum(payouts[number] for payouts in Roulette.PAYOUT_TABLE) / balls for number in range(balls)]
+    returns[Roulette.CHOICES.NUMBER.value] = sum(straight_up) / balls
+    return returns
+
+
+def high_card_rewards(bet_amount: int) -> dict[str, list[list[int]]]:
+    """``rewards[bet][previous][next]`` coins paid for ``bet_amount``, card values indexed from 0 (a two)"""
+    serializer = HighCardResultSerializer()
+    return {
+        bet: [
+            [serializer.calculate_reward(bet, previous, card, bet_amount) for card in CARD_VALUES]
+            for previous in CARD_VALUES
+        ]
+        for bet in HIGH_CARD_BETS
+    }
+
+
+def high_card_expected_returns(bet_amount: int = 100) -> dict[int, dict[str, float]]:
+    """
+    Expected payout per coin staked of every bet after every card value. The next card is drawn from the
+    full, freshly shuffled deck, so each value comes up with the same 4/52 chance.
+    """
+    rewards = high_card_rewards(bet_amount)
+    return {
+        previous: {bet: sum(rewards[bet][index]) / (len(CARD_VALUES) * bet_amount) for bet in HIGH_CARD_BETS}
+        for index, previous in enumerate(CARD_VALUES)
+    }
+
+
+def symbol_odds() -> list[dict]:
+    """Chance of every slot Symbol coming up on a reel"""
+    symbols = list(Symbol.objects.order_by("id").values("id", "name", "weight", "value"))
+    total = sum(symbol["weight"] for symbol in symbols)
+    for symbol in symbols:
+        symbol["probability"] = symbol["weight"] / total if total else 0
+    return symbols
+
+
+def bells_expected_return(symbols: list[dict]) -> float | None:
+    """
+    Expected payout of a Bells line per coin staked. Every cell is drawn on its own, so each line, and any
+    number of them, returns the same.
+    """
+    if not any(symbol["probability"] for symbol in symbols):
+        return None
+    return sum(symbol["probability"] ** Bells.REELS * symbol["value"] for symbol in symbols)
+
+
+def exact_report(bet_amount: int = 100) -> dict:
+    symbols = symbol_odds()
+    return {
+        "roulette": roulette_expected_returns(),
+        "high_card": high_card_expected_returns(bet_amount),
+        "bells": bells_expected_return(symbols),
+        "symbols": symbols,
+    }
+
+
+def simulate_roulette(bet: str, number: int | None = None, **options) -> dict:
+    """Monte Carlo of one roulette bet placed every round, see ``simulate`` for the options"""
+    key = Roulette.bet_key(bet, number)
+    payouts = np.array([payouts[key] for payouts in Roulette.PAYOUT_TABLE], dtype=np.int64)
+
+    def rewards(players, rounds, rng, bet_amount):
+        return payouts[rng.integers(0, len(payouts), size=(players, rounds))] * bet_amount
+
+    return simulate(rewards, **options)
+
+
+def simulate_high_card(bet: str, **options) -> dict:
+    """
+    Monte Carlo of HighCard with the same bet every round, or the bet with the best expected return after
+    each card when ``bet`` is "best". See ``simulate`` for the options.
+    """
+    tables = {}
+
+    def rewards(players, rounds, rng, bet_amount):
+        if bet_amount not in tables:
+            by_bet = high_card_rewards(bet_amount)
+            table = np.array([by_bet[name] for name in HIGH_CARD_BETS], dtype=np.int64)
+            choice = table.sum(axis=2).argmax(axis=0) if bet == BEST_BET else HIGH_CARD_BETS.index(bet)
+            tables[bet_amount] = table[choice, np.arange(len(CARD_VALUES))]
+        cards = rng.integers(0, len(CARD_VALUES) * CARD_SUITS, size=(players, rounds + 1)) // CARD_SUITS
+        return tables[bet_amount][cards[:, :-1], cards[:, 1:]]
+
+    return simulate(rewards, **options)
+
+
+def simulate_bells(**options) -> dict:
+    """Monte Carlo of one Bells line played every round, drawn from the alias table of the game"""
+    table, symbols = Bells.reels()
+    probability, alias = np.array(table.probability), np.array(table.alias, dtype=np.int64)
+    values = np.array([symbol.value for symbol in symbols], dtype=np.int64)
+
+    def rewards(players, rounds, rng, bet_amount):
+        columns = rng.integers(0, len(alias), size=(players, rounds, Bells.REELS))
+        cells = np.where(rng.random(columns.shape) < probability[columns], columns, alias[columns])
+        line = (cells == cells[..., :1]).all(axis=2)
+        return np.where(line, values[cells[..., 0]] * bet_amount, 0)
+
+    return simulate(rewards, **options)
+
+
+def simulate(
+    rewards,
+    players: int = 1000,
+    rounds: int = 1000,
+    bet_amount: int = 10,
+    bankroll: int = 500,
+    checkpoints: int = 10,
+    seed=None,
+) -> dict:
+    """
+    ``players`` bankrolls of ``bankroll`` coins each bet ``bet_amount`` for ``rounds`` rounds, the matrix of
+    coins paid back is drawn by ``rewards(players, rounds, rng, bet_amount)``. Reports the RTP and the
+    variance of the payout per coin staked, and the share of players who couldn't afford the next bet any
+    more at evenly spaced rounds.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is not installed")
+    rng = np.random.default_rng(seed)
+    marks = np.unique(np.linspace(1, rounds, min(checkpoints, rounds), dtype=np.int64))
+    chunk = max(1, SIMULATION_CHUNK // rounds)
+    total = squares = 0.0
+    ruined = np.zeros(len(marks), dtype=np.int64)
+    for start in range(0, players, chunk):
+        paid = rewards(min(chunk, players - start), rounds, rng, bet_amount)
+        multipliers = paid / bet_amount
+        total += multipliers.sum()
+        squares += np.square(multipliers).sum()
+        lowest = np.minimum.accumulate(bankroll + np.cumsum(paid - bet_amount, axis=1), axis=1)
+        ruined += (lowest[:, marks - 1] < bet_amount).sum(axis=0)
+    played = players * rounds
+    rtp = float(total / played)
+    return {
+        "rounds": played,
+        "rtp": rtp,
+        "house_edge": 1 - rtp,
+        "variance": float(squares / played - rtp**2),
+        "ruin": [{"round": int(mark), "ruined": int(count) / players} for mark, count in zip(marks, ruined)],
+    }
+
+
+def simulation_report(**options) -> dict:
+    """Simulations of every roulette bet, every HighCard bet and a Bells line with the same options"""
+    roulette = {
+        bet.value: simulate_roulette(bet, 17 if bet == Roulette.CHOICES.NUMBER else None, **options)
+        for bet in Roulette.CHOICES
+    }
+    high_card = {bet: simulate_high_card(bet, **options) for bet in (*HIGH_CARD_BETS, BEST_BET)}
+    bells = simulate_bells(**options) if Symbol.objects.filter(weight__gt=0).exists() else None
+    return {"roulette": roulette, "high_card": high_card, "bells": bells}
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from socialapp.casino import analysis
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the exact expected return of every roulette and HighCard bet, of a Bells line and the symbol odds. "
+        "With --simulate also run NumPy Monte Carlo simulations for the RTP, variance and bankroll ruin curves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bet-amount", type=int, default=10, help="Coins staked every round")
+        parser.add_argument("--simulate", action="store_true", help="Run the Monte Carlo simulations, needs NumPy")
+        parser.add_argument("--players", type=int, default=1000, help="Simulated bankrolls")
+        parser.add_argument("--rounds", type=int, default=1000, help="Rounds played with every bankroll")
+        parser.add_argument("--bankroll", type=int, default=500, help="Coins every simulated player starts with")
+        parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible simulations")
+
+    def handle(self, *args, bet_amount, simulate, players, rounds, bankroll, seed, **options):
+        if min(bet_amount, players, rounds, bankroll) < 1:
+            raise CommandError("--bet-amount, --players, --rounds and --bankroll have to be positive")
+        if simulate and analysis.np is None:
+            raise CommandError("NumPy is not installed, run without --simulate for the exact returns")
+        report = {"exact": analysis.exact_report(bet_amount)}
+        if simulate:
+            report["simulated"] = analysis.simulation_report(
+                players=players, rounds=rounds, bet_amount=bet_amount, bankroll=bankroll, seed=seed
+            )
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from socialapp.casino.models import CasinoStats, Spin
+from socialapp.users.models import User
+from socialapp.utils import id_chunks
+
+
+class Command(BaseCommand):
+    help = "Rebuild CasinoStats from the Spin history, chunk by chunk of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of users rebuilt in one transaction")
+
+    def handle(self, *args, chunk_size, **options):
+        rebuilt = sum(self.rebuild_chunk(user_ids) for user_ids in id_chunks(User.objects.all(), chunk_size))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} casino stats rows"))
+
+    @staticmethod
+    def rebuild_chunk(user_ids: list[int]) -> int:
+        totals = (
+            Spin.objects.filter(user_id__in=user_ids)
+            .values("user_id", "game")
+            .annotate(
+                wins=Count("id", filter=Q(has_won=True)),
+                loses=Count("id", filter=Q(has_won=False)),
+                coins_won=Sum("amount", filter=Q(has_won=True), default=0),
+                coins_lost=Sum("amount", filter=Q(has_won=False), default=0),
+            )
+            .order_by()
+        )
+        with transaction.atomic():
+            CasinoStats.objects.filter(user_id__in=user_ids).delete()
+            created = CasinoStats.objects.bulk_create(CasinoStats(**row) for row in totals)
+        return len(created)
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def fill_casino_stats(apps, schema_editor):
+    Spin = apps.get_model("casino", "Spin")
+    CasinoStats = apps.get_model("casino", "CasinoStats")
+    totals = (
+        Spin.objects.values("user_id", "game")
+        .annotate(
+            wins=Count("id", filter=Q(has_won=True)),
+            loses=Count("id", filter=Q(has_won=False)),
+            coins_won=Sum("amount", filter=Q(has_won=True), default=0),
+            coins_lost=Sum("amount", filter=Q(has_won=False), default=0),
+        )
+        .order_by()
+    )
+    CasinoStats.objects.bulk_create((CasinoStats(**row) for row in totals.iterator()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("casino", "0004_auto_20240708_0831"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CasinoStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "game",
+                    models.CharField(
+                        choices=[
+                            ("HighCard", "High Card"),
+                            ("Roulette", "Roulette"),
+                            ("BlackJack", "Black Jack"),
+                            ("Bells", "Bells"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("wins", models.PositiveIntegerField(default=0)),
+                ("loses", models.PositiveIntegerField(default=0)),
+                ("coins_won", models.BigIntegerField(default=0)),
+                ("coins_lost", models.BigIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="casino_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Casino stats",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="casinostats",
+            constraint=models.UniqueConstraint(
+                fields=("user", "game"), name="unique_casino_stats_per_game"
+            ),
+        ),
+        migrations.RunPython(fill_casino_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+RANKS = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A")
+SUITS = ("clubs", "hearts", "diamonds", "spades")
+
+
+def encode_cards(apps, schema_editor):
+    HighCard = apps.get_model("casino", "HighCard")
+    games = list(HighCard.objects.exclude(last_card=""))
+    for game in games:
+        rank, _, suit = game.last_card.partition("of")
+        if rank in RANKS and suit in SUITS:
+            game.card = RANKS.index(rank) * len(SUITS) + SUITS.index(suit)
+    HighCard.objects.bulk_update(games, ["card"])
+
+
+def decode_cards(apps, schema_editor):
+    HighCard = apps.get_model("casino", "HighCard")
+    games = list(HighCard.objects.filter(card__isnull=False))
+    for game in games:
+        game.last_card = f"{RANKS[game.card // len(SUITS)]}of{SUITS[game.card % len(SUITS)]}"
+    HighCard.objects.bulk_update(games, ["last_card"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("casino", "0005_casinostats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="highcard",
+            name="card",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(encode_cards, decode_cards),
+        migrations.RemoveField(
+            model_name="highcard",
+            name="last_card",
+        ),
+        migrations.RenameField(
+            model_name="highcard",
+            old_name="card",
+            new_name="last_card",
+        ),
+    ]
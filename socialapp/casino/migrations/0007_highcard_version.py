@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_games(apps, schema_editor):
+    """Racing get_or_create calls could give a user more than one game, the oldest one is kept"""
+    HighCard = apps.get_model("casino", "HighCard")
+    kept = HighCard.objects.filter(user__isnull=False).values("user").annotate(kept_id=Min("id")).values("kept_id")
+    HighCard.objects.filter(user__isnull=False).exclude(id__in=kept).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("casino", "0006_highcard_integer_cards"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_games, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="highcard",
+            name="version",
+            field=models.PositiveIntegerField(default=0, help_text="Bumped by every play"),
+        ),
+        migrations.AddConstraint(
+            model_name="highcard",
+            constraint=models.UniqueConstraint(fields=("user",), name="unique_high_card_per_user"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0011_cointransaction_reason_black_jack"),
+        ("casino", "0007_highcard_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BlackJackHand",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="blackjack_hand",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("shoe", models.BinaryField(default=b"")),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(
+                        default=0, help_text="Index of the next card in the shoe"
+                    ),
+                ),
+                ("dealer", models.BinaryField(default=b"")),
+                ("dealer_state", models.PositiveSmallIntegerField(default=0)),
+                ("hand", models.BinaryField(default=b"")),
+                ("hand_state", models.PositiveSmallIntegerField(default=0)),
+                ("bet_amount", models.PositiveIntegerField(default=0)),
+                ("split_hand", models.BinaryField(default=b"")),
+                ("split_state", models.PositiveSmallIntegerField(default=0)),
+                ("split_bet_amount", models.PositiveIntegerField(default=0)),
+                ("active_hand", models.PositiveSmallIntegerField(default=0)),
+                ("finished", models.BooleanField(default=True)),
+                (
+                    "payout",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Coins paid back for the last finished round",
+                    ),
+                ),
+                (
+                    "version",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Bumped by every action"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("casino", "0008_blackjackhand"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="symbol",
+            name="value",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="Value of the symbol, if user rolls a line of them, this is the amount it's gonna be multiplied by",
+            ),
+        ),
+    ]
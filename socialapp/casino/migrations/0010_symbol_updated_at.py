@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("casino", "0009_symbol_value_help_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="symbol",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,14 +1,19 @@
 import enum
 import itertools
 import random
+import time
 from abc import abstractmethod
-from random import shuffle
 
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import TextChoices
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, TextChoices
+from rest_framework import status
 
+from socialapp.users import balance
 from socialapp.users.admin import User
+from socialapp.users.models import CoinTransaction
+from socialapp.utils import DetailException, table_version
 
 
 class GAMES(models.TextChoices):
@@ -29,9 +34,41 @@ class Symbol(models.Model):
         help_text="Value of the symbol, if user rolls a line of them, this is the amount it's gonna be multiplied by",
     )
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return f"{self.name} weight:{self.weight} multiplier:{self.value}"
 
+    @classmethod
+    def reels_version(cls) -> str:
+        """Part of the key of the reels every process builds"""
+        return table_version(cls)[0]
+
+
+class AliasTable:
+    """
+    Vose's alias method, built in O(n) from integer weights, after that every draw is one random column
+    and one coin flip no matter how many outcomes there are
+    """
+
+    def __init__(self, weights: list[int]):
+        total = sum(weights)
+        scaled = [weight * len(weights) / total for weight in weights]
+        self.probability = [1.0] * len(weights)
+        self.alias = list(range(len(weights)))
+        small = [index for index, share in enumerate(scaled) if share < 1]
+        large = [index for index, share in enumerate(scaled) if share >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+
+    def draw(self) -> int:
+        column = random.randrange(len(self.probability))
+        return column if random.random() < self.probability[column] else self.alias[column]
+
 
 class Spin(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -42,6 +79,43 @@ class Spin(models.Model):
     chosen_lines = models.PositiveIntegerField(default=1)
     amount = models.IntegerField(validators=[MinValueValidator(1)])
 
+    def save(self, *args, **kwargs):
+        if self.id is not None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CasinoStats.record(self)
+
+
+class CasinoStats(models.Model):
+    """Running totals of a user's spins in one game, updated together with every new Spin"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="casino_stats")
+    game = models.CharField(max_length=20, choices=GAMES.choices)
+
+    wins = models.PositiveIntegerField(default=0)
+    loses = models.PositiveIntegerField(default=0)
+    coins_won = models.BigIntegerField(default=0)
+    coins_lost = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Casino stats"
+        constraints = [models.UniqueConstraint(fields=["user", "game"], name="unique_casino_stats_per_game")]
+
+    def __str__(self):
+        return f"{self.user} {self.game}"
+
+    @classmethod
+    def record(cls, spin: Spin) -> None:
+        if spin.has_won:
+            changes = {"wins": F("wins") + 1, "coins_won": F("coins_won") + spin.amount}
+        else:
+            changes = {"loses": F("loses") + 1, "coins_lost": F("coins_lost") + spin.amount}
+        if cls.objects.filter(user_id=spin.user_id, game=spin.game).update(**changes):
+            return
+        stats, _ = cls.objects.get_or_create(user_id=spin.user_id, game=spin.game)
+        cls.objects.filter(id=stats.id).update(**changes)
+
 
 class Game(models.Model):
     name = models.CharField(max_length=50, default="")
@@ -54,39 +128,104 @@ class Game(models.Model):
         return self.name
 
 
+class GameConflict(DetailException):
+    status_code = status.HTTP_409_CONFLICT
+
+
 class HighCard(models.Model):
+    """
+    Cards are small integers, ``rank * 4 + suit``, so a draw is a single random index into the lookup tables
+    below, nothing shared between requests is shuffled and no card string is ever parsed back.
+    Every play bumps ``version`` with a conditional update, a play that read an older version is rejected.
+    """
+
+    RANKS = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A")
+    SUITS = ("clubs", "hearts", "diamonds", "spades")
+    DECK_SIZE = len(RANKS) * len(SUITS)
+    EQUAL_MULTIPLIER = 6
+
+    # filled in below the class, indexed by card: its rank label, suit and value where a two is 2 and an ace 14
+    CARD_RANKS: tuple[str, ...] = ()
+    CARD_SUITS: tuple[str, ...] = ()
+    CARD_VALUES: tuple[int, ...] = ()
+    # (low, equal, high) multipliers offered after a card of the given value
+    MULTIPLIERS: dict[int, tuple[float, float, float]] = {}
+
+    GAME_CACHE_KEY = "casino:high_card:{}"
+    GAME_CACHE_TIMEOUT = 60 * 60
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
-    last_card = models.CharField(max_length=20, default="")
-
-    def play(self, deck: list, bet_amount: int, bet: str, *args, **kwargs) -> dict:
-        shuffle(deck)
-        next_card = deck[0]
-
-        if bet_amount == 0:
-            card_value, card_suit = next_card.split("of")
-            data = {
-                "bet_amount": bet_amount,
-                "card_suit": card_suit,
-                "card_value": card_value,
-                "demo_play": True,
-                "bet": bet,
-            }
-            self.last_card = next_card
-            self.save()
-            return data
-
-        next_card_value, next_card_suit = next_card.split("of")
-        data = {
-            "bet_amount": bet_amount,
-            "card_suit": next_card_suit,
-            "card_value": next_card_value,
-            "previous_card_value": self.last_card.split("of")[0],
-            "next_card_value": next_card_value,
-            "bet": bet,
-        }
-        self.last_card = next_card
-        self.save()
-        return data
+    last_card = models.PositiveSmallIntegerField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every play")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user"], name="unique_high_card_per_user")]
+
+    @classmethod
+    def multipliers_for(cls, card_value: int) -> tuple[float, float, float]:
+        if card_value == 8:
+            low = high = 1.55
+        elif card_value == 2:
+            low, high = 0, 1
+        elif card_value == 14:
+            low, high = 1, 0
+        elif card_value > 8:
+            low = round(0.1 * -abs(card_value - 8) + 1.55, 2)
+            high = round(0.1 * abs(card_value - 8) + 1.55, 2)
+        else:
+            low = round(0.1 * abs(card_value - 8) + 1.55, 2)
+            high = round(0.1 * -abs(card_value - 8) + 1.55, 2)
+        return low, cls.EQUAL_MULTIPLIER, high
+
+    @classmethod
+    def play_for(cls, user, bet_amount: int, bet: str, version: int | None = None) -> tuple["HighCard", dict]:
+        """
+        Plays the user's game. The game is normally taken from the cache, so a play costs no read, only the
+        conditional write. A cached copy that lost to a play handled elsewhere is dropped, the game is read
+        from the database and the play is made again against that row, which usually succeeds. GameConflict
+        is raised only when the compare-and-swap loses a second time, or ``version`` is not the current one.
+        """
+        key = cls.GAME_CACHE_KEY.format(user.id)
+        if state := cache.get(key):
+            game = cls(user=user, **state)
+            try:
+                return game, game.play(bet_amount, bet, version)
+            except GameConflict:
+                cache.delete(key)
+        game, _ = cls.objects.get_or_create(user=user)
+        return game, game.play(bet_amount, bet, version)
+
+    def remember(self) -> None:
+        """Caches the game for the next play, call it once the play is settled"""
+        state = {"id": self.id, "last_card": self.last_card, "version": self.version}
+        cache.set(self.GAME_CACHE_KEY.format(self.user_id), state, self.GAME_CACHE_TIMEOUT)
+
+    def play(self, bet_amount: int, bet: str, version: int | None = None, *args, **kwargs) -> dict:
+        """
+        Draws the next card from a full deck and moves the game to it, if nobody else did it since the game
+        was read and, when given, ``version`` is still the current one. The first card of a game has nothing
+        to compare to, so it is always dealt as a demo play.
+        """
+        if version is not None and version != self.version:
+            raise GameConflict("The game has moved on since you saw it, refresh it and play again")
+        next_card = random.randrange(self.DECK_SIZE)
+        moved = HighCard.objects.filter(id=self.id, version=self.version).update(
+            last_card=next_card, version=F("version") + 1
+        )
+        if not moved:
+            raise GameConflict("The game has moved on since you saw it, refresh it and play again")
+        previous_card, self.last_card = self.last_card, next_card
+        self.version += 1
+        data = {"bet_amount": bet_amount, "card": next_card, "bet": bet, "version": self.version}
+        if bet_amount == 0 or previous_card is None:
+            return {**data, "bet_amount": 0, "demo_play": True}
+        return {**data, "previous_card": previous_card}
+
+
+HighCard.CARD_RANKS = tuple(rank for rank in HighCard.RANKS for _ in HighCard.SUITS)
+HighCard.CARD_SUITS = HighCard.SUITS * len(HighCard.RANKS)
+HighCard.CARD_VALUES = tuple(value for value in range(2, len(HighCard.RANKS) + 2) for _ in HighCard.SUITS)
+HighCard.MULTIPLIERS = {value: HighCard.multipliers_for(value) for value in range(2, len(HighCard.RANKS) + 2)}
 
 
 class Roulette(Game):
@@ -112,56 +251,23 @@ class Roulette(Game):
         HALF_LOW = "HALF_LOW"
         HALF_HIGH = "HALF_HIGH"
 
+    # filled in below the class, PAYOUT_TABLE[ball][bet] is the multiplier paid for ``bet`` when ``ball``
+    # is rolled, 0 when the bet loses; straight up bets are keyed by their number, outside bets by choice
+    PAYOUT_TABLE: tuple[dict, ...] = ()
+    BET_MULTIPLIERS: dict = {}
+    COLORS: tuple[str, ...] = ()
+
+    @classmethod
+    def bet_key(cls, bet, user_number=None):
+        if bet == cls.CHOICES.NUMBER:
+            return user_number
+        return bet
+
     def check_bet(self, bet, ball_roll, user_number):
-        if bet == self.CHOICES.GREEN or user_number == 0:
-            return ball_roll == 0
-        elif bet == self.CHOICES.ODD:
-            return ball_roll % 2 == 1
-        elif bet == self.CHOICES.EVEN:
-            return ball_roll % 2 == 0
-        elif bet == self.CHOICES.HALF_HIGH:
-            return ball_roll >= 19
-        elif bet == self.CHOICES.HALF_LOW:
-            return ball_roll <= 18
-        elif bet == self.CHOICES.RED:
-            return ball_roll in self.RED_COLOR
-        elif bet == self.CHOICES.BLACK:
-            return ball_roll in self.BLACK_COLOR
-        elif bet == self.CHOICES.FIRST_12:
-            return 1 <= ball_roll <= 12
-        elif bet == self.CHOICES.SECOND_12:
-            return 13 <= ball_roll <= 24
-        elif bet == self.CHOICES.THIRD_12:
-            return 25 <= ball_roll <= 36
-        elif bet == self.CHOICES.ROW_1:
-            return ball_roll % 3 == 1
-        elif bet == self.CHOICES.ROW_2:
-            return ball_roll % 3 == 2
-        elif bet == self.CHOICES.ROW_3:
-            return ball_roll % 3 == 0
-        return user_number == ball_roll
+        return self.PAYOUT_TABLE[ball_roll].get(self.bet_key(bet, user_number), 0) > 0
 
     def bet_multiplier(self, bet):
-        if bet in [self.CHOICES.GREEN, self.CHOICES.NUMBER]:
-            return self.NUMBER_MULTIPLIER
-        if bet in [
-            self.CHOICES.RED,
-            self.CHOICES.BLACK,
-            self.CHOICES.EVEN,
-            self.CHOICES.ODD,
-            self.CHOICES.HALF_HIGH,
-            self.CHOICES.HALF_LOW,
-        ]:
-            return self.COLOR_MULTIPLIER
-        if bet in [
-            self.CHOICES.ROW_2,
-            self.CHOICES.ROW_3,
-            self.CHOICES.ROW_1,
-            self.CHOICES.FIRST_12,
-            self.CHOICES.SECOND_12,
-            self.CHOICES.THIRD_12,
-        ]:
-            return self.COLUMN_AND_DOZEN_MULTIPLIER
+        return self.BET_MULTIPLIERS[bet]
 
     VALUE_TO_FRONTEND_INDEX = {
         0: 0,
@@ -204,40 +310,382 @@ class Roulette(Game):
     }
 
     def play(self, user, bet, bet_amount, user_number, *args, **kwargs):
+        result = self.play_many(user, [(bet, user_number, bet_amount)])
+        return {
+            "rolled_number": result["rolled_number"],
+            "rolled_number_index": result["rolled_number_index"],
+            "has_won": result["bets"][0]["has_won"],
+            "amount": result["amount"],
+            "color": result["color"],
+        }
+
+    def play_many(self, user, bets: list[tuple[str, int | None, int]]) -> dict:
+        """
+        Settles every (choice, number, amount) bet against a single ball roll. The stake is taken and the
+        winnings paid in one balance update, and the whole spin is stored as one Spin with the net result,
+        or none at all when it breaks even.
+        """
         ball_roll = random.randint(0, 36)
-        user.coins -= bet_amount
-        spin = Spin(game=GAMES.ROULETTE, user=user, amount=bet_amount)
-        user_number = user_number or 100
-        has_won = self.check_bet(bet=bet, ball_roll=ball_roll, user_number=user_number)
-        won_amount = 0
-        if has_won:
-            won_amount = bet_amount * self.bet_multiplier(bet=bet)
-            user.coins += won_amount
-            spin.amount = won_amount - bet_amount
-            spin.has_won = True
-        spin.save()
-        user.save()
-        color = "RED"
-        if ball_roll == 0:
-            color = "GREEN"
-        elif ball_roll in self.BLACK_COLOR:
-            color = "BLACK"
+        payouts = self.PAYOUT_TABLE[ball_roll]
+        results = []
+        for bet, user_number, bet_amount in bets:
+            won_amount = bet_amount * payouts.get(self.bet_key(bet, user_number), 0)
+            results.append(
+                {
+                    "bet": bet,
+                    "number": user_number,
+                    "bet_amount": bet_amount,
+                    "has_won": won_amount > 0,
+                    "amount": won_amount,
+                }
+            )
+        total_bet = sum(bet_amount for _, _, bet_amount in bets)
+        won_amount = sum(result["amount"] for result in results)
+        net = won_amount - total_bet
+        with transaction.atomic():
+            balance.change_balance(user, coins=net, require_coins=total_bet, reason=CoinTransaction.Reason.ROULETTE)
+            if net:
+                Spin(game=GAMES.ROULETTE, user=user, amount=abs(net), has_won=net > 0).save()
         return {
             "rolled_number": ball_roll,
             "rolled_number_index": self.VALUE_TO_FRONTEND_INDEX[ball_roll],
-            "has_won": has_won,
+            "color": self.COLORS[ball_roll],
+            "has_won": net > 0,
             "amount": won_amount,
-            "color": color,
+            "bets": results,
+        }
+
+
+def _roulette_payout_table() -> tuple[tuple[dict, ...], dict]:
+    choices = Roulette.CHOICES
+    red, black = set(Roulette.RED_COLOR), set(Roulette.BLACK_COLOR)
+    even_money, column_and_dozen = Roulette.COLOR_MULTIPLIER, Roulette.COLUMN_AND_DOZEN_MULTIPLIER
+    outside_bets = {
+        choices.GREEN: (Roulette.NUMBER_MULTIPLIER, lambda ball: ball == 0),
+        choices.ODD: (even_money, lambda ball: ball % 2 == 1),
+        choices.EVEN: (even_money, lambda ball: ball % 2 == 0),
+        choices.HALF_LOW: (even_money, lambda ball: ball <= 18),
+        choices.HALF_HIGH: (even_money, lambda ball: ball >= 19),
+        choices.RED: (even_money, lambda ball: ball in red),
+        choices.BLACK: (even_money, lambda ball: ball in black),
+        choices.FIRST_12: (column_and_dozen, lambda ball: 1 <= ball <= 12),
+        choices.SECOND_12: (column_and_dozen, lambda ball: 13 <= ball <= 24),
+        choices.THIRD_12: (column_and_dozen, lambda ball: 25 <= ball <= 36),
+        choices.ROW_1: (column_and_dozen, lambda ball: ball % 3 == 1),
+        choices.ROW_2: (column_and_dozen, lambda ball: ball % 3 == 2),
+        choices.ROW_3: (column_and_dozen, lambda ball: ball % 3 == 0),
+    }
+    multipliers = {bet: multiplier for bet, (multiplier, _) in outside_bets.items()}
+    multipliers[choices.NUMBER] = Roulette.NUMBER_MULTIPLIER
+    # zero is green, every outside bet but GREEN itself loses on it
+    table = tuple(
+        {
+            **{
+                bet: multiplier if wins(ball) and (ball != 0 or bet == choices.GREEN) else 0
+                for bet, (multiplier, wins) in outside_bets.items()
+            },
+            **{number: Roulette.NUMBER_MULTIPLIER if number == ball else 0 for number in range(37)},
         }
+        for ball in range(37)
+    )
+    return table, multipliers
+
+
+Roulette.PAYOUT_TABLE, Roulette.BET_MULTIPLIERS = _roulette_payout_table()
+Roulette.COLORS = tuple(
+    "GREEN" if ball == 0 else "BLACK" if ball in Roulette.BLACK_COLOR else "RED" for ball in range(37)
+)
+
+
+class BlackJackHand(models.Model):
+    """
+    The blackjack round a user is playing, one row per user rewritten by every action. Cards use the HighCard
+    encoding and are kept as bytes, the shoe too, every hand also keeps a small state number, ``hard total * 2``
+    plus 1 once it holds an ace, so its total and the result of drawing a card are lookups in the tables below.
+    Every action reads the row by its primary key and writes it back only if ``version`` didn't move meanwhile.
+    """
+
+    DECKS = 4
+    RESHUFFLE_AT = 52
+    DEALER_STANDS_AT = 17
+    NATURAL_PAYOUT = 2.5
+    ACTIONS = ("deal", "hit", "stand", "double", "split")
+
+    # filled in below the class
+    CARD_POINTS: tuple[int, ...] = ()
+    HAND_TOTALS: tuple[int, ...] = ()
+    NEXT_STATE: tuple[tuple[int, ...], ...] = ()
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="blackjack_hand")
+    shoe = models.BinaryField(default=b"")
+    position = models.PositiveSmallIntegerField(default=0, help_text="Index of the next card in the shoe")
+    dealer = models.BinaryField(default=b"")
+    dealer_state = models.PositiveSmallIntegerField(default=0)
+    hand = models.BinaryField(default=b"")
+    hand_state = models.PositiveSmallIntegerField(default=0)
+    bet_amount = models.PositiveIntegerField(default=0)
+    split_hand = models.BinaryField(default=b"")
+    split_state = models.PositiveSmallIntegerField(default=0)
+    split_bet_amount = models.PositiveIntegerField(default=0)
+    active_hand = models.PositiveSmallIntegerField(default=0)
+    finished = models.BooleanField(default=True)
+    payout = models.PositiveIntegerField(default=0, help_text="Coins paid back for the last finished round")
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every action")
+
+    STATE_FIELDS = (
+        "shoe",
+        "position",
+        "dealer",
+        "dealer_state",
+        "hand",
+        "hand_state",
+        "bet_amount",
+        "split_hand",
+        "split_state",
+        "split_bet_amount",
+        "active_hand",
+        "finished",
+        "payout",
+    )
+
+    def __str__(self):
+        return f"{self.user} {'finished' if self.finished else 'playing'}"
+
+    @classmethod
+    def act(cls, user, action: str, bet_amount: int = 0, version: int | None = None) -> "BlackJackHand":
+        """
+        Runs ``action`` on the user's round. Coins staked by the action and the payout of a finished round
+        are one balance update, a finished round is stored as one Spin with its net result unless it is a push.
+        """
+        game = cls.objects.filter(user=user).first() or cls(user=user)
+        if version is not None and version != game.version:
+            raise GameConflict("The hand has moved on since you saw it, refresh it and play again")
+        if action not in game.allowed_actions():
+            raise DetailException(f"You can't {action} now")
+        stake = game.deal(bet_amount) if action == "deal" else getattr(game, action)()
+        with transaction.atomic():
+            game.save_state()
+            payout = game.payout if game.finished else 0
+            balance.change_balance(
+                user, coins=payout - stake, require_coins=stake, reason=CoinTransaction.Reason.BLACK_JACK
+            )
+            net = payout - game.bet_amount - game.split_bet_amount
+            if game.finished and net:
+                Spin(game=GAMES.BLACK_JACK, user=user, amount=abs(net), has_won=net > 0).save()
+        return game
+
+    def save_state(self) -> None:
+        if self._state.adding:
+            self.version = 1
+            try:
+                with transaction.atomic():
+                    self.save(force_insert=True)
+            except IntegrityError:
+                raise GameConflict("The hand has moved on since you saw it, refresh it and play again")
+            return
+        moved = BlackJackHand.objects.filter(user_id=self.user_id, version=self.version).update(
+            version=F("version") + 1, **{field: getattr(self, field) for field in self.STATE_FIELDS}
+        )
+        if not moved:
+            raise GameConflict("The hand has moved on since you saw it, refresh it and play again")
+        self.version += 1
+
+    def hands(self) -> list[tuple[bytes, int, int]]:
+        """(cards, state, bet amount) of the played hands"""
+        hands = [(bytes(self.hand), self.hand_state, self.bet_amount)]
+        if self.split_hand:
+            hands.append((bytes(self.split_hand), self.split_state, self.split_bet_amount))
+        return hands
+
+    def allowed_actions(self) -> list[str]:
+        if self.finished:
+            return ["deal"]
+        cards, _, _ = self.hands()[self.active_hand]
+        actions = ["hit", "stand"]
+        if len(cards) == 2:
+            actions.append("double")
+            if not self.split_hand and HighCard.CARD_RANKS[cards[0]] == HighCard.CARD_RANKS[cards[1]]:
+                actions.append("split")
+        return actions
+
+    def deal(self, bet_amount: int) -> int:
+        if bet_amount < 1:
+            raise DetailException("Place a bet to deal")
+        if len(self.shoe) - self.position < self.RESHUFFLE_AT:
+            cards = list(range(HighCard.DECK_SIZE)) * self.DECKS
+            random.shuffle(cards)
+            self.shoe, self.position = bytes(cards), 0
+        self.hand, self.hand_state, self.bet_amount = b"", 0, bet_amount
+        self.split_hand, self.split_state, self.split_bet_amount = b"", 0, 0
+        self.dealer, self.dealer_state = b"", 0
+        self.active_hand, self.finished, self.payout = 0, False, 0
+        for _ in range(2):
+            self._hit_player(0)
+            self.dealer, self.dealer_state = self._draw(self.dealer, self.dealer_state)
+        if self.HAND_TOTALS[self.hand_state] == 21 or self.HAND_TOTALS[self.dealer_state] == 21:
+            self._finish()
+        return bet_amount
+
+    def hit(self) -> int:
+        self._hit_player(self.active_hand)
+        if self.HAND_TOTALS[self.hands()[self.active_hand][1]] >= 21:
+            self._next_hand()
+        return 0
+
+    def stand(self) -> int:
+        self._next_hand()
+        return 0
+
+    def double(self) -> int:
+        stake = self.hands()[self.active_hand][2]
+        if self.active_hand:
+            self.split_bet_amount += stake
+        else:
+            self.bet_amount += stake
+        self._hit_player(self.active_hand)
+        self._next_hand()
+        return stake
+
+    def split(self) -> int:
+        first, second = bytes(self.hand)
+        self.hand, self.hand_state = bytes([first]), self.NEXT_STATE[0][first]
+        self.split_hand, self.split_state = bytes([second]), self.NEXT_STATE[0][second]
+        self.split_bet_amount = self.bet_amount
+        self._hit_player(0)
+        self._hit_player(1)
+        if self.HAND_TOTALS[self.hand_state] == 21:
+            self._next_hand()
+        return self.split_bet_amount
+
+    def _draw(self, cards: bytes, state: int) -> tuple[bytes, int]:
+        card = self.shoe[self.position]
+        self.position += 1
+        return bytes(cards) + bytes([card]), self.NEXT_STATE[state][card]
+
+    def _hit_player(self, hand: int) -> None:
+        if hand:
+            self.split_hand, self.split_state = self._draw(self.split_hand, self.split_state)
+        else:
+            self.hand, self.hand_state = self._draw(self.hand, self.hand_state)
+
+    def _next_hand(self) -> None:
+        if self.active_hand == 0 and self.split_hand:
+            self.active_hand = 1
+            if self.HAND_TOTALS[self.split_state] < 21:
+                return
+        self._finish()
+
+    def is_natural(self, cards: bytes, state: int) -> bool:
+        return len(cards) == 2 and not self.split_hand and self.HAND_TOTALS[state] == 21
+
+    def _finish(self) -> None:
+        """Dealer draws to DEALER_STANDS_AT unless there is nothing left to beat, then every hand is paid"""
+        hands = self.hands()
+        dealer_natural = len(self.dealer) == 2 and self.HAND_TOTALS[self.dealer_state] == 21
+        alive = [
+            state for cards, state, _ in hands if self.HAND_TOTALS[state] <= 21 and not self.is_natural(cards, state)
+        ]
+        if alive and not dealer_natural:
+            while self.HAND_TOTALS[self.dealer_state] < self.DEALER_STANDS_AT:
+                self.dealer, self.dealer_state = self._draw(self.dealer, self.dealer_state)
+        dealer = self.HAND_TOTALS[self.dealer_state]
+        payout = 0
+        for cards, state, bet_amount in hands:
+            total = self.HAND_TOTALS[state]
+            if self.is_natural(cards, state):
+                payout += bet_amount if dealer_natural else int(bet_amount * self.NATURAL_PAYOUT)
+            elif total > 21 or dealer_natural:
+                continue
+            elif dealer > 21 or total > dealer:
+                payout += 2 * bet_amount
+            elif total == dealer:
+                payout += bet_amount
+        self.payout, self.finished = payout, True
+
+
+def _blackjack_tables() -> tuple[tuple[int, ...], tuple[int, ...], tuple[tuple[int, ...], ...]]:
+    # nobody draws on more than 20, so no hand gets past a hard 30
+    hard_totals = range(32)
+    points = tuple(1 if value == 14 else min(value, 10) for value in HighCard.CARD_VALUES)
+    totals = tuple(hard + 10 if soft and hard + 10 <= 21 else hard for hard in hard_totals for soft in (0, 1))
+    next_state = tuple(
+        tuple(
+            min(hard + points[card], hard_totals[-1]) * 2 + (soft or points[card] == 1) for card in range(len(points))
+        )
+        for hard in hard_totals
+        for soft in (0, 1)
+    )
+    return points, totals, next_state
+
+
+BlackJackHand.CARD_POINTS, BlackJackHand.HAND_TOTALS, BlackJackHand.NEXT_STATE = _blackjack_tables()
 
 
 class BlackJack(Game):
     @staticmethod
-    def play(user, chosen_lines, *args, **kwargs):
-        return None
+    def play(user, action, bet_amount=0, version=None, *args, **kwargs) -> BlackJackHand:
+        return BlackJackHand.act(user, action, bet_amount, version)
 
 
 class Bells(Game):
-    @staticmethod
-    def play(user, chosen_lines, *args, **kwargs):
-        return None
+    REELS = 3
+    ROWS = 3
+    # cells of every payline on the grid read reel by reel, ``reel * ROWS + row``,
+    # the first chosen_lines of them are played
+    PAYLINES = (
+        (1, 4, 7),
+        (0, 3, 6),
+        (2, 5, 8),
+        (0, 4, 8),
+        (2, 4, 6),
+    )
+
+    # seconds a process spins on its reels before reading Symbol.reels_version again, so a symbol
+    # changed in the admin reaches every process within this long and a spin costs no symbol query
+    REELS_CHECK_INTERVAL = 60
+    # (Symbol.reels_version, time.monotonic() of the last check, alias table, symbols) of this process,
+    # rebuilt when the version moves on
+    _reels: tuple[str, float, AliasTable, list[Symbol]] | None = None
+
+    @classmethod
+    def reels(cls) -> tuple[AliasTable, list[Symbol]]:
+        reels = cls._reels
+        now = time.monotonic()
+        if reels is None or now - reels[1] >= cls.REELS_CHECK_INTERVAL:
+            version = Symbol.reels_version()
+            if reels is not None and reels[0] == version:
+                reels = cls._reels = (version, now, reels[2], reels[3])
+            else:
+                symbols = [symbol for symbol in Symbol.objects.order_by("id") if symbol.weight]
+                if not symbols:
+                    raise DetailException("The slot machine has no symbols yet")
+                reels = cls._reels = (version, now, AliasTable([symbol.weight for symbol in symbols]), symbols)
+        return reels[2], reels[3]
+
+    @classmethod
+    def play(cls, user, chosen_lines, bet_amount=1, *args, **kwargs) -> dict:
+        """
+        Spins every cell of the grid from the alias table and pays ``bet_amount`` times the symbol value for
+        every chosen line showing one symbol only. The stake and the winnings are one balance update and the
+        spin is stored as one Spin with the net result, or none at all when it breaks even.
+        """
+        table, symbols = cls.reels()
+        grid = [table.draw() for _ in range(cls.REELS * cls.ROWS)]
+        winning_lines = [
+            index
+            for index, (first, *rest) in enumerate(cls.PAYLINES[:chosen_lines])
+            if all(grid[cell] == grid[first] for cell in rest)
+        ]
+        won_amount = sum(bet_amount * symbols[grid[cls.PAYLINES[line][0]]].value for line in winning_lines)
+        total_bet = bet_amount * chosen_lines
+        net = won_amount - total_bet
+        with transaction.atomic():
+            balance.change_balance(user, coins=net, require_coins=total_bet, reason=CoinTransaction.Reason.BELLS)
+            if net:
+                Spin(game=GAMES.BELLS, user=user, amount=abs(net), has_won=net > 0, chosen_lines=chosen_lines).save()
+        return {
+            "won": net > 0,
+            "amount": won_amount,
+            "result": [[symbols[grid[reel * cls.ROWS + row]] for reel in range(cls.REELS)] for row in range(cls.ROWS)],
+            "winning_lines": winning_lines,
+        }
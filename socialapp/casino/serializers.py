@@ -1,7 +1,10 @@
 from rest_framework.serializers import *
 from django.core.validators import MinValueValidator
+from django.db import transaction
 
-from socialapp.casino.models import Game, Symbol, Spin, GAMES, Roulette
+from socialapp.casino.models import BlackJackHand, Bells, Game, Symbol, Spin, GAMES, HighCard, Roulette
+from socialapp.users import balance
+from socialapp.users.models import CoinTransaction
 from socialapp.utils import DetailException
 
 
@@ -18,8 +21,8 @@ class GameSerializer(ModelSerializer):
 
 
 class GameSpinSerializer(ModelSerializer):
-    bet_amount = IntegerField(write_only=True, validators=[MinValueValidator(0)])
-    lines_chosen = IntegerField(default=1, write_only=True)
+    bet_amount = IntegerField(write_only=True, validators=[MinValueValidator(1)], help_text="Coins bet on every line")
+    lines_chosen = IntegerField(default=1, write_only=True, min_value=1, max_value=len(Bells.PAYLINES))
 
     class Meta:
         model = Game
@@ -27,7 +30,7 @@ class GameSpinSerializer(ModelSerializer):
 
     def validate(self, attrs):
         user = self.context["request"].user
-        if attrs["bet_amount"] > user.coins:
+        if attrs["bet_amount"] * attrs["lines_chosen"] > user.coins:
             raise DetailException("Insufficient coins")
         return attrs
 
@@ -35,98 +38,81 @@ class GameSpinSerializer(ModelSerializer):
 class HighCardPlaySerializer(Serializer):
     bet_amount = IntegerField(write_only=True, validators=[MinValueValidator(0)])
     bet = ChoiceField(choices=["high", "low", "equal"])
+    version = IntegerField(
+        required=False, min_value=0, help_text="Version of the game you saw, the play is rejected if it moved on"
+    )
 
 
 class HighCardResultSerializer(Serializer):
     demo_play = BooleanField(default=False)
-    card_value = CharField()
-    card_suit = CharField()
+    card = IntegerField(write_only=True, min_value=0, max_value=HighCard.DECK_SIZE - 1)
+    previous_card = IntegerField(write_only=True, required=False, min_value=0, max_value=HighCard.DECK_SIZE - 1)
+    card_value = CharField(read_only=True)
+    card_suit = CharField(read_only=True)
     bet_amount = IntegerField()
     has_won = BooleanField(default=False)
     reward = IntegerField(default=0)
+    version = IntegerField()
 
-    multipliers = ListField(required=False)
+    multipliers = ListField(read_only=True)
 
-    next_card_value = CharField(required=False)
-    previous_card_value = CharField(required=False)
+    next_card_value = CharField(read_only=True)
+    previous_card_value = CharField(read_only=True)
     bet = CharField(write_only=True)
 
-    FACES_VALUES = {"J": 11, "Q": 12, "K": 13, "A": 14}
-    HIGH_LOW_MULTIPLIER = 1.4
-    EQUAL_MULTIPLIER = 6
-
     class Meta:
         fields = "__all__"
 
     def to_representation(self, instance):
-        instance = super().to_representation(instance)
-        card_value_string = instance["card_value"]
-        card_value = self.FACES_VALUES.get(card_value_string) if card_value_string.isalpha() else int(card_value_string)
-        instance["multipliers"] = self.calculate_multipliers_based_on_previous_card(card_value)
-        return instance
+        data = super().to_representation(instance)
+        card = instance["card"]
+        data["card_value"] = HighCard.CARD_RANKS[card]
+        data["card_suit"] = HighCard.CARD_SUITS[card]
+        data["multipliers"] = list(HighCard.MULTIPLIERS[HighCard.CARD_VALUES[card]])
+        if not instance["demo_play"]:
+            data["next_card_value"] = HighCard.CARD_RANKS[card]
+            data["previous_card_value"] = HighCard.CARD_RANKS[instance["previous_card"]]
+        return data
 
     def calculate_multipliers_based_on_previous_card(self, card_value) -> (float, float, float):
-        equal = 6
-        if card_value == 8:
-            low = 1.55
-            high = 1.55
-        elif card_value == 2:
-            low = 0
-            high = 1
-        elif card_value == 14:
-            low = 1
-            high = 0
-        elif card_value > 8:
-            low = round(0.1 * -abs(card_value - 8) + 1.55, 2)
-            high = round(0.1 * abs(card_value - 8) + 1.55, 2)
-        else:
-            low = round(0.1 * abs(card_value - 8) + 1.55, 2)
-            high = round(0.1 * -abs(card_value - 8) + 1.55, 2)
-        return low, equal, high
+        return HighCard.MULTIPLIERS[card_value]
+
+    def calculate_reward(self, bet: str, previous_card_value: int, next_card_value: int, bet_amount: int) -> int:
+        """Coins paid back for ``bet`` when ``next_card_value`` follows ``previous_card_value``, 0 on a loss"""
+        low_multiplier, equal_multiplier, high_multiplier = self.calculate_multipliers_based_on_previous_card(
+            previous_card_value
+        )
+        if bet == "high" and next_card_value > previous_card_value:
+            return int(high_multiplier * bet_amount)
+        if bet == "low" and next_card_value < previous_card_value:
+            return int(low_multiplier * bet_amount)
+        if bet == "equal" and next_card_value == previous_card_value:
+            return int(equal_multiplier * bet_amount)
+        return 0
 
     def validate(self, attrs):
         if attrs["demo_play"]:
             return attrs
-        previous_card_value = (
-            self.FACES_VALUES.get(attrs["previous_card_value"])
-            if attrs["previous_card_value"].isalpha()
-            else int(attrs["previous_card_value"])
-        )
-        next_card_value = (
-            self.FACES_VALUES.get(attrs["next_card_value"])
-            if attrs["next_card_value"].isalpha()
-            else int(attrs["next_card_value"])
-        )
+        previous_card_value = HighCard.CARD_VALUES[attrs["previous_card"]]
+        next_card_value = HighCard.CARD_VALUES[attrs["card"]]
         bet_amount = attrs.get("bet_amount")
         user = self.context["user"]
         if user.coins < bet_amount:
             raise DetailException("Insufficient coins")
-        bet = attrs.get("bet")
-        low_multiplier, equal_multiplier, high_multiplier = self.calculate_multipliers_based_on_previous_card(
-            previous_card_value
-        )
-
-        user.coins -= bet_amount
-        if bet == "high":
-            if next_card_value > previous_card_value:
-                user.coins += high_multiplier * bet_amount
-                attrs["has_won"] = True
-                attrs["reward"] = high_multiplier * bet_amount
-        elif bet == "low":
-            if next_card_value < previous_card_value:
-                user.coins += low_multiplier * bet_amount
-                attrs["has_won"] = True
-                attrs["reward"] = low_multiplier * bet_amount
-        elif bet == "equal":
-            if next_card_value == previous_card_value:
-                user.coins += equal_multiplier * bet_amount
-                attrs["has_won"] = True
-                attrs["reward"] = equal_multiplier * bet_amount
-
-        spin = Spin(game=GAMES.HIGH_CARD, user=user, has_won=attrs["has_won"])
-        spin.amount = attrs["reward"] - bet_amount if attrs["has_won"] else bet_amount
-        spin.save()
-        user.save(update_fields=["coins"])
+        attrs["reward"] = self.calculate_reward(attrs.get("bet"), previous_card_value, next_card_value, bet_amount)
+        attrs["has_won"] = attrs["reward"] > 0
+
+        net = attrs["reward"] - bet_amount
+        with transaction.atomic():
+            balance.change_balance(
+                user,
+                coins=net,
+                require_coins=bet_amount,
+                reason=CoinTransaction.Reason.HIGH_CARD,
+            )
+            # a reward equal to the stake is neither a win nor a loss in the stats, like a roulette break even
+            if net:
+                Spin(game=GAMES.HIGH_CARD, user=user, amount=abs(net), has_won=net > 0).save()
         return attrs
 
 
@@ -134,6 +120,7 @@ class SpinResultSerializer(Serializer):
     won = BooleanField(read_only=True, default=False)
     amount = IntegerField(read_only=True, default=0)
     result: ListSerializer[SymbolSerializer] = ListSerializer(child=SymbolSerializer(many=True))
+    winning_lines = ListField(child=IntegerField(), read_only=True)
 
 
 class RouletteSerializer(Serializer):
@@ -156,3 +143,97 @@ class RouletteResultSerializer(Serializer):
     rolled_number = IntegerField()
     rolled_number_index = IntegerField()
     color = CharField()
+
+
+class RouletteBetSerializer(Serializer):
+    bet = ChoiceField(choices=Roulette.CHOICES)
+    number = IntegerField(required=False, allow_null=True, min_value=0, max_value=36)
+    bet_amount = IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        if attrs.get("number") is not None and attrs["bet"] != Roulette.CHOICES.NUMBER:
+            raise DetailException("Chose number as bet")
+        if attrs["bet"] == Roulette.CHOICES.NUMBER and attrs.get("number") is None:
+            raise DetailException("Chose the number you bet on")
+        return attrs
+
+
+class RouletteBetsSerializer(Serializer):
+    MAX_BETS = 20
+
+    bets = RouletteBetSerializer(many=True, allow_empty=False, max_length=MAX_BETS)
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        if sum(bet["bet_amount"] for bet in attrs["bets"]) > user.coins:
+            raise DetailException("Insufficient coins")
+        return attrs
+
+
+class RouletteBetResultSerializer(Serializer):
+    bet = CharField()
+    number = IntegerField(allow_null=True)
+    bet_amount = IntegerField()
+    has_won = BooleanField()
+    amount = IntegerField()
+
+
+class RouletteBetsResultSerializer(RouletteResultSerializer):
+    bets = RouletteBetResultSerializer(many=True)
+
+
+class ReturnToPlayerQuerySerializer(Serializer):
+    MAX_PLAYERS = 2000
+    MAX_ROUNDS = 1000
+
+    bet_amount = IntegerField(default=10, min_value=1)
+    simulate = BooleanField(default=False, help_text="Run the Monte Carlo simulations too, needs NumPy")
+    players = IntegerField(default=1000, min_value=1, max_value=MAX_PLAYERS)
+    rounds = IntegerField(default=1000, min_value=1, max_value=MAX_ROUNDS)
+    bankroll = IntegerField(default=500, min_value=1, help_text="Coins every simulated player starts with")
+    seed = IntegerField(required=False, min_value=0)
+
+
+class BlackJackActionSerializer(Serializer):
+    action = ChoiceField(choices=BlackJackHand.ACTIONS)
+    bet_amount = IntegerField(required=False, min_value=1, help_text="Needed to deal")
+    version = IntegerField(
+        required=False, min_value=0, help_text="Version of the hand you saw, the action is rejected if it moved on"
+    )
+
+    def validate(self, attrs):
+        if attrs["action"] == "deal" and "bet_amount" not in attrs:
+            raise DetailException("Place a bet to deal")
+        if attrs.get("bet_amount", 0) > self.context["request"].user.coins:
+            raise DetailException("Insufficient coins")
+        return attrs
+
+
+class BlackJackHandSerializer(Serializer):
+    dealer = SerializerMethodField()
+    dealer_total = SerializerMethodField()
+    hands = SerializerMethodField()
+    active_hand = IntegerField()
+    finished = BooleanField()
+    payout = IntegerField()
+    version = IntegerField()
+    actions = ListField(child=CharField(), source="allowed_actions")
+
+    @staticmethod
+    def cards(cards: bytes) -> list[dict]:
+        return [{"card_value": HighCard.CARD_RANKS[card], "card_suit": HighCard.CARD_SUITS[card]} for card in cards]
+
+    def get_dealer(self, hand) -> list[dict]:
+        """Only the face up card of the dealer until the round is finished"""
+        cards = bytes(hand.dealer)
+        return self.cards(cards if hand.finished else cards[:1])
+
+    def get_dealer_total(self, hand) -> int | None:
+        return BlackJackHand.HAND_TOTALS[hand.dealer_state] if hand.finished and hand.dealer else None
+
+    def get_hands(self, hand) -> list[dict]:
+        return [
+            {"cards": self.cards(cards), "total": BlackJackHand.HAND_TOTALS[state], "bet_amount": bet_amount}
+            for cards, state, bet_amount in hand.hands()
+            if cards
+        ]
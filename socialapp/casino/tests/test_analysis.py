@@ -0,0 +1,113 @@
+from io import StringIO
+import json
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APITestCase, APIClient
+
+from socialapp.casino import analysis
+from socialapp.casino.models import Roulette, Symbol
+from socialapp.users.tests.factories import UserFactory
+
+
+class TestExactReturns(TestCase):
+    def test_roulette_keeps_one_zero_of_edge_on_every_bet(self):
+        returns = analysis.roulette_expected_returns()
+        self.assertEqual(set(returns), {choice.value for choice in Roulette.CHOICES})
+        for bet, expected in returns.items():
+            self.assertAlmostEqual(expected, 36 / 37, msg=bet)
+
+    def test_high_card(self):
+        returns = analysis.high_card_expected_returns(bet_amount=100)
+        self.assertAlmostEqual(returns[8]["high"], 6 / 13 * 1.55)
+        self.assertAlmostEqual(returns[2]["high"], 12 / 13)
+        self.assertEqual(returns[14]["high"], 0)
+        for previous, by_bet in returns.items():
+            self.assertAlmostEqual(by_bet["equal"], 6 / 13)
+            self.assertLess(max(by_bet.values()), 1, msg=previous)
+
+    def test_high_card_rewards_truncated_like_the_game(self):
+        # 1.15 * 100 is 114.999... in floating point and the game pays 114 coins for it
+        rewards = analysis.high_card_rewards(bet_amount=100)
+        self.assertEqual(rewards["high"][4 - 2][10 - 2], 114)
+        self.assertEqual(rewards["high"][4 - 2][4 - 2], 0)
+
+
+class TestBellsReturn(TestCase):
+    def setUp(self):
+        for name, weight, value in (("cherry", 5, 2), ("bell", 3, 5), ("seven", 1, 20)):
+            Symbol.objects.create(name=name, image=f"{name}.png", weight=weight, value=value)
+
+    def test_exact_return_of_a_line(self):
+        report = analysis.exact_report()
+        self.assertAlmostEqual(report["bells"], (5**3 * 2 + 3**3 * 5 + 1**3 * 20) / 9**3)
+        self.assertEqual([symbol["probability"] for symbol in report["symbols"]], [5 / 9, 3 / 9, 1 / 9])
+
+    @skipIf(analysis.np is None, "NumPy is not installed")
+    def test_simulation_draws_from_the_alias_table(self):
+        result = analysis.simulate_bells(players=500, rounds=400, seed=3)
+        self.assertAlmostEqual(result["rtp"], analysis.exact_report()["bells"], delta=0.03)
+
+
+@skipIf(analysis.np is None, "NumPy is not installed")
+class TestSimulation(TestCase):
+    def test_roulette_simulation_matches_exact_return(self):
+        result = analysis.simulate_roulette(Roulette.CHOICES.RED, players=500, rounds=400, seed=7)
+        self.assertEqual(result["rounds"], 200_000)
+        self.assertAlmostEqual(result["rtp"], 36 / 37, delta=0.01)
+        self.assertAlmostEqual(result["variance"], 2 * 2 * 18 / 37 - (36 / 37) ** 2, delta=0.01)
+        ruined = [mark["ruined"] for mark in result["ruin"]]
+        self.assertEqual(ruined, sorted(ruined))
+        self.assertEqual(result["ruin"][-1]["round"], 400)
+
+    def test_high_card_simulation_matches_exact_return(self):
+        returns = analysis.high_card_expected_returns(bet_amount=10)
+        best = sum(max(by_bet.values()) for by_bet in returns.values()) / len(returns)
+        result = analysis.simulate_high_card(analysis.BEST_BET, players=500, rounds=400, seed=7)
+        self.assertAlmostEqual(result["rtp"], best, delta=0.01)
+
+    def test_nobody_ruined_with_a_bankroll_covering_every_round(self):
+        result = analysis.simulate_high_card("equal", players=50, rounds=100, bankroll=1000, seed=1)
+        self.assertEqual({mark["ruined"] for mark in result["ruin"]}, {0})
+
+    def test_chunks_add_up(self):
+        full = analysis.simulate_roulette(Roulette.CHOICES.GREEN, players=30, rounds=50)
+        with patch.object(analysis, "SIMULATION_CHUNK", 100):
+            chunked = analysis.simulate_roulette(Roulette.CHOICES.GREEN, players=30, rounds=50)
+        self.assertEqual((chunked["rounds"], len(chunked["ruin"])), (full["rounds"], len(full["ruin"])))
+
+
+class TestReturnToPlayerEndpoint(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_staff_only(self):
+        self.client.force_authenticate(user=UserFactory())
+        self.assertEqual(self.client.get("/api/casino/rtp/").status_code, 403)
+
+    def test_exact_report(self):
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.get("/api/casino/rtp/", {"bet_amount": 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("simulated", response.data)
+        self.assertAlmostEqual(response.data["exact"]["high_card"][8]["low"], 6 / 13 * 1.55)
+
+    @skipIf(analysis.np is None, "NumPy is not installed")
+    def test_simulated_report(self):
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.get("/api/casino/rtp/", {"simulate": "true", "players": 10, "rounds": 10, "seed": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["simulated"]["roulette"]["NUMBER"]["rounds"], 100)
+        self.assertEqual(set(response.data["simulated"]["high_card"]), {"low", "equal", "high", "best"})
+        self.assertEqual(self.client.get("/api/casino/rtp/", {"rounds": 100_000}).status_code, 400)
+
+
+class TestCasinoRtpCommand(TestCase):
+    def test_prints_exact_report(self):
+        out = StringIO()
+        call_command("casino_rtp", "--bet-amount", "100", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertAlmostEqual(report["exact"]["roulette"]["RED"], 36 / 37)
+        self.assertEqual((report["exact"]["bells"], report["exact"]["symbols"]), (None, []))
@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from socialapp.casino.models import (
+    AliasTable,
+    BlackJackHand,
+    CasinoStats,
+    Spin,
+    GAMES,
+    GameConflict,
+    HighCard,
+    Roulette,
+)
+from socialapp.users.models import User, CoinTransaction
+from socialapp.users.tests.factories import UserFactory
+
+
+class TestCasinoStats(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def test_spin_updates_stats(self):
+        Spin.objects.create(user=self.user, game=GAMES.ROULETTE, amount=10, has_won=True)
+        Spin.objects.create(user=self.user, game=GAMES.ROULETTE, amount=5)
+        Spin.objects.create(user=self.user, game=GAMES.HIGH_CARD, amount=7)
+        stats = CasinoStats.objects.get(user=self.user, game=GAMES.ROULETTE)
+        self.assertEqual((stats.wins, stats.loses, stats.coins_won, stats.coins_lost), (1, 1, 10, 5))
+        self.assertEqual(self.user.coins_lost_in_casino, 12)
+        self.assertEqual(self.user.casino_loses, 2)
+
+    def get_me(self):
+        self.client.force_authenticate(user=User.objects.get(id=self.user.id))
+        return self.client.get("/api/users/me/")
+
+    def test_profile_query_count_does_not_depend_on_spins(self):
+        Spin.objects.create(user=self.user, game=GAMES.ROULETTE, amount=10)
+        with CaptureQueriesContext(connection) as few_spins:
+            self.get_me()
+        for _ in range(20):
+            Spin.objects.create(user=self.user, game=GAMES.HIGH_CARD, amount=10, has_won=True)
+        with CaptureQueriesContext(connection) as many_spins:
+            response = self.get_me()
+        self.assertEqual(len(few_spins), len(many_spins))
+        self.assertEqual(response.data["casino_wins"], 20)
+        self.assertEqual(response.data["coins_won_in_casino"], 200)
+
+    def test_rebuild_casino_stats(self):
+        Spin.objects.create(user=self.user, game=GAMES.ROULETTE, amount=10, has_won=True)
+        Spin.objects.create(user=UserFactory(), game=GAMES.ROULETTE, amount=3)
+        CasinoStats.objects.update(wins=0, loses=0, coins_won=0, coins_lost=0)
+        call_command("rebuild_casino_stats", chunk_size=1, stdout=StringIO())
+        stats = CasinoStats.objects.get(user=self.user)
+        self.assertEqual((stats.wins, stats.coins_won), (1, 10))
+        self.assertEqual(CasinoStats.objects.count(), 2)
+
+
+class TestRoulettePayoutTable(APITestCase):
+    def test_table_covers_every_ball_and_bet(self):
+        self.assertEqual(len(Roulette.PAYOUT_TABLE), 37)
+        outside = [choice for choice in Roulette.CHOICES if choice != Roulette.CHOICES.NUMBER]
+        for row in Roulette.PAYOUT_TABLE:
+            self.assertEqual(set(row), {*outside, *range(37)})
+
+    def test_payouts(self):
+        table = Roulette.PAYOUT_TABLE
+        self.assertEqual(table[1][Roulette.CHOICES.RED], 2)
+        self.assertEqual(table[2][Roulette.CHOICES.RED], 0)
+        self.assertEqual(table[14][Roulette.CHOICES.SECOND_12], 3)
+        self.assertEqual(table[15][Roulette.CHOICES.ROW_3], 3)
+        self.assertEqual(table[17][17], 36)
+        self.assertEqual(table[0][Roulette.CHOICES.GREEN], 36)
+        # every number wins exactly 18 even-money bets, 2 dozen/column bets and its straight up bet
+        for ball in range(1, 37):
+            self.assertEqual(sorted(value for value in table[ball].values() if value), [2] * 3 + [3] * 2 + [36])
+
+    def test_outside_bets_lose_on_zero(self):
+        self.assertEqual([bet for bet, value in Roulette.PAYOUT_TABLE[0].items() if value], [Roulette.CHOICES.GREEN, 0])
+
+    def test_play_many_settles_one_spin(self):
+        user = UserFactory()
+        bets = [(Roulette.CHOICES.RED, None, 10), (Roulette.CHOICES.NUMBER, 3, 5), (Roulette.CHOICES.BLACK, None, 20)]
+        with patch("socialapp.casino.models.random.randint", return_value=3):
+            result = Roulette().play_many(user, bets)
+        self.assertEqual(result["amount"], 20 + 180)
+        self.assertEqual([bet["has_won"] for bet in result["bets"]], [True, True, False])
+        user.refresh_from_db()
+        self.assertEqual(user.coins, 500 - 35 + 200)
+        spin = Spin.objects.get(user=user)
+        self.assertEqual((spin.has_won, spin.amount), (True, 165))
+        self.assertEqual(CoinTransaction.objects.get(user=user).amount, 165)
+
+    def test_play_many_breaking_even_stores_no_spin(self):
+        user = UserFactory()
+        bets = [(Roulette.CHOICES.RED, None, 10), (Roulette.CHOICES.BLACK, None, 10)]
+        with patch("socialapp.casino.models.random.randint", return_value=3):
+            result = Roulette().play_many(user, bets)
+        self.assertEqual((result["has_won"], result["amount"]), (False, 20))
+        user.refresh_from_db()
+        self.assertEqual(user.coins, 500)
+        self.assertFalse(Spin.objects.exists())
+        self.assertFalse(CasinoStats.objects.exists())
+
+
+class TestHighCardCards(APITestCase):
+    def test_lookup_tables(self):
+        self.assertEqual(HighCard.DECK_SIZE, 52)
+        self.assertEqual((HighCard.CARD_RANKS[0], HighCard.CARD_SUITS[0], HighCard.CARD_VALUES[0]), ("2", "clubs", 2))
+        self.assertEqual(
+            (HighCard.CARD_RANKS[47], HighCard.CARD_SUITS[47], HighCard.CARD_VALUES[47]), ("K", "spades", 13)
+        )
+        self.assertEqual(HighCard.CARD_VALUES[51], 14)
+        self.assertEqual(HighCard.MULTIPLIERS[8], (1.55, 6, 1.55))
+        self.assertEqual(HighCard.MULTIPLIERS[10], (1.35, 6, 1.75))
+
+    def test_play_does_not_touch_shared_state(self):
+        game = HighCard.objects.create(user=UserFactory(), last_card=0)
+        with patch("socialapp.casino.models.random.randrange", return_value=50):
+            result = game.play(bet_amount=10, bet="high")
+        self.assertEqual(result, {"bet_amount": 10, "card": 50, "previous_card": 0, "bet": "high", "version": 1})
+        game.refresh_from_db()
+        self.assertEqual(game.last_card, 50)
+
+
+class TestAliasTable(APITestCase):
+    def test_columns_add_up_to_the_weights(self):
+        weights = [5, 0, 3, 1, 7]
+        table = AliasTable(weights)
+        chances = [0.0] * len(weights)
+        for column, probability in enumerate(table.probability):
+            chances[column] += probability / len(weights)
+            chances[table.alias[column]] += (1 - probability) / len(weights)
+        for chance, weight in zip(chances, weights):
+            self.assertAlmostEqual(chance, weight / sum(weights))
+
+    def test_draw(self):
+        table = AliasTable([0, 1, 0])
+        self.assertEqual({table.draw() for _ in range(50)}, {1})
+
+
+class TestBlackJackTables(APITestCase):
+    def total(self, *ranks):
+        state = 0
+        for rank in ranks:
+            state = BlackJackHand.NEXT_STATE[state][HighCard.RANKS.index(rank) * len(HighCard.SUITS)]
+        return BlackJackHand.HAND_TOTALS[state]
+
+    def test_hand_totals(self):
+        self.assertEqual(self.total("A", "K"), 21)
+        self.assertEqual(self.total("A", "6"), 17)
+        self.assertEqual(self.total("A", "6", "10"), 17)
+        self.assertEqual(self.total("A", "A", "9"), 21)
+        self.assertEqual(self.total("K", "Q", "5"), 25)
+        self.assertEqual(self.total("J", "Q", "K"), 30)
+
+
+class TestConcurrentSpins(TransactionTestCase):
+    SPINS = 20
+
+    def spin(self, user_id):
+        try:
+            Roulette().play(
+                user=User.objects.get(id=user_id), bet=Roulette.CHOICES.RED, bet_amount=10, user_number=None
+            )
+        finally:
+            connection.close()
+
+    def test_parallel_spins_end_with_exact_balance(self):
+        user = UserFactory()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(self.spin, [user.id] * self.SPINS))
+        user.refresh_from_db()
+        spins = Spin.objects.filter(user=user)
+        won = sum(spin.amount for spin in spins if spin.has_won)
+        lost = sum(spin.amount for spin in spins if not spin.has_won)
+        self.assertEqual(spins.count(), self.SPINS)
+        self.assertEqual(user.coins, 500 + won - lost)
+        self.assertEqual(
+            user.coins, 500 + sum(CoinTransaction.objects.filter(user=user).values_list("amount", flat=True))
+        )
+
+
+class TestConcurrentHighCardPlays(TransactionTestCase):
+    PLAYS = 8
+
+    def play(self, game):
+        try:
+            game.play(bet_amount=0, bet="high")
+            return True
+        except GameConflict:
+            return False
+        finally:
+            connection.close()
+
+    def test_only_one_play_settles_against_the_same_version(self):
+        game = HighCard.objects.create(user=UserFactory())
+        copies = [HighCard.objects.get(id=game.id) for _ in range(self.PLAYS)]
+        with ThreadPoolExecutor(max_workers=self.PLAYS) as executor:
+            settled = list(executor.map(self.play, copies))
+        self.assertEqual(settled.count(True), 1)
+        game.refresh_from_db()
+        self.assertEqual(game.version, 1)
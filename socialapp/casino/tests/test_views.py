@@ -0,0 +1,343 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+
+from socialapp.casino.models import AliasTable, Bells, BlackJackHand, CasinoStats, HighCard, Spin, Symbol
+from socialapp.casino.serializers import RouletteBetsSerializer
+from socialapp.users.tests.factories import UserFactory
+
+
+class TestRouletteBets(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def bet(self, bets, ball=0):
+        with patch("socialapp.casino.models.random.randint", return_value=ball):
+            return self.client.post("/api/casino/roulette/bets/", data={"bets": bets}, format="json")
+
+    def test_bets_settled_against_one_ball(self):
+        response = self.bet(
+            [
+                {"bet": "GREEN", "bet_amount": 10},
+                {"bet": "NUMBER", "number": 0, "bet_amount": 1},
+                {"bet": "EVEN", "bet_amount": 5},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data["rolled_number"], response.data["color"], response.data["amount"]), (0, "GREEN", 396)
+        )
+        self.assertEqual([bet["amount"] for bet in response.data["bets"]], [360, 36, 0])
+        self.assertEqual(Spin.objects.filter(user=self.user).count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500 - 16 + 396)
+
+    def test_bets_validation(self):
+        for bets in (
+            [],
+            [{"bet": "RED", "number": 3, "bet_amount": 10}],
+            [{"bet": "NUMBER", "bet_amount": 10}],
+            [{"bet": "NUMBER", "number": 37, "bet_amount": 10}],
+            [{"bet": "RED", "bet_amount": 300}, {"bet": "BLACK", "bet_amount": 201}],
+            [{"bet": "RED", "bet_amount": 1}] * (RouletteBetsSerializer.MAX_BETS + 1),
+        ):
+            self.assertEqual(self.bet(bets).status_code, 400, bets)
+        self.assertFalse(Spin.objects.exists())
+
+    def test_single_bet_still_supported(self):
+        with patch("socialapp.casino.models.random.randint", return_value=1):
+            response = self.client.post("/api/casino/roulette/", data={"bet": "RED", "bet_amount": 10}, format="json")
+        self.assertEqual((response.data["has_won"], response.data["amount"], response.data["color"]), (True, 20, "RED"))
+
+
+class TestHighCard(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def play(self, card, bet="high", bet_amount=10, **data):
+        with patch("socialapp.casino.models.random.randrange", return_value=card):
+            return self.client.post("/api/casino/high_card/", data={"bet": bet, "bet_amount": bet_amount, **data})
+
+    def test_first_card_is_a_demo_play(self):
+        response = self.play(24)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["demo_play"])
+        self.assertEqual((response.data["card_value"], response.data["card_suit"]), ("8", "clubs"))
+        self.assertEqual(response.data["multipliers"], [1.55, 6, 1.55])
+        self.assertNotIn("previous_card_value", response.data)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500)
+
+    def test_bet_settled_against_previous_card(self):
+        self.play(24)
+        response = self.play(47)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data["previous_card_value"], response.data["next_card_value"], response.data["card_suit"]),
+            ("8", "K", "spades"),
+        )
+        self.assertEqual((response.data["has_won"], response.data["reward"]), (True, 15))
+        response = self.play(0, bet="equal")
+        self.assertEqual((response.data["has_won"], response.data["reward"]), (False, 0))
+        self.assertEqual(HighCard.objects.get(user=self.user).last_card, 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500 - 10 + 15 - 10)
+
+    def test_spins_store_the_net_result(self):
+        self.play(24)
+        self.play(47)
+        spin = Spin.objects.get(user=self.user)
+        self.assertEqual((spin.amount, spin.has_won), (5, True))
+        self.play(24)
+        # 1.55 times one coin is truncated to the coin staked
+        response = self.play(47, bet_amount=1)
+        self.assertEqual((response.data["has_won"], response.data["reward"]), (True, 1))
+        self.assertEqual(Spin.objects.count(), 2)
+        self.assertEqual(CasinoStats.objects.get(user=self.user).wins, 1)
+
+    def test_play_against_an_old_version_is_rejected(self):
+        self.assertEqual(self.play(24).data["version"], 1)
+        self.assertEqual(self.play(47, version=1).data["version"], 2)
+        response = self.play(0, version=1)
+        self.assertEqual(response.status_code, 409)
+        game = HighCard.objects.get(user=self.user)
+        self.assertEqual((game.last_card, game.version), (47, 2))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500 - 10 + 15)
+
+    def test_game_is_not_read_once_cached(self):
+        self.play(24)
+        with CaptureQueriesContext(connection) as queries:
+            self.play(47)
+        game_queries = [query["sql"] for query in queries if "casino_highcard" in query["sql"]]
+        self.assertEqual(len(game_queries), 1)
+        self.assertTrue(game_queries[0].startswith("UPDATE"))
+
+    def test_stale_cache_falls_back_to_the_database(self):
+        self.play(24)
+        HighCard.objects.filter(user=self.user).update(last_card=4, version=F("version") + 1)
+        response = self.play(47)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["previous_card_value"], response.data["version"]), ("3", 3))
+
+
+class TestBells(APITestCase):
+    def setUp(self):
+        cache.clear()
+        Bells._reels = None
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.symbols = [
+            Symbol.objects.create(name=name, image=f"{name}.png", weight=weight, value=value)
+            for name, weight, value in (("cherry", 5, 2), ("bell", 3, 5), ("seven", 1, 20))
+        ]
+
+    def spin(self, cells, lines_chosen=5, bet_amount=10):
+        with patch.object(AliasTable, "draw", side_effect=cells):
+            return self.client.post("/api/casino/bells/", data={"bet_amount": bet_amount, "lines_chosen": lines_chosen})
+
+    def test_winning_lines_pay_symbol_value(self):
+        # cells go reel by reel, only the rising diagonal shows one symbol
+        response = self.spin([0, 1, 2, 1, 2, 0, 2, 0, 1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["winning_lines"], [4])
+        self.assertEqual((response.data["won"], response.data["amount"]), (True, 200))
+        self.assertEqual([symbol["name"] for symbol in response.data["result"][0]], ["cherry", "bell", "seven"])
+        spin = Spin.objects.get(user=self.user)
+        self.assertEqual((spin.game, spin.chosen_lines, spin.amount, spin.has_won), ("Bells", 5, 150, True))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500 - 50 + 200)
+
+    def test_only_chosen_lines_are_played(self):
+        response = self.spin([0, 1, 2, 1, 2, 0, 2, 0, 1], lines_chosen=3)
+        self.assertEqual((response.data["winning_lines"], response.data["amount"]), ([], 0))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500 - 30)
+
+    def test_spin_reads_no_symbols_once_reels_are_built(self):
+        self.spin([0] * 9)
+        with CaptureQueriesContext(connection) as queries:
+            self.spin([0] * 9)
+        self.assertFalse([query for query in queries if "casino_symbol" in query["sql"]])
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("INSERT")]), 2)
+
+    def test_reels_kept_until_the_check_interval_passes(self):
+        Bells.reels()
+        self.symbols[0].delete()
+        _, symbols = Bells.reels()
+        self.assertEqual([symbol.name for symbol in symbols], ["cherry", "bell", "seven"])
+
+    @patch.object(Bells, "REELS_CHECK_INTERVAL", 0)
+    def test_reels_only_read_the_version_when_unchanged(self):
+        Bells.reels()
+        with CaptureQueriesContext(connection) as queries:
+            Bells.reels()
+        self.assertEqual(len([query for query in queries if "casino_symbol" in query["sql"]]), 1)
+
+    @patch.object(Bells, "REELS_CHECK_INTERVAL", 0)
+    def test_reels_rebuilt_when_a_symbol_changes(self):
+        _, symbols = Bells.reels()
+        self.assertEqual([symbol.name for symbol in symbols], ["cherry", "bell", "seven"])
+        self.symbols[2].weight = 0
+        self.symbols[2].save()
+        _, symbols = Bells.reels()
+        self.assertEqual([symbol.name for symbol in symbols], ["cherry", "bell"])
+
+    @patch.object(Bells, "REELS_CHECK_INTERVAL", 0)
+    def test_reels_rebuilt_when_a_symbol_is_deleted(self):
+        Bells.reels()
+        self.symbols[0].delete()
+        _, symbols = Bells.reels()
+        self.assertEqual([symbol.name for symbol in symbols], ["bell", "seven"])
+
+    def test_breaking_even_stores_no_spin(self):
+        # a line of cherries pays 2x on one of the two lines played
+        response = self.spin([0, 1, 2, 0, 2, 1, 0, 1, 2], lines_chosen=2)
+        self.assertEqual((response.data["winning_lines"], response.data["amount"]), ([1], 20))
+        self.assertFalse(Spin.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500)
+
+    def test_validation(self):
+        self.assertEqual(self.spin([], lines_chosen=6).status_code, 400)
+        self.assertEqual(self.spin([], bet_amount=0).status_code, 400)
+        self.assertEqual(self.spin([], bet_amount=101).status_code, 400)
+        Symbol.objects.all().delete()
+        self.assertEqual(self.spin([]).status_code, 400)
+        self.assertFalse(Spin.objects.exists())
+
+
+def card(rank, suit=0):
+    return HighCard.RANKS.index(rank) * len(HighCard.SUITS) + suit
+
+
+class TestBlackJack(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def deal(self, *ranks, bet_amount=10):
+        """Deals from a shoe starting with ``ranks``: player, dealer, player, dealer, then every next draw"""
+
+        def shuffle(cards):
+            cards[: len(ranks)] = [card(rank) for rank in ranks]
+
+        with patch("socialapp.casino.models.random.shuffle", side_effect=shuffle):
+            return self.act("deal", bet_amount=bet_amount)
+
+    def act(self, action, **data):
+        return self.client.post("/api/casino/blackjack/", data={"action": action, **data})
+
+    def coins(self):
+        self.user.refresh_from_db()
+        return self.user.coins
+
+    def test_deal_hides_the_hole_card(self):
+        response = self.deal("10", "K", "9", "7")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["dealer"], [{"card_value": "K", "card_suit": "clubs"}])
+        self.assertIsNone(response.data["dealer_total"])
+        self.assertEqual(response.data["hands"][0]["total"], 19)
+        self.assertEqual(response.data["actions"], ["hit", "stand", "double"])
+        self.assertEqual(self.coins(), 490)
+        self.assertFalse(Spin.objects.exists())
+
+    def test_stand_and_win(self):
+        self.deal("10", "K", "9", "7")
+        response = self.act("stand")
+        self.assertEqual(
+            (response.data["finished"], response.data["payout"], response.data["dealer_total"]), (True, 20, 17)
+        )
+        self.assertEqual(len(response.data["dealer"]), 2)
+        self.assertEqual(self.coins(), 510)
+        spin = Spin.objects.get(user=self.user)
+        self.assertEqual((spin.game, spin.amount, spin.has_won), ("BlackJack", 10, True))
+
+    def test_natural_pays_three_to_two_at_once(self):
+        response = self.deal("A", "9", "K", "7")
+        self.assertEqual((response.data["finished"], response.data["payout"]), (True, 25))
+        self.assertEqual(len(response.data["dealer"]), 2)
+        self.assertEqual(self.coins(), 515)
+
+    def test_hit_and_bust(self):
+        self.deal("10", "K", "6", "7", "Q")
+        response = self.act("hit")
+        self.assertEqual((response.data["hands"][0]["total"], response.data["finished"]), (26, True))
+        self.assertEqual((response.data["payout"], response.data["dealer_total"]), (0, 17))
+        self.assertEqual(self.coins(), 490)
+
+    def test_double(self):
+        self.deal("5", "10", "6", "6", "10", "9")
+        response = self.act("double")
+        hand = response.data["hands"][0]
+        self.assertEqual((len(hand["cards"]), hand["total"], hand["bet_amount"]), (3, 21, 20))
+        self.assertEqual((response.data["dealer_total"], response.data["payout"]), (25, 40))
+        self.assertEqual(self.coins(), 520)
+
+    def test_split(self):
+        self.deal("8", "10", "8", "7", "3", "10")
+        response = self.act("split")
+        self.assertEqual([hand["total"] for hand in response.data["hands"]], [11, 18])
+        self.assertEqual((response.data["active_hand"], response.data["actions"]), (0, ["hit", "stand", "double"]))
+        self.assertEqual(self.coins(), 480)
+        self.act("stand")
+        response = self.act("stand")
+        self.assertEqual((response.data["finished"], response.data["payout"]), (True, 20))
+        self.assertEqual(self.coins(), 500)
+        self.assertFalse(Spin.objects.exists())
+
+    def test_natural_push(self):
+        response = self.deal("A", "A", "K", "K")
+        self.assertEqual((response.data["finished"], response.data["payout"]), (True, 10))
+        self.assertEqual(self.coins(), 500)
+        self.assertFalse(Spin.objects.exists())
+
+    def test_actions_not_allowed(self):
+        self.assertEqual(self.act("hit").status_code, 400)
+        self.assertEqual(self.act("deal").status_code, 400)
+        self.deal("10", "K", "9", "7")
+        self.assertEqual(self.act("split").status_code, 400)
+        self.assertEqual(self.deal("10", "K", "9", "7").status_code, 400)
+        self.assertEqual(self.act("hit", version=0).status_code, 409)
+        self.assertEqual(self.act("stand", version=1).status_code, 200)
+
+    def test_double_needs_the_coins(self):
+        self.deal("5", "10", "6", "6", bet_amount=300)
+        response = self.act("double")
+        self.assertEqual(response.status_code, 400)
+        hand = BlackJackHand.objects.get(user=self.user)
+        self.assertEqual((len(hand.hand), hand.bet_amount, hand.version), (2, 300, 1))
+        self.assertEqual(self.coins(), 200)
+
+    def test_every_action_is_one_read_and_one_write(self):
+        self.deal("2", "10", "2", "7", "2", "2", "2")
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as queries:
+                self.act("hit")
+            hand_queries = [query["sql"].split()[0] for query in queries if "casino_blackjackhand" in query["sql"]]
+            self.assertEqual(hand_queries, ["SELECT", "UPDATE"])
+
+    def test_shoe_is_kept_between_rounds(self):
+        self.deal("10", "K", "9", "7")
+        self.act("stand")
+        with patch("socialapp.casino.models.random.shuffle") as shuffle:
+            response = self.act("deal", bet_amount=10)
+        self.assertEqual(response.status_code, 200)
+        shuffle.assert_not_called()
+        self.assertEqual(BlackJackHand.objects.get(user=self.user).position, 8)
+
+    def test_current_hand(self):
+        self.assertEqual(self.client.get("/api/casino/blackjack/").data["actions"], ["deal"])
+        self.deal("10", "K", "9", "7")
+        self.assertEqual(self.client.get("/api/casino/blackjack/").data["hands"][0]["total"], 19)
@@ -1,20 +1,28 @@
-import itertools
-
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from socialapp.casino.models import HighCard, Roulette
+from socialapp.casino import analysis
+from socialapp.casino.models import BlackJack, BlackJackHand, Bells, HighCard, Roulette
 from socialapp.casino.serializers import (
+    BlackJackActionSerializer,
+    BlackJackHandSerializer,
     GameSerializer,
+    GameSpinSerializer,
     HighCardResultSerializer,
     HighCardPlaySerializer,
     RouletteSerializer,
     RouletteResultSerializer,
+    RouletteBetsSerializer,
+    RouletteBetsResultSerializer,
+    ReturnToPlayerQuerySerializer,
+    SpinResultSerializer,
 )
+from socialapp.utils import DetailException
 
 
 @extend_schema(tags=["casino WORK IN PROGRESS"])
@@ -31,11 +39,13 @@ class CardGameViewSet(GenericViewSet):
 @extend_schema(tags=["casino"])
 class CasinoViewSet(GenericViewSet):
     permission_classes = [IsAuthenticated]
-    serializer_classes = {"roulette": RouletteSerializer, "high_card": HighCardPlaySerializer}
-
-    CARD_VALUES = [2, 3, 4, 5, 6, 7, 8, 9, 10, "J", "Q", "K", "A"]
-    CARD_SUITS = ["clubs", "hearts", "diamonds", "spades"]
-    DECK = [f"{x}of{y}" for x, y in itertools.product(CARD_VALUES, CARD_SUITS)]
+    serializer_classes = {
+        "roulette": RouletteSerializer,
+        "roulette_bets": RouletteBetsSerializer,
+        "high_card": HighCardPlaySerializer,
+        "bells": GameSpinSerializer,
+        "blackjack": BlackJackActionSerializer,
+    }
 
     def get_serializer_class(self):
         return self.serializer_classes.get(self.action, GameSerializer)
@@ -60,6 +70,19 @@ class CasinoViewSet(GenericViewSet):
         serializer = RouletteResultSerializer(result)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        request=RouletteBetsSerializer,
+        responses={200: RouletteBetsResultSerializer},
+        summary="""Place several bets settled by the same roll of the ball""",
+    )
+    @action(methods=["post"], detail=False, url_path="roulette/bets")
+    def roulette_bets(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bets = [(bet["bet"], bet.get("number"), bet["bet_amount"]) for bet in serializer.validated_data["bets"]]
+        result = Roulette().play_many(user=request.user, bets=bets)
+        return Response(RouletteBetsResultSerializer(result).data, status=status.HTTP_200_OK)
+
     @extend_schema(
         request=HighCardPlaySerializer,
         responses={200: HighCardResultSerializer},
@@ -69,10 +92,63 @@ class CasinoViewSet(GenericViewSet):
     def high_card(self, request, *args, **kwargs):
         serializer = HighCardPlaySerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        game_object, _ = HighCard.objects.get_or_create(user=request.user)
-        bet_amount = serializer.validated_data["bet_amount"]
-        bet = serializer.validated_data["bet"]
-        data = game_object.play(deck=self.DECK, bet_amount=bet_amount, bet=bet)
+        game_object, data = HighCard.play_for(request.user, **serializer.validated_data)
         serializer = HighCardResultSerializer(data=data, context={"user": request.user, "game_object": game_object})
         serializer.is_valid(raise_exception=True)
+        game_object.remember()
         return Response(serializer.data)
+
+    @extend_schema(
+        request=GameSpinSerializer,
+        responses={200: SpinResultSerializer},
+        summary="""Spin the Bells slot machine on the first lines_chosen paylines""",
+    )
+    @action(methods=["post"], detail=False)
+    def bells(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = Bells.play(
+            user=request.user,
+            chosen_lines=serializer.validated_data["lines_chosen"],
+            bet_amount=serializer.validated_data["bet_amount"],
+        )
+        return Response(SpinResultSerializer(result, context={"request": request}).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        methods=["get"],
+        request=None,
+        responses={200: BlackJackHandSerializer},
+        summary="""Your current blackjack hand""",
+    )
+    @extend_schema(
+        methods=["post"],
+        request=BlackJackActionSerializer,
+        responses={200: BlackJackHandSerializer},
+        summary="""Deal a new blackjack hand with a bet, or hit, stand, double or split the one you play""",
+    )
+    @action(methods=["get", "post"], detail=False)
+    def blackjack(self, request, *args, **kwargs):
+        if request.method == "GET":
+            hand = BlackJackHand.objects.filter(user=request.user).first() or BlackJackHand(user=request.user)
+            return Response(BlackJackHandSerializer(hand).data, status=status.HTTP_200_OK)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        hand = BlackJack.play(user=request.user, **serializer.validated_data)
+        return Response(BlackJackHandSerializer(hand).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[ReturnToPlayerQuerySerializer],
+        responses={200: OpenApiTypes.OBJECT},
+        summary="""Staff only, exact expected return of every bet and optionally Monte Carlo RTP and ruin curves""",
+    )
+    @action(methods=["get"], detail=False, url_path="rtp", permission_classes=[IsAdminUser])
+    def return_to_player(self, request, *args, **kwargs):
+        query = ReturnToPlayerQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        options = query.validated_data
+        report = {"exact": analysis.exact_report(options["bet_amount"])}
+        if options.pop("simulate"):
+            if analysis.np is None:
+                raise DetailException("NumPy is not installed, only the exact returns are available")
+            report["simulated"] = analysis.simulation_report(**options)
+        return Response(report, status=status.HTTP_200_OK)
@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.db import transaction
 
-from socialapp.meetings.models import Meeting, Attendance, Place
+from socialapp.meetings.models import Meeting, Attendance, Place, AttendanceStats
 
 
 class AttendanceInline(admin.TabularInline):
@@ -9,14 +12,22 @@ class AttendanceInline(admin.TabularInline):
 
 @admin.register(Meeting)
 class MeetingAdmin(admin.ModelAdmin):
-    list_display = ("__str__", "date", "confirmed_by_majority")
-    list_filter = ("confirmed_by_majority", "date")
+    list_display = ("__str__", "date", "confirmed_by_majority", "archived")
+    list_filter = ("confirmed_by_majority", "archived", "date")
     inlines = [AttendanceInline]
     actions = ["confirm"]
 
+    @admin.action(description="Confirm selected meetings and pay their rewards")
     def confirm(self, request, queryset):
-        queryset.update(confirmed_by_majority=True)
-        return
+        attendees = defaultdict(list)
+        meetings = queryset.filter(confirmed_by_majority=False)
+        for meeting_id, user_id in Attendance.objects.filter(meeting__in=meetings).values_list("meeting_id", "user_id"):
+            attendees[meeting_id].append(user_id)
+        paid = 0
+        with transaction.atomic():
+            for meeting in meetings.select_for_update():
+                paid += meeting.pay_out(attendees[meeting.id])
+        self.message_user(request, f"Confirmed {paid} meetings")
 
 
 @admin.register(Attendance)
@@ -27,4 +38,12 @@ class AttendanceAdmin(admin.ModelAdmin):
 
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
-    list_display = ("name",)
+    list_display = ("name", "usage_count")
+    search_fields = ("name", "normalized_name")
+    ordering = ("-usage_count",)
+
+
+@admin.register(AttendanceStats)
+class AttendanceStatsAdmin(admin.ModelAdmin):
+    list_display = ("user", "attended", "confirmed", "pizza_nights", "casino_nights", "streak", "last_week")
+    list_select_related = ("user",)
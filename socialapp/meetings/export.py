@@ -0,0 +1,75 @@
+"""
+Generators turning a meeting queryset into CSV rows or iCalendar lines, one meeting at a time,
+so the export of years of history is streamed instead of built in memory.
+The queryset is expected to come from MeetingViewSet.annotate_for_list.
+"""
+import csv
+from datetime import timedelta
+from typing import Iterable, Iterator
+
+from django.utils import timezone
+
+CSV_HEADER = ["date", "place", "description", "pizza", "casino", "confirmed_by_majority", "users", "confirmed_by_you"]
+
+
+class Echo:
+    """File-like object handing every written line back to csv.writer instead of storing it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_rows(meetings: Iterable) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for meeting in meetings:
+        yield writer.writerow(
+            [
+                meeting.date.isoformat(),
+                meeting.place.name if meeting.place else "",
+                meeting.description,
+                meeting.pizza,
+                meeting.casino,
+                meeting.confirmed_by_majority,
+                meeting.attendees_count,
+                meeting.confirmed_by_you,
+            ]
+        )
+
+
+def ical_lines(meetings: Iterable, domain: str) -> Iterator[str]:
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%SZ")
+    yield from _lines(["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//socialapp//meetings//EN", "CALSCALE:GREGORIAN"])
+    for meeting in meetings:
+        place = meeting.place.name if meeting.place else ""
+        summary = f"Meeting at {place}" if place else "Meeting"
+        yield from _lines(
+            [
+                "BEGIN:VEVENT",
+                f"UID:meeting-{meeting.id}@{domain}",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;VALUE=DATE:{meeting.date:%Y%m%d}",
+                f"DTEND;VALUE=DATE:{meeting.date + timedelta(days=1):%Y%m%d}",
+                f"SUMMARY:{_escape(summary)}",
+                f"LOCATION:{_escape(place)}",
+                f"DESCRIPTION:{_escape(meeting.description)}",
+                f"STATUS:{'CONFIRMED' if meeting.confirmed_by_majority else 'TENTATIVE'}",
+                "END:VEVENT",
+            ]
+        )
+    yield from _lines(["END:VCALENDAR"])
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _lines(lines: list[str]) -> Iterator[str]:
+    """Content lines folded at 75 characters as RFC 5545 asks, continuation lines start with a space"""
+    for line in lines:
+        while len(line) > 75:
+            yield line[:75] + "\r\n"
+            line = " " + line[75:]
+        yield line + "\r\n"
@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from socialapp.meetings.models import AttendanceStats, Meeting, Place, PlaceVisit
+
+
+class Command(BaseCommand):
+    help = "Collapse places with the same normalised name into one, repoint their meetings and recount usage"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Merge these places into the first one instead")
+
+    def handle(self, *args, ids, **options):
+        if len(ids) == 1:
+            raise CommandError("Give at least two places to merge")
+        if ids and Place.objects.filter(id__in=ids).count() != len(set(ids)):
+            raise CommandError("Some of the places don't exist")
+        with transaction.atomic():
+            groups = [ids] if ids else self.duplicate_groups()
+            targets = {duplicate: group[0] for group in groups for duplicate in group[1:] if duplicate != group[0]}
+            if targets:
+                Meeting.objects.filter(place_id__in=targets).update(
+                    place_id=Case(*(When(place_id=old, then=Value(new)) for old, new in targets.items()))
+                )
+                visitors = self.fold_visits(targets)
+                Place.objects.filter(id__in=targets).delete()
+                AttendanceStats.refresh_favourite_places(visitors)
+            renamed = self.renormalize()
+            self.recount_usage()
+        self.stdout.write(self.style.SUCCESS(f"Merged {len(targets)} places, renormalised {renamed}"))
+
+    @staticmethod
+    def duplicate_groups() -> list[list[int]]:
+        """Places sharing a normalised name, the most used one of each group goes first and is kept"""
+        groups = defaultdict(list)
+        for place_id, name in Place.objects.order_by("-usage_count", "id").values_list("id", "name"):
+            groups[Place.normalize(name)].append(place_id)
+        return [group for group in groups.values() if len(group) > 1]
+
+    @staticmethod
+    def fold_visits(targets: dict[int, int]) -> list[int]:
+        """
+        Adds the PlaceVisit counts of the duplicates to their kept places before deleting the duplicates
+        cascades to the visits, returns the users whose favourite places have to be refreshed
+        """
+        moved = defaultdict(int)
+        visits = PlaceVisit.objects.filter(place_id__in=targets).values_list("user_id", "place_id", "count")
+        for user_id, place_id, count in visits:
+            moved[user_id, targets[place_id]] += count
+        if not moved:
+            return []
+        user_ids = list({user_id for user_id, _ in moved})
+        PlaceVisit.objects.bulk_create(
+            [PlaceVisit(user_id=user_id, place_id=place_id) for user_id, place_id in moved], ignore_conflicts=True
+        )
+        kept = PlaceVisit.objects.filter(place_id__in=set(targets.values()), user_id__in=user_ids)
+        folded = [visit for visit in kept if (visit.user_id, visit.place_id) in moved]
+        for visit in folded:
+            visit.count += moved[visit.user_id, visit.place_id]
+        PlaceVisit.objects.bulk_update(folded, ["count"])
+        return user_ids
+
+    @staticmethod
+    def renormalize() -> int:
+        """Stored keys written by older normalisation rules are brought up to date"""
+        stale = [
+            Place(id=place_id, normalized_name=Place.normalize(name))
+            for place_id, name, normalized_name in Place.objects.values_list("id", "name", "normalized_name")
+            if Place.normalize(name) != normalized_name
+        ]
+        Place.objects.bulk_update(stale, ["normalized_name"])
+        return len(stale)
+
+    @staticmethod
+    def recount_usage() -> None:
+        meetings = Meeting.objects.filter(place=OuterRef("pk")).order_by().values("place").annotate(count=Count("id"))
+        Place.objects.update(
+            usage_count=Coalesce(Subquery(meetings.values("count"), output_field=IntegerField()), Value(0))
+        )
@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from socialapp.meetings.models import Attendance, AttendanceStats, Place, PlaceVisit, week_of
+from socialapp.users.models import User
+from socialapp.utils import id_chunks
+
+
+class Command(BaseCommand):
+    help = "Rebuild AttendanceStats and PlaceVisit from the Attendance history, chunk by chunk of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of users rebuilt in one transaction")
+
+    def handle(self, *args, chunk_size, **options):
+        rebuilt = sum(self.rebuild_chunk(user_ids) for user_ids in id_chunks(User.objects.all(), chunk_size))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt attendance stats of {rebuilt} users"))
+
+    @staticmethod
+    def rebuild_chunk(user_ids: list[int]) -> int:
+        stats = {}
+        weeks = defaultdict(set)
+        attendances = (
+            Attendance.objects.filter(user_id__in=user_ids)
+            .values_list("user_id", "drinking", "confirmed", "meeting__date", "meeting__pizza", "meeting__casino")
+            .order_by()
+        )
+        for user_id, drinking, confirmed, day, pizza, casino in attendances.iterator():
+            row = stats.setdefault(user_id, AttendanceStats(user_id=user_id))
+            row.attended += 1
+            row.confirmed += confirmed
+            row.drinking += drinking
+            row.pizza_nights += pizza
+            row.casino_nights += casino
+            weeks[user_id].add(week_of(day))
+        for user_id, row in stats.items():
+            for week in sorted(weeks[user_id]):
+                consecutive = row.last_week is not None and (week - row.last_week).days == 7
+                row.streak = row.streak + 1 if consecutive else 1
+                row.last_week = week
+
+        visits = list(
+            Attendance.objects.filter(user_id__in=user_ids, meeting__place__isnull=False)
+            .values_list("user_id", "meeting__place_id")
+            .annotate(count=Count("id"))
+            .order_by("user_id", "-count", "meeting__place_id")
+        )
+        names = dict(Place.objects.filter(id__in={place_id for _, place_id, _ in visits}).values_list("id", "name"))
+        for user_id, place_id, count in visits:
+            favourites = stats[user_id].favourite_places
+            if len(favourites) < AttendanceStats.FAVOURITE_PLACES:
+                favourites.append({"id": place_id, "name": names[place_id], "count": count})
+
+        with transaction.atomic():
+            AttendanceStats.objects.filter(user_id__in=user_ids).delete()
+            PlaceVisit.objects.filter(user_id__in=user_ids).delete()
+            AttendanceStats.objects.bulk_create(stats.values())
+            PlaceVisit.objects.bulk_create(
+                PlaceVisit(user_id=user_id, place_id=place_id, count=count) for user_id, place_id, count in visits
+            )
+        return len(stats)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from socialapp.meetings.models import Attendance, Companionship
+from socialapp.users.models import User
+from socialapp.utils import id_chunks
+
+
+class Command(BaseCommand):
+    help = "Rebuild Companionship pair counts from the Attendance history, chunk by chunk of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of users rebuilt in one transaction")
+
+    def handle(self, *args, chunk_size, **options):
+        rebuilt = sum(self.rebuild_chunk(user_ids) for user_ids in id_chunks(User.objects.all(), chunk_size))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} companionship rows"))
+
+    @staticmethod
+    def rebuild_chunk(user_ids: list[int]) -> int:
+        pairs = (
+            Attendance.objects.filter(user_id__in=user_ids)
+            .annotate(companion_id=F("meeting__attendance__user_id"))
+            .exclude(companion_id=F("user_id"))
+            .values("user_id", "companion_id")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        with transaction.atomic():
+            Companionship.objects.filter(user_id__in=user_ids).delete()
+            created = Companionship.objects.bulk_create(Companionship(**row) for row in pairs)
+        return len(created)
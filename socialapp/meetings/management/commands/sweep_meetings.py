@@ -0,0 +1,65 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from socialapp.meetings.models import Attendance, Meeting
+
+
+class Command(BaseCommand):
+    help = (
+        "Clear meetings that stayed unconfirmed for too long. Meetings confirmed by at least --min-confirmed "
+        "attendees are confirmed and their rewards are paid, the rest are archived. Every chunk is committed on "
+        "its own and a swept meeting is never picked up again, so the command can be rerun or interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=14, help="Only meetings at least this old")
+        parser.add_argument("--min-confirmed", type=int, default=2, help="Confirmations needed to auto-confirm")
+        parser.add_argument("--chunk-size", type=int, default=200, help="Number of meetings swept in one transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would happen")
+
+    def handle(self, *args, older_than_days, min_confirmed, chunk_size, dry_run, **options):
+        if older_than_days < 1 or chunk_size < 1:
+            raise CommandError("--older-than-days and --chunk-size have to be positive")
+        cutoff = timezone.localdate() - timedelta(days=older_than_days)
+        stale = Meeting.objects.filter(confirmed_by_majority=False, archived=False, date__lt=cutoff)
+        position = Q()
+        confirmed = archived = 0
+        while True:
+            chunk = list(stale.filter(position).order_by("date", "id").values_list("date", "id")[:chunk_size])
+            if not chunk:
+                break
+            done = self.sweep_chunk([meeting_id for _, meeting_id in chunk], min_confirmed, dry_run)
+            confirmed += done[0]
+            archived += done[1]
+            last_date, last_id = chunk[-1]
+            position = Q(date__gt=last_date) | Q(date=last_date, id__gt=last_id)
+        prefix = "Would have confirmed" if dry_run else "Confirmed"
+        self.stdout.write(self.style.SUCCESS(f"{prefix} {confirmed} meetings and archived {archived}"))
+
+    @staticmethod
+    def sweep_chunk(meeting_ids: list[int], min_confirmed: int, dry_run: bool = False) -> tuple[int, int]:
+        with transaction.atomic():
+            # meetings confirmed or archived since the chunk was listed drop out here
+            meetings = list(
+                Meeting.objects.select_for_update().filter(
+                    id__in=meeting_ids, confirmed_by_majority=False, archived=False
+                )
+            )
+            attendees = defaultdict(list)
+            confirmations = defaultdict(int)
+            attendances = Attendance.objects.filter(meeting_id__in=[meeting.id for meeting in meetings])
+            for meeting_id, user_id, is_confirmed in attendances.values_list("meeting_id", "user_id", "confirmed"):
+                attendees[meeting_id].append(user_id)
+                confirmations[meeting_id] += is_confirmed
+            to_confirm = [meeting for meeting in meetings if confirmations[meeting.id] >= min_confirmed]
+            to_archive = [meeting.id for meeting in meetings if confirmations[meeting.id] < min_confirmed]
+            if dry_run:
+                return len(to_confirm), len(to_archive)
+            confirmed = sum(meeting.pay_out(attendees[meeting.id]) for meeting in to_confirm)
+            archived = Meeting.objects.filter(id__in=to_archive).update(archived=True)
+        return confirmed, archived
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("meetings", "0002_meeting_description"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="meeting",
+            index=models.Index(
+                fields=["confirmed_by_majority", "date", "id"],
+                name="meeting_history_idx",
+            ),
+        ),
+    ]
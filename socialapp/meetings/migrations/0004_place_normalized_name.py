@@ -0,0 +1,57 @@
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalize(name):
+    decomposed = unicodedata.normalize("NFKD", " ".join(name.replace("_", " ").replace("-", " ").split()).casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).replace("ł", "l")
+
+
+def merge_places(apps, schema_editor):
+    Place = apps.get_model("meetings", "Place")
+    Meeting = apps.get_model("meetings", "Meeting")
+    kept = {}
+    for place in Place.objects.order_by("id"):
+        key = normalize(place.name)
+        if key in kept:
+            Meeting.objects.filter(place_id=place.id).update(place_id=kept[key])
+            place.delete()
+        else:
+            kept[key] = place.id
+            place.normalized_name = key
+            place.save(update_fields=["normalized_name"])
+    for place in Place.objects.annotate(meetings_count=Count("meeting")).filter(meetings_count__gt=0):
+        place.usage_count = place.meetings_count
+        place.save(update_fields=["usage_count"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("meetings", "0003_meeting_history_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="normalized_name",
+            field=models.CharField(default="", editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="place",
+            name="usage_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(merge_places, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="place",
+            name="normalized_name",
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(fields=["-usage_count", "id"], name="place_usage_idx"),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:35
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_attendance_stats(apps, schema_editor):
+    Attendance = apps.get_model("meetings", "Attendance")
+    AttendanceStats = apps.get_model("meetings", "AttendanceStats")
+    PlaceVisit = apps.get_model("meetings", "PlaceVisit")
+    Place = apps.get_model("meetings", "Place")
+    stats = {}
+    weeks = defaultdict(set)
+    attendances = Attendance.objects.values_list(
+        "user_id", "drinking", "confirmed", "meeting__date", "meeting__pizza", "meeting__casino"
+    ).order_by()
+    for user_id, drinking, confirmed, day, pizza, casino in attendances.iterator():
+        row = stats.setdefault(user_id, AttendanceStats(user_id=user_id, favourite_places=[]))
+        row.attended += 1
+        row.confirmed += confirmed
+        row.drinking += drinking
+        row.pizza_nights += pizza
+        row.casino_nights += casino
+        weeks[user_id].add(day - timedelta(days=day.weekday()))
+    for user_id, row in stats.items():
+        for week in sorted(weeks[user_id]):
+            row.streak = row.streak + 1 if row.last_week and (week - row.last_week).days == 7 else 1
+            row.last_week = week
+    visits = list(
+        Attendance.objects.filter(meeting__place__isnull=False)
+        .values_list("user_id", "meeting__place_id")
+        .annotate(count=Count("id"))
+        .order_by("user_id", "-count", "meeting__place_id")
+    )
+    names = dict(Place.objects.values_list("id", "name"))
+    for user_id, place_id, count in visits:
+        if len(stats[user_id].favourite_places) < 3:
+            stats[user_id].favourite_places.append({"id": place_id, "name": names[place_id], "count": count})
+    AttendanceStats.objects.bulk_create(stats.values(), batch_size=500)
+    PlaceVisit.objects.bulk_create(
+        (PlaceVisit(user_id=user_id, place_id=place_id, count=count) for user_id, place_id, count in visits),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0009_patchnotes_html"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("meetings", "0004_place_normalized_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttendanceStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="attendance_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("attended", models.PositiveIntegerField(default=0)),
+                ("confirmed", models.PositiveIntegerField(default=0)),
+                ("drinking", models.PositiveIntegerField(default=0)),
+                ("pizza_nights", models.PositiveIntegerField(default=0)),
+                ("casino_nights", models.PositiveIntegerField(default=0)),
+                (
+                    "favourite_places",
+                    models.JSONField(
+                        default=list,
+                        help_text="Most visited places as [{id, name, count}]",
+                    ),
+                ),
+                ("streak", models.PositiveIntegerField(default=0)),
+                ("last_week", models.DateField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name_plural": "attendance stats",
+            },
+        ),
+        migrations.CreateModel(
+            name="PlaceVisit",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "place",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visits",
+                        to="meetings.place",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="placevisit",
+            constraint=models.UniqueConstraint(
+                fields=("user", "place"), name="unique_place_visit"
+            ),
+        ),
+        migrations.RunPython(fill_attendance_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+import django.db.models.deletion
+
+
+def fill_companionships(apps, schema_editor):
+    Attendance = apps.get_model("meetings", "Attendance")
+    Companionship = apps.get_model("meetings", "Companionship")
+    pairs = (
+        Attendance.objects.annotate(companion_id=F("meeting__attendance__user_id"))
+        .exclude(companion_id=F("user_id"))
+        .values("user_id", "companion_id")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    Companionship.objects.bulk_create((Companionship(**row) for row in pairs.iterator()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("meetings", "0005_attendancestats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Companionship",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "companion",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-count", "companion"],
+                        name="companionship_top_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="companionship",
+            constraint=models.UniqueConstraint(
+                fields=("user", "companion"), name="unique_companionship"
+            ),
+        ),
+        migrations.RunPython(fill_companionships, migrations.RunPython.noop),
+    ]
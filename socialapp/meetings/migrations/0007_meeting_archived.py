@@ -0,0 +1,20 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("meetings", "0006_companionship"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="meeting",
+            name="archived",
+            field=models.BooleanField(
+                default=False,
+                help_text="Never confirmed and cleared by the sweep_meetings command",
+            ),
+        ),
+    ]
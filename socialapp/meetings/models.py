@@ -1,14 +1,70 @@
-from django.db import models
-from socialapp.users.models import User
+import unicodedata
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from socialapp.users import balance
+from socialapp.users.models import User, CoinTransaction
+from socialapp.utils import DetailException
 
 
 class Place(models.Model):
+    """
+    ``normalized_name`` is the matching key of a place, "Toruń", " torun " and "TORUN" are the same place.
+    ``usage_count`` caches the number of meetings held there, it ranks places and autocomplete suggestions.
+    """
+
     name = models.CharField(max_length=100)
+    normalized_name = models.CharField(max_length=100, unique=True, editable=False)
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["-usage_count", "id"], name="place_usage_idx")]
+
+    @staticmethod
+    def clean_name(name: str) -> str:
+        return " ".join(name.replace("_", " ").replace("-", " ").split())
+
+    @classmethod
+    def normalize(cls, name: str) -> str:
+        decomposed = unicodedata.normalize("NFKD", cls.clean_name(name).casefold())
+        return "".join(char for char in decomposed if not unicodedata.combining(char)).replace("ł", "l")
+
+    @classmethod
+    def get_or_create_by_name(cls, name: str) -> "Place":
+        """Concurrent calls with the same name end up with one place, the unique index settles the race"""
+        place, _ = cls.objects.get_or_create(
+            normalized_name=cls.normalize(name), defaults={"name": cls.clean_name(name)}
+        )
+        return place
+
+    @classmethod
+    def count_usage(cls, place_id: int | None, delta: int) -> None:
+        if place_id is not None:
+            cls.objects.filter(id=place_id, usage_count__gte=-delta).update(usage_count=F("usage_count") + delta)
 
     @property
     def used_in_meetings(self) -> int:
+        if hasattr(self, "meetings_count"):
+            return self.meetings_count
         return self.meeting_set.count()
 
+    def clean(self):
+        """The unique index on normalized_name is invisible to model forms, renames are checked here"""
+        self.normalized_name = self.normalize(self.name)
+        if Place.objects.filter(normalized_name=self.normalized_name).exclude(pk=self.pk).exists():
+            raise ValidationError({"name": "A place with this name already exists"})
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = self.normalize(self.name)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "normalized_name"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -20,14 +76,32 @@ class Meeting(models.Model):
     users = models.ManyToManyField(User, through="Attendance")
     place = models.ForeignKey(Place, on_delete=models.SET_NULL, null=True)
     confirmed_by_majority = models.BooleanField(default=False)
+    archived = models.BooleanField(default=False, help_text="Never confirmed and cleared by the sweep_meetings command")
     description = models.TextField(default="")
 
     pizza = models.BooleanField(default=False)
     casino = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["confirmed_by_majority", "date", "id"], name="meeting_history_idx")]
+
     def __str__(self):
         return f"{self.date} {self.place.name}"
 
+    def save(self, *args, **kwargs):
+        """Moves the meeting between the usage counts of its old and new place, deletes are counted by a signal"""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "place" not in update_fields and "place_id" not in update_fields:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Meeting.objects.filter(id=self.id).values_list("place_id", flat=True).first()
+            super().save(*args, **kwargs)
+            if previous != self.place_id:
+                Place.count_usage(previous, -1)
+                Place.count_usage(self.place_id, 1)
+
     @property
     def count_attended(self) -> int:
         return self.users.count()
@@ -36,21 +110,63 @@ class Meeting(models.Model):
     def count_confirmed(self) -> int:
         return self.attendance_set.filter(confirmed=True).count()
 
-    @property
-    def majority_threshold(self) -> int:
-        return round(self.count_attended / 2)
+    def majority_threshold(self, count_attended: int | None = None) -> int:
+        if count_attended is None:
+            count_attended = self.count_attended
+        return round(count_attended / 2)
 
     @property
     def confirmed_by_less_half_users(self) -> bool:
-        return self.count_confirmed < self.majority_threshold
+        return self.count_confirmed < self.majority_threshold()
 
-    def rewards_based_on_size_of_meeting(self) -> dict:
+    def rewards_based_on_size_of_meeting(self, count_attended: int | None = None) -> dict:
+        if count_attended is None:
+            count_attended = self.count_attended
         return {
-            "coins": 100 * (1 + (self.count_attended - self.MIN_ATTENDANCE) / 2),
-            "points": 50 * (1 + (self.count_attended - self.MIN_ATTENDANCE) / 2),
-            "exp": 100 * (1 + (self.count_attended - self.MIN_ATTENDANCE)),
+            "coins": 100 * (1 + (count_attended - self.MIN_ATTENDANCE) / 2),
+            "points": 50 * (1 + (count_attended - self.MIN_ATTENDANCE) / 2),
+            "exp": 100 * (1 + (count_attended - self.MIN_ATTENDANCE)),
         }
 
+    def confirm_attendance(self, user) -> None:
+        """
+        Confirms the user's attendance and pays the attendance reward. The meeting row stays locked while
+        confirmations are recounted, so only one of several simultaneous confirms can cross the majority.
+        """
+        with transaction.atomic():
+            if not Attendance.objects.filter(meeting=self, user=user, confirmed=False).update(confirmed=True):
+                if Attendance.objects.filter(meeting=self, user=user).exists():
+                    raise DetailException("You have already confirmed your attendance")
+                raise DetailException("You weren't there")
+            meeting = Meeting.objects.select_for_update().get(id=self.id)
+            if meeting.archived:
+                raise DetailException("This meeting was archived")
+            user.redeem_from_attendance()
+            AttendanceStats.record_confirmation(user.id)
+            if meeting.confirmed_by_majority:
+                return
+            attendances = list(meeting.attendance_set.values_list("user_id", "confirmed"))
+            confirmed = sum(is_confirmed for _, is_confirmed in attendances)
+            if confirmed >= meeting.majority_threshold(count_attended=len(attendances)):
+                meeting.pay_out([user_id for user_id, _ in attendances])
+            self.confirmed_by_majority = meeting.confirmed_by_majority
+
+    def pay_out(self, user_ids: list[int]) -> bool:
+        """Marks the meeting confirmed by majority and rewards every attendee, only the first call pays"""
+        if not Meeting.objects.filter(id=self.id, confirmed_by_majority=False).update(
+            confirmed_by_majority=True, archived=False
+        ):
+            return False
+        self.confirmed_by_majority, self.archived = True, False
+        rewards = self.rewards_based_on_size_of_meeting(count_attended=len(user_ids))
+        balance.grant_many(user_ids, **rewards, reason=CoinTransaction.Reason.MEETING)
+        return True
+
+    def record_new_attendances(self, attendances: list["Attendance"]) -> None:
+        """Updates everything derived from attendances, call it after inserting them"""
+        AttendanceStats.record(self, attendances)
+        Companionship.record(self.id, [attendance.user_id for attendance in attendances])
+
     def confirmed_by_user(self, user):
         if user in self.users.all():
             return self.attendance_set.get(user=user).confirmed
@@ -65,3 +181,164 @@ class Attendance(models.Model):
 
     def __str__(self):
         return f"{self.user} at {self.meeting}"
+
+    def save(self, *args, **kwargs):
+        if self.id is not None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            meeting = Meeting.objects.only("date", "place", "pizza", "casino").get(id=self.meeting_id)
+            meeting.record_new_attendances([self])
+
+
+def week_of(day: date) -> date:
+    """Monday of the week ``day`` belongs to, attendance streaks are counted in weeks"""
+    return day - timedelta(days=day.weekday())
+
+
+class AttendanceStats(models.Model):
+    """
+    Running totals of a user's meetings, updated together with every new or confirmed Attendance.
+    ``streak`` is the number of consecutive weeks with a meeting ending on ``last_week``, meetings added
+    for weeks before ``last_week`` don't change it until rebuild_attendance_stats is run.
+    """
+
+    FAVOURITE_PLACES = 3
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="attendance_stats")
+    attended = models.PositiveIntegerField(default=0)
+    confirmed = models.PositiveIntegerField(default=0)
+    drinking = models.PositiveIntegerField(default=0)
+    pizza_nights = models.PositiveIntegerField(default=0)
+    casino_nights = models.PositiveIntegerField(default=0)
+    favourite_places = models.JSONField(default=list, help_text="Most visited places as [{id, name, count}]")
+    streak = models.PositiveIntegerField(default=0)
+    last_week = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "attendance stats"
+
+    def __str__(self):
+        return f"{self.user_id} attendance stats"
+
+    @property
+    def drinking_ratio(self) -> float:
+        return round(self.drinking / self.attended, 2) if self.attended else 0.0
+
+    @property
+    def current_streak(self) -> int:
+        """The streak is broken once a whole week passes without a meeting"""
+        if self.last_week is None or self.last_week < week_of(timezone.localdate()) - timedelta(weeks=1):
+            return 0
+        return self.streak
+
+    @classmethod
+    def record(cls, meeting: Meeting, attendances: list[Attendance]) -> None:
+        """Adds new attendances of one meeting to their users' stats with a single UPDATE"""
+        user_ids = [attendance.user_id for attendance in attendances]
+        if not user_ids:
+            return
+        week = week_of(meeting.date)
+        new_week = Q(last_week__lt=week) | Q(last_week=None)
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+            cls.objects.filter(user_id__in=user_ids).update(
+                attended=F("attended") + 1,
+                confirmed=F("confirmed") + cls._one_for([a.user_id for a in attendances if a.confirmed]),
+                drinking=F("drinking") + cls._one_for([a.user_id for a in attendances if a.drinking]),
+                pizza_nights=F("pizza_nights") + int(meeting.pizza),
+                casino_nights=F("casino_nights") + int(meeting.casino),
+                streak=Case(
+                    When(last_week=week, then=F("streak")),
+                    When(last_week=week - timedelta(weeks=1), then=F("streak") + 1),
+                    When(new_week, then=Value(1)),
+                    default=F("streak"),
+                ),
+                last_week=Case(When(new_week, then=Value(week)), default=F("last_week")),
+            )
+            if meeting.place_id is not None:
+                PlaceVisit.record(meeting.place_id, user_ids)
+                cls.refresh_favourite_places(user_ids)
+
+    @classmethod
+    def record_confirmation(cls, user_id: int) -> None:
+        cls.objects.filter(user_id=user_id).update(confirmed=F("confirmed") + 1)
+
+    @classmethod
+    def refresh_favourite_places(cls, user_ids: list[int]) -> None:
+        favourites = defaultdict(list)
+        visits = PlaceVisit.objects.filter(user_id__in=user_ids).select_related("place")
+        for visit in visits.order_by("user_id", "-count", "place_id"):
+            if len(favourites[visit.user_id]) < cls.FAVOURITE_PLACES:
+                favourites[visit.user_id].append({"id": visit.place_id, "name": visit.place.name, "count": visit.count})
+        cls.objects.bulk_update(
+            [cls(user_id=user_id, favourite_places=places) for user_id, places in favourites.items()],
+            ["favourite_places"],
+        )
+
+    @staticmethod
+    def _one_for(user_ids: list[int]):
+        if not user_ids:
+            return Value(0)
+        return Case(When(user_id__in=user_ids, then=Value(1)), default=Value(0))
+
+
+class PlaceVisit(models.Model):
+    """How many meetings a user attended at a place, source of AttendanceStats.favourite_places"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    place = models.ForeignKey(Place, on_delete=models.CASCADE, related_name="visits")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "place"], name="unique_place_visit")]
+
+    @classmethod
+    def record(cls, place_id: int, user_ids: list[int]) -> None:
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, place_id=place_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        cls.objects.filter(place_id=place_id, user_id__in=user_ids).update(count=F("count") + 1)
+
+
+class Companionship(models.Model):
+    """
+    Number of meetings ``user`` and ``companion`` attended together. Every pair is stored in both
+    directions, so a user's companions are one range scan on (user, -count).
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    companion = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "companion"], name="unique_companionship")]
+        indexes = [models.Index(fields=["user", "-count", "companion"], name="companionship_top_idx")]
+
+    @classmethod
+    def record(cls, meeting_id: int, user_ids: list[int]) -> None:
+        """
+        Counts the meeting for every pair that involves at least one of the newly added attendees. The
+        missing pairs are created by one INSERT ... SELECT over the attendances, a bulk_create would be
+        split into batches by the SQLite parameter limit, and the counts go up in one UPDATE.
+        """
+        everyone = set(Attendance.objects.filter(meeting_id=meeting_id).values_list("user_id", flat=True))
+        new = set(user_ids) & everyone
+        if not new or len(everyone) < 2:
+            return
+        already_there = everyone - new
+        table, attendance = (connection.ops.quote_name(model._meta.db_table) for model in (cls, Attendance))
+        placeholders = ", ".join(["%s"] * len(new))
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id, companion_id, count) "
+                    f"SELECT DISTINCT a.user_id, b.user_id, 0 FROM {attendance} a "
+                    f"JOIN {attendance} b ON b.meeting_id = a.meeting_id AND b.user_id <> a.user_id "
+                    f"WHERE a.meeting_id = %s AND (a.user_id IN ({placeholders}) OR b.user_id IN ({placeholders})) "
+                    "ON CONFLICT (user_id, companion_id) DO NOTHING",
+                    [meeting_id, *new, *new],
+                )
+            cls.objects.filter(user_id__in=everyone, companion_id__in=everyone).exclude(
+                user_id__in=already_there, companion_id__in=already_there
+            ).update(count=F("count") + 1)
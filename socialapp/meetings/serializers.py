@@ -1,7 +1,8 @@
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import serializers
 
-from socialapp.meetings.models import Meeting, Attendance, Place
+from socialapp.meetings.models import Meeting, Attendance, Place, AttendanceStats, Companionship
 from socialapp.users.models import User
 from socialapp.utils import DetailException
 
@@ -35,13 +36,13 @@ class UserAttendanceSerializer(serializers.ModelSerializer):
 
 
 class MeetingAddSerializer(serializers.ModelSerializer):
-    participants = serializers.ListSerializer(
-        child=serializers.PrimaryKeyRelatedField(queryset=User.objects.all()),
+    participants = serializers.ListField(
+        child=serializers.IntegerField(),
         write_only=True,
         help_text="List of ID's of users who participate in meeting",
     )
-    who_drank = serializers.ListSerializer(
-        child=serializers.PrimaryKeyRelatedField(queryset=User.objects.all()),
+    who_drank = serializers.ListField(
+        child=serializers.IntegerField(),
         write_only=True,
         help_text="default is everyone",
         required=False,
@@ -70,29 +71,41 @@ class MeetingAddSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         participants = validated_data.pop("participants")
-        who_drank = validated_data.get("who_drank") or []
-        if who_drank:
-            validated_data.pop("who_drank")
-        meeting = Meeting.objects.create(**validated_data)
-        for user in participants:
-            drinking = user.id in who_drank
-            attendance = Attendance(meeting=meeting, user=user, drinking=drinking)
-            if self.context["request"].user == user:
-                attendance.confirmed = True
-                user.redeem_from_attendance()
-            attendance.save()
+        who_drank = validated_data.pop("who_drank", None)
+        creator = self.context["request"].user
+        with transaction.atomic():
+            meeting = Meeting.objects.create(**validated_data)
+            attendances = Attendance.objects.bulk_create(
+                Attendance(
+                    meeting=meeting,
+                    user_id=user_id,
+                    drinking=who_drank is None or user_id in who_drank,
+                    confirmed=user_id == creator.id,
+                )
+                for user_id in participants
+            )
+            meeting.record_new_attendances(attendances)
+            if creator.id in participants:
+                creator.redeem_from_attendance()
         return meeting
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
-        if len(attrs["participants"]) < Meeting.MIN_ATTENDANCE:
+        participants = list(dict.fromkeys(attrs["participants"]))
+        if len(participants) < Meeting.MIN_ATTENDANCE:
             raise DetailException("There must be at least 3 participants.")
-        place_string = attrs.pop("place_name").strip().replace("_", " ").replace("-", " ")
-        place = Place.objects.filter(name__iexact=place_string).first()
-        if place:
-            attrs["place"] = place
-        else:
-            attrs["place"] = Place.objects.create(name=place_string)
+        existing = set(User.objects.filter(id__in=participants).values_list("id", flat=True))
+        missing = [user_id for user_id in participants if user_id not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                {"participants": [f'Invalid pk "{user_id}" - object does not exist.' for user_id in missing]}
+            )
+        attrs["participants"] = participants
+        if "who_drank" in attrs:
+            attrs["who_drank"] = set(attrs["who_drank"])
+            if not attrs["who_drank"] <= existing:
+                raise serializers.ValidationError({"who_drank": ["Everyone who drank must be a participant."]})
+        attrs["place"] = Place.get_or_create_by_name(attrs.pop("place_name"))
         if not attrs.get("date"):
             attrs["date"] = timezone.now().date()
         return attrs
@@ -112,10 +125,19 @@ class MeetingDetailSerializer(serializers.ModelSerializer):
 
 class MeetingListSerializer(MeetingDetailSerializer):
     users = serializers.SerializerMethodField()
+    place = serializers.SerializerMethodField()
 
     def get_users(self, obj) -> int:
+        if hasattr(obj, "attendees_count"):
+            return obj.attendees_count
         return obj.attendance_set.count()
 
+    def get_place(self, obj) -> PlaceSerializer(allow_null=True):
+        if obj.place is None:
+            return None
+        obj.place.meetings_count = obj.place.usage_count
+        return PlaceSerializer(obj.place).data
+
     class Meta:
         model = Meeting
         fields = MeetingDetailSerializer.Meta.fields
@@ -126,9 +148,13 @@ class ConfirmMeetingListSerializer(MeetingListSerializer):
     participated = serializers.SerializerMethodField()
 
     def get_confirmed_by_you(self, obj) -> bool:
+        if hasattr(obj, "confirmed_by_you"):
+            return obj.confirmed_by_you
         return obj.confirmed_by_user(self.context["request"].user)
 
     def get_participated(self, obj) -> bool:
+        if hasattr(obj, "participated"):
+            return obj.participated
         user_participated = obj.attendance_set.filter(user=self.context["request"].user).first()
         if user_participated:
             return True
@@ -137,3 +163,47 @@ class ConfirmMeetingListSerializer(MeetingListSerializer):
     class Meta:
         model = Meeting
         fields = MeetingListSerializer.Meta.fields + ["confirmed_by_you", "participated"]
+
+
+class MeetingHistoryFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    place = serializers.IntegerField(required=False, help_text="ID of the place")
+    pizza = serializers.BooleanField(required=False)
+    casino = serializers.BooleanField(required=False)
+    attended = serializers.BooleanField(
+        required=False, help_text="Only meetings you participated in, or with false only the ones you didn't"
+    )
+
+    def validate(self, attrs):
+        if attrs.get("date_from") and attrs.get("date_to") and attrs["date_from"] > attrs["date_to"]:
+            raise DetailException("date_from can't be after date_to")
+        return attrs
+
+
+class AttendanceStatsSerializer(serializers.ModelSerializer):
+    drinking_ratio = serializers.FloatField(read_only=True)
+    current_streak = serializers.IntegerField(read_only=True, help_text="Weeks in a row with a meeting")
+
+    class Meta:
+        model = AttendanceStats
+        fields = [
+            "user",
+            "attended",
+            "confirmed",
+            "drinking_ratio",
+            "pizza_nights",
+            "casino_nights",
+            "favourite_places",
+            "current_streak",
+        ]
+
+
+class CompanionSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="companion_id")
+    username = serializers.CharField(source="companion.username")
+    meetings_together = serializers.IntegerField(source="count")
+
+    class Meta:
+        model = Companionship
+        fields = ["id", "username", "meetings_together"]
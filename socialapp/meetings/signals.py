@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from socialapp.meetings.models import Meeting, Place
+
+
+@receiver(post_delete, sender=Meeting)
+def meeting_deleted(sender, instance, **kwargs):
+    # also sent for every row of a queryset .delete(), which then can't take the fast delete path
+    Place.count_usage(instance.place_id, -1)
@@ -8,7 +8,7 @@ from socialapp.users.tests.factories import UserFactory
 
 
 class PlaceFactory(DjangoModelFactory):
-    name = Faker("name")
+    name = factory.Sequence(lambda n: f"Place {n}")
 
     class Meta:
         model = Place
@@ -1,16 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from io import StringIO
 
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 
-from socialapp.meetings.models import Meeting
+from socialapp.meetings.models import Meeting, Place, AttendanceStats, PlaceVisit, Companionship, week_of
 from socialapp.meetings.tests.factories import (
     MeetingWith1UserFactory,
     MeetingFactory,
     PlaceFactory,
     AttendanceFactory,
 )
+from socialapp.users.models import User, CoinTransaction
 from socialapp.users.tests.factories import UserFactory, QuestFactory, DailyQuestFactory
+from socialapp.utils import DetailException
 
 
 class TestMeetingModels(APITestCase):
@@ -25,6 +33,74 @@ class TestMeetingModels(APITestCase):
         self.assertEqual(place.used_in_meetings, 1)
         self.assertEqual(place.__str__(), place.name)
 
+    def test_place_usage_count_follows_meetings(self):
+        place = PlaceFactory()
+        meeting = MeetingFactory(place=place)
+        MeetingFactory(place=place)
+        meeting.delete()
+        place.refresh_from_db()
+        self.assertEqual(place.usage_count, 1)
+
+    def test_place_usage_count_follows_place_changes(self):
+        first, second = PlaceFactory(), PlaceFactory()
+        meeting = MeetingFactory(place=first)
+        meeting.place = second
+        meeting.save()
+        meeting.place = None
+        meeting.save(update_fields=["place"])
+        meeting.place = first
+        meeting.save()
+        MeetingFactory(place=second)
+        self.assertEqual(Place.objects.get(id=first.id).usage_count, 1)
+        self.assertEqual(Place.objects.get(id=second.id).usage_count, 1)
+        Meeting.objects.all().delete()
+        self.assertEqual(list(Place.objects.values_list("usage_count", flat=True)), [0, 0])
+
+    def test_place_rename_collision(self):
+        PlaceFactory(name="Toruń")
+        place = PlaceFactory()
+        place.name = "TORUN"
+        with self.assertRaises(ValidationError):
+            place.full_clean()
+        place.name = "Bydgoszcz"
+        place.full_clean()
+
+    def test_merge_places(self):
+        kept = PlaceFactory(name="Toruń")
+        MeetingFactory.create_batch(2, place=kept)
+        duplicate = PlaceFactory()
+        Place.objects.filter(id=duplicate.id).update(name="TORUN ", normalized_name="torun (old rules)")
+        moved = MeetingFactory(place=duplicate)
+        other = PlaceFactory(name="Bydgoszcz")
+        call_command("merge_places", stdout=StringIO())
+        moved.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual(moved.place_id, kept.id)
+        self.assertFalse(Place.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(kept.usage_count, 3)
+        self.assertTrue(Place.objects.filter(id=other.id, usage_count=0).exists())
+
+    def test_merge_places_folds_visits(self):
+        kept, duplicate = PlaceFactory(name="Bar A"), PlaceFactory(name="Bar B")
+        other = UserFactory()
+        for place in (kept, duplicate, duplicate):
+            AttendanceFactory(user=self.user, meeting=MeetingFactory(place=place))
+        AttendanceFactory(user=other, meeting=MeetingFactory(place=duplicate))
+        call_command("merge_places", kept.id, duplicate.id, stdout=StringIO())
+        visits = PlaceVisit.objects.order_by("user_id").values_list("user_id", "place_id", "count")
+        self.assertEqual(list(visits), [(self.user.id, kept.id, 3), (other.id, kept.id, 1)])
+        for user, count in ((self.user, 3), (other, 1)):
+            stats = AttendanceStats.objects.get(user=user)
+            self.assertEqual(stats.favourite_places, [{"id": kept.id, "name": "Bar A", "count": count}])
+
+    def test_merge_chosen_places(self):
+        target, source = PlaceFactory(), PlaceFactory()
+        meeting = MeetingFactory(place=source)
+        call_command("merge_places", target.id, source.id, stdout=StringIO())
+        meeting.refresh_from_db()
+        self.assertEqual(meeting.place_id, target.id)
+        self.assertEqual(Place.objects.get(id=target.id).usage_count, 1)
+
     def test_attendance_str(self):
         meeting = MeetingFactory()
         attendance = AttendanceFactory(user=self.user, meeting=meeting)
@@ -44,3 +120,173 @@ class TestMeetingModels(APITestCase):
         meeting = MeetingFactory()
         AttendanceFactory(meeting=meeting, confirmed=True)
         self.assertEqual(meeting.confirmed_by_user(self.user), False)
+
+    def test_pay_out_only_once(self):
+        meeting = MeetingFactory()
+        user_ids = [user.id for user in UserFactory.create_batch(Meeting.MIN_ATTENDANCE)]
+        self.assertTrue(meeting.pay_out(user_ids))
+        self.assertFalse(Meeting.objects.get(id=meeting.id).pay_out(user_ids))
+        self.assertEqual(CoinTransaction.objects.filter(reason=CoinTransaction.Reason.MEETING).count(), 3)
+
+    def test_confirm_attendance_not_attendee(self):
+        meeting = MeetingFactory()
+        with self.assertRaisesMessage(DetailException, "You weren't there"):
+            meeting.confirm_attendance(self.user)
+
+
+class TestAttendanceStats(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.this_week = week_of(timezone.localdate())
+
+    def attend(self, weeks_ago: int, place=None, **kwargs):
+        meeting = MeetingFactory(
+            date=self.this_week - timedelta(weeks=weeks_ago), place=place or PlaceFactory(), **kwargs
+        )
+        return AttendanceFactory(user=self.user, meeting=meeting, drinking=weeks_ago % 2 == 0)
+
+    def test_stats_follow_attendances(self):
+        home = PlaceFactory(name="Home")
+        self.attend(3, place=home, pizza=True)
+        self.attend(1, place=home, casino=True)
+        attendance = self.attend(0, place=home, pizza=True)
+        self.attend(0)
+        attendance.meeting.confirm_attendance(self.user)
+        stats = AttendanceStats.objects.get(user=self.user)
+        self.assertEqual((stats.attended, stats.confirmed, stats.pizza_nights, stats.casino_nights), (4, 1, 2, 1))
+        self.assertEqual(stats.drinking_ratio, 0.5)
+        self.assertEqual(stats.current_streak, 2)
+        self.assertEqual(stats.favourite_places[0], {"id": home.id, "name": "Home", "count": 3})
+        self.assertEqual(len(stats.favourite_places), 2)
+
+    def test_streak_breaks_after_a_week_without_meetings(self):
+        self.attend(3)
+        self.attend(2)
+        self.assertEqual(AttendanceStats.objects.get(user=self.user).current_streak, 0)
+
+    def test_rebuild_attendance_stats(self):
+        home = PlaceFactory()
+        self.attend(0, place=home)
+        self.attend(1, place=home, pizza=True)
+        self.attend(2)
+        expected = AttendanceStats.objects.get(user=self.user)
+        AttendanceStats.objects.all().delete()
+        PlaceVisit.objects.all().delete()
+        call_command("rebuild_attendance_stats", stdout=StringIO())
+        stats = AttendanceStats.objects.get(user=self.user)
+        for field in ("attended", "confirmed", "drinking", "pizza_nights", "casino_nights", "favourite_places"):
+            self.assertEqual(getattr(stats, field), getattr(expected, field), field)
+        self.assertEqual((stats.streak, stats.last_week), (3, self.this_week))
+        self.assertEqual(PlaceVisit.objects.get(user=self.user, place=home).count, 2)
+
+
+class TestCompanionship(APITestCase):
+    def setUp(self):
+        self.ana, self.bob, self.cid = UserFactory.create_batch(3)
+
+    def counts(self) -> dict:
+        return {(row.user_id, row.companion_id): row.count for row in Companionship.objects.all()}
+
+    def test_pairs_counted_both_ways_when_attendances_are_added(self):
+        for users in ([self.ana, self.bob, self.cid], [self.ana, self.bob]):
+            meeting = MeetingFactory()
+            for user in users:
+                AttendanceFactory(user=user, meeting=meeting)
+        counts = self.counts()
+        self.assertEqual(counts[(self.ana.id, self.bob.id)], 2)
+        self.assertEqual(counts[(self.bob.id, self.ana.id)], 2)
+        self.assertEqual(counts[(self.cid.id, self.ana.id)], 1)
+        self.assertEqual(len(counts), 6)
+
+    def test_rebuild_companionships(self):
+        meeting = MeetingFactory()
+        for user in (self.ana, self.bob, self.cid):
+            AttendanceFactory(user=user, meeting=meeting)
+        expected = self.counts()
+        Companionship.objects.update(count=0)
+        call_command("rebuild_companionships", stdout=StringIO())
+        self.assertEqual(self.counts(), expected)
+
+
+class TestSweepMeetings(APITestCase):
+    def setUp(self):
+        self.old = timezone.localdate() - timedelta(days=30)
+
+    def meeting(self, confirmations: int, date=None) -> Meeting:
+        meeting = MeetingFactory(date=date or self.old)
+        for index in range(Meeting.MIN_ATTENDANCE):
+            AttendanceFactory(meeting=meeting, confirmed=index < confirmations)
+        return meeting
+
+    def sweep(self, **options):
+        call_command("sweep_meetings", stdout=StringIO(), **options)
+
+    def test_sweep_confirms_or_archives_stale_meetings(self):
+        vouched, forgotten = self.meeting(confirmations=2), self.meeting(confirmations=1)
+        recent = self.meeting(confirmations=0, date=timezone.localdate() - timedelta(days=2))
+        self.sweep(chunk_size=1)
+        for meeting in (vouched, forgotten, recent):
+            meeting.refresh_from_db()
+        self.assertEqual((vouched.confirmed_by_majority, vouched.archived), (True, False))
+        self.assertEqual((forgotten.confirmed_by_majority, forgotten.archived), (False, True))
+        self.assertEqual((recent.confirmed_by_majority, recent.archived), (False, False))
+        payouts = CoinTransaction.objects.filter(reason=CoinTransaction.Reason.MEETING)
+        self.assertEqual(
+            set(payouts.values_list("user_id", flat=True)), set(vouched.users.values_list("id", flat=True))
+        )
+
+    def test_sweep_is_idempotent(self):
+        self.meeting(confirmations=2)
+        self.sweep()
+        self.sweep()
+        self.assertEqual(CoinTransaction.objects.filter(reason=CoinTransaction.Reason.MEETING).count(), 3)
+
+    def test_sweep_dry_run(self):
+        meeting = self.meeting(confirmations=0)
+        self.sweep(dry_run=True)
+        meeting.refresh_from_db()
+        self.assertFalse(meeting.archived)
+
+    def test_archived_meeting_cannot_be_confirmed(self):
+        meeting = self.meeting(confirmations=0)
+        self.sweep()
+        with self.assertRaisesMessage(DetailException, "This meeting was archived"):
+            meeting.confirm_attendance(meeting.attendance_set.first().user)
+
+    def test_admin_confirm_pays_rewards(self):
+        meeting = self.meeting(confirmations=0)
+        self.client.force_login(UserFactory(is_staff=True, is_superuser=True))
+        data = {"action": "confirm", "_selected_action": [meeting.id]}
+        self.client.post("/admin/meetings/meeting/", data=data)
+        self.client.post("/admin/meetings/meeting/", data=data)
+        meeting.refresh_from_db()
+        self.assertTrue(meeting.confirmed_by_majority)
+        self.assertEqual(CoinTransaction.objects.filter(reason=CoinTransaction.Reason.MEETING).count(), 3)
+
+
+class TestConcurrentConfirms(TransactionTestCase):
+    ATTENDEES = 6
+
+    def confirm(self, meeting_id, user_id):
+        try:
+            Meeting.objects.get(id=meeting_id).confirm_attendance(User.objects.get(id=user_id))
+        finally:
+            connection.close()
+
+    def test_parallel_confirms_pay_every_attendee_once(self):
+        meeting = MeetingFactory()
+        users = UserFactory.create_batch(self.ATTENDEES)
+        for user in users:
+            AttendanceFactory(user=user, meeting=meeting)
+        with ThreadPoolExecutor(max_workers=self.ATTENDEES) as executor:
+            list(executor.map(self.confirm, [meeting.id] * self.ATTENDEES, [user.id for user in users]))
+
+        meeting.refresh_from_db()
+        self.assertTrue(meeting.confirmed_by_majority)
+        self.assertEqual(meeting.count_confirmed, self.ATTENDEES)
+        rewards = meeting.rewards_based_on_size_of_meeting()
+        meeting_payouts = CoinTransaction.objects.filter(reason=CoinTransaction.Reason.MEETING)
+        self.assertEqual(sorted(meeting_payouts.values_list("user_id", flat=True)), sorted(user.id for user in users))
+        for user in User.objects.filter(id__in=[user.id for user in users]):
+            self.assertEqual(user.coins, 500 + 15 + int(rewards["coins"]))
+            self.assertEqual(user.points, int(rewards["points"]))
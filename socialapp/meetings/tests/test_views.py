@@ -2,11 +2,14 @@ import json
 from datetime import timedelta
 from time import sleep
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 
-from socialapp.meetings.models import Meeting
+from socialapp.meetings.models import Companionship, Meeting, Place
 from socialapp.meetings.tests.factories import PlaceFactory, MeetingFactory, AttendanceFactory
+from socialapp.pagination import KeysetPagination
 from socialapp.users.tests.factories import UserFactory, QuestFactory, DailyQuestFactory
 
 
@@ -23,23 +26,146 @@ class TestMeetingsViewset(APITestCase):
 
     def test_meetings_list_no_meetings(self):
         response = self.client.get("/api/meetings/confirmed/")
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data["results"]), 0)
 
     def test_meetings_list_0_confirmed_meeting(self):
         MeetingFactory()
         response = self.client.get("/api/meetings/confirmed/")
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data["results"]), 0)
 
     def test_meetings_list_1_confirmed_meeting(self):
         MeetingFactory(confirmed_by_majority=True)
         response = self.client.get("/api/meetings/confirmed/")
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def list_selects(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query["sql"] for query in queries if query["sql"].startswith("SELECT")]
+
+    def test_meetings_list_query_count_does_not_depend_on_meetings(self):
+        for url, confirmed in (("/api/meetings/confirmed/", True), ("/api/meetings/not_confirmed/", False)):
+            meeting = MeetingFactory(confirmed_by_majority=confirmed, place=self.place)
+            AttendanceFactory(user=self.user, meeting=meeting, confirmed=True)
+            AttendanceFactory(meeting=meeting)
+            _, few = self.list_selects(url)
+            for _ in range(5):
+                meeting = MeetingFactory(confirmed_by_majority=confirmed, place=PlaceFactory())
+                AttendanceFactory.create_batch(3, meeting=meeting)
+            response, many = self.list_selects(url)
+            self.assertEqual(len(few), 1)
+            self.assertEqual(len(many), 1)
+            self.assertEqual(len(response.data["results"]), 6)
+            # no join and GROUP BY over the whole history before the LIMIT
+            self.assertNotIn('JOIN "meetings_attendance"', many[0])
+            self.assertNotIn('GROUP BY "meetings_meeting"."id"', many[0])
+            # the place's meeting count is the stored usage_count, not a count per row
+            self.assertNotIn('FROM "meetings_meeting" U0', many[0])
+
+    def test_meetings_list_annotations(self):
+        meeting = MeetingFactory(confirmed_by_majority=True, place=self.place)
+        MeetingFactory(place=self.place)
+        AttendanceFactory(user=self.user, meeting=meeting, confirmed=True)
+        AttendanceFactory(meeting=meeting)
+        other = MeetingFactory(confirmed_by_majority=True, place=None)
+        AttendanceFactory(meeting=other)
+        response = self.client.get("/api/meetings/confirmed/")
+        rows = {row["id"]: row for row in response.data["results"]}
+        self.assertEqual(rows[meeting.id]["users"], 2)
+        self.assertEqual(rows[meeting.id]["place"]["used_in_meetings"], 2)
+        self.assertTrue(rows[meeting.id]["confirmed_by_you"])
+        self.assertTrue(rows[meeting.id]["participated"])
+        self.assertIsNone(rows[other.id]["place"])
+        self.assertFalse(rows[other.id]["confirmed_by_you"])
+        self.assertFalse(rows[other.id]["participated"])
+
+    def test_meetings_history_cursor_pages(self):
+        today = timezone.now().date()
+        meetings = [MeetingFactory(confirmed_by_majority=True, date=today - timedelta(days=i // 2)) for i in range(7)]
+        expected = [meeting.id for meeting in sorted(meetings, key=lambda m: (m.date, m.id), reverse=True)]
+        seen = []
+        url = "/api/meetings/confirmed/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+    def test_meetings_history_filters(self):
+        today = timezone.now().date()
+        attended = MeetingFactory(confirmed_by_majority=True, date=today, pizza=True, place=self.place)
+        AttendanceFactory(user=self.user, meeting=attended)
+        old = MeetingFactory(confirmed_by_majority=True, date=today - timedelta(days=30), casino=True)
+        cases = {
+            f"date_from={today - timedelta(days=1)}": [attended.id],
+            f"date_to={today - timedelta(days=1)}": [old.id],
+            f"place={self.place.id}": [attended.id],
+            "pizza=true": [attended.id],
+            "casino=true": [old.id],
+            "casino=false": [attended.id],
+            "attended=true": [attended.id],
+            "attended=false": [old.id],
+        }
+        for query, expected in cases.items():
+            response = self.client.get(f"/api/meetings/confirmed/?{query}")
+            self.assertEqual([row["id"] for row in response.data["results"]], expected, query)
+
+    def test_meetings_history_invalid_filters(self):
+        response = self.client.get("/api/meetings/confirmed/?date_from=2024-02-02&date_to=2024-01-01")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/meetings/not_confirmed/?date_from=yesterday")
+        self.assertEqual(response.status_code, 400)
+
+    def test_meetings_history_tampered_cursor(self):
+        for position in (["notadate", 1], ["2024-01-01", "x"]):
+            cursor = KeysetPagination().encode_cursor(position)
+            response = self.client.get("/api/meetings/confirmed/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_archived_meetings_are_not_listed(self):
+        MeetingFactory(archived=True)
+        MeetingFactory()
+        response = self.client.get("/api/meetings/not_confirmed/")
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_export_csv(self):
+        meeting = MeetingFactory(
+            date="2024-05-04", place=PlaceFactory(name="Toruń"), description='say "hi", ok', pizza=True
+        )
+        AttendanceFactory(user=self.user, meeting=meeting, confirmed=True)
+        AttendanceFactory(meeting=meeting)
+        MeetingFactory(date="2024-05-05")
+        response = self.client.get("/api/meetings/export/csv/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            content.splitlines(),
+            [
+                "date,place,description,pizza,casino,confirmed_by_majority,users,confirmed_by_you",
+                '2024-05-04,Toruń,"say ""hi"", ok",True,False,False,2,True',
+            ],
+        )
+
+    def test_export_ical(self):
+        attended = [MeetingFactory(date=f"2024-05-0{day}", description="a;b,c") for day in (1, 2)]
+        for meeting in attended:
+            AttendanceFactory(user=self.user, meeting=meeting)
+        response = self.client.get("/api/meetings/export/ical/?date_from=2024-05-02")
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().split("\r\n")
+        self.assertEqual(lines[0], "BEGIN:VCALENDAR")
+        self.assertEqual(lines.count("BEGIN:VEVENT"), 1)
+        self.assertIn(f"UID:meeting-{attended[1].id}@testserver", lines)
+        self.assertIn("DTSTART;VALUE=DATE:20240502", lines)
+        self.assertIn("DESCRIPTION:a\\;b\\,c", lines)
+        self.assertEqual(lines[-2:], ["END:VCALENDAR", ""])
 
     def test_meetings_to_confirm_by_you(self):
         meeting = MeetingFactory()
         AttendanceFactory(user=self.user, meeting=meeting)
         response = self.client.get("/api/meetings/not_confirmed/")
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
 
     def test_meetings_to_confirm_by_others(self):
         meeting = MeetingFactory()
@@ -47,7 +173,7 @@ class TestMeetingsViewset(APITestCase):
         AttendanceFactory(meeting=meeting)
         AttendanceFactory(meeting=meeting)
         response = self.client.get("/api/meetings/not_confirmed/")
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data["results"]), 1)
 
     def test_decline_meeting(self):
         meeting = MeetingFactory()
@@ -76,6 +202,87 @@ class TestMeetingsViewset(APITestCase):
         self.user.refresh_from_db()
         self.assertNotEqual(self.user.coins, 500)
 
+    def create_meeting_queries(self, participants: int) -> int:
+        user_ids = [user.id for user in UserFactory.create_batch(participants - 1)] + [self.user.id]
+        data = {"place_name": self.place.name, "participants": user_ids, "who_drank": user_ids[:2]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/meetings/", data=data, format="json")
+        self.assertEqual(response.status_code, 201)
+        return len(queries)
+
+    def test_create_meeting_query_count_does_not_depend_on_participants(self):
+        self.assertEqual(self.create_meeting_queries(3), self.create_meeting_queries(30))
+
+    def test_create_meeting_companionship_writes(self):
+        user_ids = [user.id for user in UserFactory.create_batch(29)] + [self.user.id]
+        data = {"place_name": self.place.name, "participants": user_ids}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post("/api/meetings/", data=data, format="json")
+        writes = [query["sql"].split()[0] for query in queries if '"meetings_companionship"' in query["sql"]]
+        self.assertEqual(writes, ["INSERT", "UPDATE"])
+        self.assertEqual(Companionship.objects.filter(count=1).count(), 30 * 29)
+
+    def test_create_meeting_attendances(self):
+        users = UserFactory.create_batch(3)
+        data = {
+            "place_name": "Toruń",
+            "participants": [users[0].id, users[1].id, users[2].id, self.user.id, users[0].id],
+            "who_drank": [users[0].id],
+        }
+        response = self.client.post("/api/meetings/", data=data, format="json")
+        self.assertEqual(response.status_code, 201)
+        meeting = Meeting.objects.get()
+        attendances = {attendance.user_id: attendance for attendance in meeting.attendance_set.all()}
+        self.assertEqual(len(attendances), 4)
+        self.assertEqual([user_id for user_id, a in attendances.items() if a.drinking], [users[0].id])
+        self.assertEqual([user_id for user_id, a in attendances.items() if a.confirmed], [self.user.id])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 515)
+
+    def test_create_meeting_unknown_participant(self):
+        users = UserFactory.create_batch(2)
+        data = {"place_name": "Toruń", "participants": [users[0].id, users[1].id, 0]}
+        response = self.client.post("/api/meetings/", data=data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("participants", response.data)
+        data = {"place_name": "Toruń", "participants": [users[0].id, users[1].id, self.user.id], "who_drank": [0]}
+        response = self.client.post("/api/meetings/", data=data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Meeting.objects.exists())
+
+    def test_create_meeting_reuses_normalised_place(self):
+        place = PlaceFactory(name="Toruń")
+        participants = [user.id for user in UserFactory.create_batch(2)] + [self.user.id]
+        for place_name in ("  torun ", "TORUŃ"):
+            response = self.client.post(
+                "/api/meetings/", data={"place_name": place_name, "participants": participants}, format="json"
+            )
+            self.assertEqual(response.status_code, 201)
+        place.refresh_from_db()
+        self.assertEqual(Place.objects.filter(normalized_name="torun").count(), 1)
+        self.assertEqual(place.usage_count, 2)
+
+    def test_suggested_participants(self):
+        often, rarely, chosen = UserFactory.create_batch(3)
+        for users in ([often, rarely, chosen], [often], [often, chosen]):
+            meeting = MeetingFactory()
+            for user in [self.user, *users]:
+                AttendanceFactory(user=user, meeting=meeting)
+        response = self.client.get(f"/api/meetings/suggested_participants/?selected={chosen.id}")
+        self.assertEqual(
+            [(row["id"], row["meetings_together"]) for row in response.data], [(often.id, 3), (rarely.id, 1)]
+        )
+
+    def test_places_autocomplete(self):
+        rarely = PlaceFactory(name="Łódź Kaliska")
+        often = PlaceFactory(name="Lodówka")
+        PlaceFactory(name="Toruń")
+        MeetingFactory(place=rarely)
+        MeetingFactory.create_batch(2, place=often)
+        response = self.client.get("/api/meetings/places/autocomplete/?q=lod")
+        self.assertEqual([row["id"] for row in response.data], [often.id, rarely.id])
+        self.assertEqual(response.data[0]["used_in_meetings"], 2)
+
     def test_confirm_attendance(self):
         meeting = MeetingFactory()
         AttendanceFactory(meeting=meeting)
@@ -1,60 +1,187 @@
-from django.db.models import Count
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
 
-from socialapp.meetings.models import Meeting, Place, Attendance
+from socialapp.meetings import export
+from socialapp.meetings.models import Meeting, Place, Attendance, Companionship
+from socialapp.pagination import KeysetPagination
 from socialapp.meetings.serializers import (
     MeetingListSerializer,
     MeetingAddSerializer,
     PlaceSerializer,
     MeetingDetailSerializer,
     ConfirmMeetingListSerializer,
+    MeetingHistoryFilterSerializer,
+    CompanionSerializer,
 )
 
 
+class MeetingHistoryPagination(KeysetPagination):
+    ordering = ("-date", "-id")
+    page_size = 20
+
+
 @extend_schema(summary="Meetings view", tags=["meetings"])
 class MeetingViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.CreateModelMixin):
     queryset = Meeting.objects.order_by("-date")
+    AUTOCOMPLETE_LIMIT = 10
+    SUGGESTIONS_LIMIT = 10
+    EXPORT_CHUNK_SIZE = 500
     serializer_classes = {
         "retrieve": MeetingDetailSerializer,
         "create": MeetingAddSerializer,
         "confirmed": ConfirmMeetingListSerializer,
         "not_confirmed": ConfirmMeetingListSerializer,
         "places": PlaceSerializer,
+        "places_autocomplete": PlaceSerializer,
+        "suggested_participants": CompanionSerializer,
     }
 
     def get_serializer_class(self):
         return self.serializer_classes.get(self.action, MeetingListSerializer)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("confirmed", "not_confirmed", "export_csv", "export_ical"):
+            return self.annotate_for_list(queryset, self.request.user)
+        return queryset
+
+    def filter_history(self, queryset):
+        filters = MeetingHistoryFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+        if "date_from" in params:
+            queryset = queryset.filter(date__gte=params["date_from"])
+        if "date_to" in params:
+            queryset = queryset.filter(date__lte=params["date_to"])
+        if "place" in params:
+            queryset = queryset.filter(place_id=params["place"])
+        for flag, field in (("pizza", "pizza"), ("casino", "casino"), ("attended", "participated")):
+            if flag in params:
+                queryset = queryset.filter(**{field: params[flag]})
+        return queryset
+
+    def history(self, confirmed: bool):
+        queryset = self.filter_history(self.get_queryset().filter(confirmed_by_majority=confirmed, archived=False))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def exported_meetings(self):
+        """Meetings the user attended, read from the database in chunks while the response is streamed"""
+        queryset = self.filter_history(self.get_queryset().filter(participated=True))
+        return queryset.order_by("-date", "-id").iterator(chunk_size=self.EXPORT_CHUNK_SIZE)
+
+    @staticmethod
+    def annotate_for_list(queryset, user):
+        """Everything ConfirmMeetingListSerializer reads, fetched in the same query as the meetings"""
+        attendees = (
+            Attendance.objects.filter(meeting=OuterRef("pk"))
+            .order_by()
+            .values("meeting")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        attendance = Attendance.objects.filter(meeting=OuterRef("pk"), user=user)
+        # correlated subqueries rather than a join and GROUP BY, so a page stays a LIMITed scan of the history index
+        return queryset.select_related("place").annotate(
+            attendees_count=Coalesce(Subquery(attendees), Value(0)),
+            confirmed_by_you=Exists(attendance.filter(confirmed=True)),
+            participated=Exists(attendance),
+        )
+
     @extend_schema(summary="List of most used places", responses={200: PlaceSerializer(many=True)})
     @action(methods=["get"], detail=False)
     def places(self, request, *args, **kwargs):
-        places = Place.objects.annotate(meetings_count=Count("meeting")).order_by("-meetings_count")
+        places = Place.objects.annotate(meetings_count=F("usage_count")).order_by("-usage_count", "id")
         return Response(self.get_serializer(places, many=True).data, status=status.HTTP_200_OK)
 
     @extend_schema(
-        summary="List of meetings that are confirmed",
-        responses={200: ConfirmMeetingListSerializer(many=True)},
+        summary="Places starting with the typed text, most used first",
+        parameters=[OpenApiParameter("q", str, description="Beginning of the place name")],
+        responses={200: PlaceSerializer(many=True)},
+    )
+    @action(methods=["get"], detail=False, url_path="places/autocomplete")
+    def places_autocomplete(self, request, *args, **kwargs):
+        prefix = Place.normalize(request.query_params.get("q", ""))
+        places = (
+            Place.objects.filter(normalized_name__startswith=prefix)
+            .annotate(meetings_count=F("usage_count"))
+            .order_by("-usage_count", "id")[: self.AUTOCOMPLETE_LIMIT]
+        )
+        return Response(self.get_serializer(places, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="People you meet with most, to prefill participants of a new meeting",
+        parameters=[OpenApiParameter("selected", str, description="Comma separated ids of already chosen users")],
+        responses={200: CompanionSerializer(many=True)},
     )
     @action(methods=["get"], detail=False)
+    def suggested_participants(self, request, *args, **kwargs):
+        selected = [user_id for user_id in request.query_params.get("selected", "").split(",") if user_id.isdigit()]
+        suggestions = (
+            Companionship.objects.filter(user=request.user)
+            .exclude(companion_id__in=selected)
+            .select_related("companion")
+            .only("companion_id", "count", "companion__username")
+            .order_by("-count", "companion_id")[: self.SUGGESTIONS_LIMIT]
+        )
+        return Response(self.get_serializer(suggestions, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Meetings confirmed by majority, newest first",
+        parameters=[
+            MeetingHistoryFilterSerializer,
+            OpenApiParameter("cursor", str),
+            OpenApiParameter("page_size", int),
+        ],
+        responses={200: ConfirmMeetingListSerializer(many=True)},
+    )
+    @action(methods=["get"], detail=False, pagination_class=MeetingHistoryPagination)
     def confirmed(self, request, *args, **kwargs):
-        queryset = self.get_queryset().filter(confirmed_by_majority=True)
-        serializer = self.get_serializer(queryset, many=True, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.history(confirmed=True)
 
     @extend_schema(
-        summary="List of meetings that are confirmed",
+        summary="Meetings still waiting for confirmation, newest first",
+        parameters=[
+            MeetingHistoryFilterSerializer,
+            OpenApiParameter("cursor", str),
+            OpenApiParameter("page_size", int),
+        ],
         responses={200: ConfirmMeetingListSerializer(many=True)},
     )
-    @action(methods=["get"], detail=False)
+    @action(methods=["get"], detail=False, pagination_class=MeetingHistoryPagination)
     def not_confirmed(self, request, *args, **kwargs):
-        not_confirmed_meetings = self.get_queryset().filter(confirmed_by_majority=False)
-        serializer = ConfirmMeetingListSerializer(not_confirmed_meetings, many=True, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.history(confirmed=False)
+
+    @extend_schema(
+        summary="Download meetings you attended as a CSV file",
+        parameters=[MeetingHistoryFilterSerializer],
+        responses={(200, "text/csv"): OpenApiTypes.STR},
+    )
+    @action(methods=["get"], detail=False, url_path="export/csv")
+    def export_csv(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(export.csv_rows(self.exported_meetings()), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="meetings.csv"'
+        return response
+
+    @extend_schema(
+        summary="Download meetings you attended as an iCalendar file",
+        parameters=[MeetingHistoryFilterSerializer],
+        responses={(200, "text/calendar"): OpenApiTypes.STR},
+    )
+    @action(methods=["get"], detail=False, url_path="export/ical")
+    def export_ical(self, request, *args, **kwargs):
+        lines = export.ical_lines(self.exported_meetings(), domain=request.get_host())
+        response = StreamingHttpResponse(lines, content_type="text/calendar; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="meetings.ics"'
+        return response
 
     @extend_schema(
         summary="Confirm your attendance on meeting, by doing so gain coins and points",
@@ -64,30 +191,7 @@ class MeetingViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.
     @action(methods=["post"], detail=True)
     def confirm(self, request, *args, **kwargs):
         meeting = self.get_object()
-        user = request.user
-        attendance = meeting.attendance_set.get(user=request.user)
-        if not attendance:
-            return Response(data="You weren't there", status=status.HTTP_400_BAD_REQUEST)
-        if attendance.confirmed:
-            return Response(data="You have already confirmed your attendance", status=status.HTTP_400_BAD_REQUEST)
-
-        attendance.confirmed = True
-        attendance.save(update_fields=["confirmed"])
-        user.redeem_from_attendance()
-
-        if meeting.confirmed_by_majority:
-            return Response("Confirmed")
-
-        current_confirmed_count = self.get_object().count_confirmed
-        if current_confirmed_count >= meeting.majority_threshold:
-            meeting.confirmed_by_majority = True
-            meeting.save(update_fields=["confirmed_by_majority"])
-            rewards = meeting.rewards_based_on_size_of_meeting()
-            for user in meeting.users.all():
-                user.coins += rewards["coins"]
-                user.points += rewards["points"]
-                user.exp += rewards["exp"]
-                user.save()
+        meeting.confirm_attendance(request.user)
         return Response("Confirmed")
 
     @extend_schema(summary="Decline your attendance on meeting", request=None, responses={200: str})
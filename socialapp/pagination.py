@@ -0,0 +1,125 @@
+import base64
+import json
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite ordering, for example ("-points", "id").
+    The cursor holds the ordering values of the last row on the page, so the next page is a
+    range scan on an index matching ``ordering`` however deep the client goes.
+    The last field of ``ordering`` has to be unique.
+    """
+
+    ordering: tuple[str, ...] = ("-id",)
+    page_size = 50
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_position(self, row) -> list:
+        return [attrgetter(field.lstrip("-").replace("__", "."))(row) for field in self.ordering]
+
+    def after(self, position) -> Q:
+        """Rows placed after ``position``: (a > x) | (a = x & b > y) | ..."""
+        return self._seek(position, reverse=False)
+
+    def before(self, position) -> Q:
+        """Rows placed before ``position``, the mirror of ``after``"""
+        return self._seek(position, reverse=True)
+
+    def _seek(self, position, reverse: bool) -> Q:
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") != reverse else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, position) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position, cls=DjangoJSONEncoder).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """Ordering values of the cursor, each converted by its model field so a tampered cursor is a 404"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.ordering_field(model, field).to_python(value) for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def ordering_field(model, field: str):
+        *relations, name = field.lstrip("-").split("__")
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def next_cursor(self) -> str | None:
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def link_to(self, cursor: str | None) -> str | None:
+        """Absolute URL of the page starting after ``cursor``, built from the host of the current request"""
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self) -> str | None:
+        return self.link_to(self.next_cursor())
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -1,9 +1,12 @@
+from django.contrib.admin import helpers
 from django.contrib.auth import admin as auth_admin
+from django.shortcuts import render
 from django.utils.translation import gettext_lazy as _
 
 from .forms import UserAdminChangeForm
 from .forms import UserAdminCreationForm
-from .models import User, Quest, DailyQuest, DailyCoins, PatchNotes, Message
+from .forms import BroadcastMessageForm
+from .models import User, Quest, DailyQuest, DailyCoins, PatchNotes, Message, CoinTransaction
 from django.contrib import admin
 
 
@@ -35,6 +38,12 @@ class MessageAdmin(admin.ModelAdmin):
     list_filter = ("read", "receiver", "sender")
 
 
+@admin.register(CoinTransaction)
+class CoinTransactionAdmin(admin.ModelAdmin):
+    list_display = ("user", "amount", "reason", "created_at")
+    list_filter = ("reason",)
+
+
 @admin.register(User)
 class UserAdmin(auth_admin.UserAdmin):
     form = UserAdminChangeForm
@@ -63,7 +72,23 @@ class UserAdmin(auth_admin.UserAdmin):
         "write_message",
     ]
 
-    @admin.action()
+    @admin.action(description="Send a message with coins to selected users")
     def write_message(self, request, queryset):
-        for user in queryset:
-            Message.objects.create(receiver=user, message="test")
+        form = BroadcastMessageForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            sent = Message.broadcast(
+                queryset, form.cleaned_data["message"], form.cleaned_data["coins"], sender=request.user
+            )
+            self.message_user(request, f"Sent {sent} messages")
+            return None
+        return render(
+            request,
+            "admin/broadcast_message.html",
+            context={
+                **self.admin_site.each_context(request),
+                "form": form,
+                "action": "write_message",
+                "select_across": request.POST.get("select_across") == "1",
+                "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            },
+        )
@@ -0,0 +1,97 @@
+"""
+Every change of a user's coins, points and exp goes through this module.
+Deltas are applied with F() expressions in a single UPDATE, debits are guarded with
+``coins >= amount`` in the same statement and each coin change is written to the CoinTransaction ledger.
+"""
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import NotFound
+
+from socialapp.users import levels
+from socialapp.users.models import User, CoinTransaction
+from socialapp.utils import DetailException
+
+
+def change_balance(
+    user: User,
+    coins: int = 0,
+    points: int = 0,
+    exp: int = 0,
+    reason: str = CoinTransaction.Reason.OTHER,
+    require_coins: int = 0,
+) -> None:
+    """
+    Adds the deltas to the user's row, ``require_coins`` makes the update happen only when the user
+    has at least that many coins, otherwise DetailException is raised and nothing is written. The guard
+    is checked even when every delta is zero. NotFound is raised when the user doesn't exist.
+    The in-memory ``user`` gets the same deltas so it can be serialized without a refresh.
+    """
+    coins, points, exp = int(coins), int(points), int(exp)
+    changes = _changes(coins, points, exp)
+    queryset = User.objects.filter(id=user.id)
+    if require_coins:
+        queryset = queryset.filter(coins__gte=require_coins)
+    with transaction.atomic():
+        if changes:
+            applied = queryset.update(**changes)
+        else:
+            applied = not require_coins or queryset.exists()
+        if not applied:
+            if require_coins and User.objects.filter(id=user.id).exists():
+                raise DetailException("Insufficient coins")
+            raise NotFound("User not found")
+        if coins:
+            CoinTransaction.objects.create(user=user, amount=coins, reason=reason)
+        if exp:
+            level_up([user.id])
+    user.coins += coins
+    user.points += points
+    if exp:
+        user.refresh_from_db(fields=["exp", "level"])
+
+
+def credit(user: User, amount: int, reason: str = CoinTransaction.Reason.OTHER) -> None:
+    change_balance(user, coins=amount, reason=reason)
+
+
+def debit(user: User, amount: int, reason: str = CoinTransaction.Reason.OTHER) -> None:
+    change_balance(user, coins=-amount, reason=reason, require_coins=amount)
+
+
+def grant(user: User, coins: int = 0, points: int = 0, exp: int = 0, reason: str = CoinTransaction.Reason.OTHER):
+    change_balance(user, coins=coins, points=points, exp=exp, reason=reason)
+
+
+def grant_many(
+    user_ids: list[int], coins: int = 0, points: int = 0, exp: int = 0, reason: str = CoinTransaction.Reason.OTHER
+) -> None:
+    """Gives the same reward to every user in one UPDATE, then levels all of them up in bulk"""
+    coins, points, exp = int(coins), int(points), int(exp)
+    changes = _changes(coins, points, exp)
+    if not user_ids or not changes:
+        return
+    with transaction.atomic():
+        User.objects.filter(id__in=user_ids).update(**changes)
+        if coins:
+            CoinTransaction.objects.bulk_create(
+                CoinTransaction(user_id=user_id, amount=coins, reason=reason) for user_id in user_ids
+            )
+        if exp:
+            level_up(user_ids)
+
+
+def level_up(user_ids: list[int]) -> int:
+    """Applies every level up the users' exp allows, the rows stay locked until the transaction ends"""
+    leveled_up = []
+    with transaction.atomic():
+        for user in User.objects.select_for_update().filter(id__in=user_ids).only("id", "level", "exp"):
+            level, exp = levels.apply_exp(user.level, user.exp)
+            if level != user.level:
+                user.level, user.exp = level, exp
+                leveled_up.append(user)
+        User.objects.bulk_update(leveled_up, ["level", "exp"])
+    return len(leveled_up)
+
+
+def _changes(coins: int, points: int, exp: int) -> dict:
+    return {field: F(field) + delta for field, delta in (("coins", coins), ("points", points), ("exp", exp)) if delta}
@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib.auth import forms as admin_forms
 from django.utils.translation import gettext_lazy as _
 
@@ -20,3 +21,8 @@ class UserAdminCreationForm(admin_forms.UserCreationForm):
         error_messages = {
             "username": {"unique": _("This username has already been taken.")},
         }
+
+
+class BroadcastMessageForm(forms.Form):
+    message = forms.CharField(widget=forms.Textarea)
+    coins = forms.IntegerField(initial=100, min_value=0)
@@ -0,0 +1,42 @@
+"""
+Experience curve of users, precomputed once at import.
+A user on ``level`` needs ``round(sqrt(level / 10) * 1000 + (level - 1) ** 2)`` exp to advance,
+``User.exp`` is the exp gathered inside the current level.
+"""
+import math
+from bisect import bisect_right
+from itertools import accumulate
+
+MAX_LEVEL = 1000
+
+
+def _exp_to_next_level(level: int) -> int:
+    return round(math.sqrt(level / 10) * 1000 + (level - 1) ** 2)
+
+
+EXP_TO_NEXT_LEVEL = tuple(_exp_to_next_level(level) for level in range(1, MAX_LEVEL + 1))
+# total exp needed to reach a level, THRESHOLDS[level - 1]
+THRESHOLDS = tuple(accumulate(EXP_TO_NEXT_LEVEL[:-1], initial=0))
+
+
+def exp_to_next_level(level: int) -> int:
+    if 1 <= level <= MAX_LEVEL:
+        return EXP_TO_NEXT_LEVEL[level - 1]
+    return _exp_to_next_level(level)
+
+
+def total_exp(level: int, exp: int) -> int:
+    return THRESHOLDS[min(max(level, 1), MAX_LEVEL) - 1] + exp
+
+
+def level_for_total_exp(total: int) -> tuple[int, int]:
+    """Level reached with ``total`` exp and the exp left over inside that level"""
+    level = max(bisect_right(THRESHOLDS, total), 1)
+    return level, total - THRESHOLDS[level - 1]
+
+
+def apply_exp(level: int, exp: int) -> tuple[int, int]:
+    """Levels up as many times as ``exp`` allows, users above MAX_LEVEL are left as they are"""
+    if level > MAX_LEVEL or exp < exp_to_next_level(level):
+        return level, exp
+    return level_for_total_exp(total_exp(level, exp))
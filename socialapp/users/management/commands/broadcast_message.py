@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from socialapp.users.models import Message, User
+
+
+class Command(BaseCommand):
+    help = "Send a message with coins to every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("message", help="Text of the message")
+        parser.add_argument("--coins", type=int, default=100, help="Coins claimed with the message")
+        parser.add_argument("--sender", help="Username of the sender, by default the message has none")
+        parser.add_argument("--active-only", action="store_true", help="Skip users that are not active")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of messages inserted at once")
+
+    def handle(self, *args, message, coins, sender, active_only, chunk_size, **options):
+        if coins < 0:
+            raise CommandError("Coins can't be negative")
+        if sender:
+            sender = User.objects.filter(username=sender).first()
+            if not sender:
+                raise CommandError("Sender not found")
+        recipients = User.objects.filter(is_active=True) if active_only else User.objects.all()
+        sent = Message.broadcast(recipients, message, coins, sender=sender, chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} messages"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from socialapp.users import balance
+from socialapp.users.models import User
+from socialapp.utils import id_chunks
+
+
+class Command(BaseCommand):
+    help = "Apply every pending level up of every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of users updated at once")
+
+    def handle(self, *args, chunk_size, **options):
+        leveled_up = sum(balance.level_up(user_ids) for user_ids in id_chunks(User.objects.all(), chunk_size))
+        self.stdout.write(self.style.SUCCESS(f"Leveled up {leveled_up} users"))
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_user_description"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["-points", "id"], name="user_leaderboard_idx"),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_user_leaderboard_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CoinTransaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.IntegerField()),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("roulette", "Roulette"),
+                            ("high_card", "High Card"),
+                            ("message", "Message"),
+                            ("daily_coins", "Daily Coins"),
+                            ("quest", "Quest"),
+                            ("bet", "Bet"),
+                            ("bet_payout", "Bet Payout"),
+                            ("attendance", "Attendance"),
+                            ("meeting", "Meeting"),
+                            ("other", "Other"),
+                        ],
+                        default="other",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="coin_transactions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created_at"], name="coin_transaction_user_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0006_cointransaction"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["receiver", "read"], name="message_inbox_idx"),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0007_message_inbox_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="dailyquest",
+            index=models.Index(fields=["user", "created_at"], name="daily_quest_user_created_idx"),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:21
+
+from django.db import migrations, models
+import markdown
+
+
+def render_patch_notes(apps, schema_editor):
+    PatchNotes = apps.get_model("users", "PatchNotes")
+    patch_notes = list(PatchNotes.objects.all())
+    for patch_note in patch_notes:
+        patch_note.html = markdown.markdown(patch_note.text)
+    PatchNotes.objects.bulk_update(patch_notes, ["html"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0008_daily_quest_user_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patchnotes",
+            name="html",
+            field=models.TextField(
+                blank=True,
+                editable=False,
+                help_text="text rendered from markdown on save",
+            ),
+        ),
+        migrations.RunPython(render_patch_notes, migrations.RunPython.noop),
+    ]
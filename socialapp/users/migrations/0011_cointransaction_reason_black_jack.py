@@ -0,0 +1,34 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0010_cointransaction_reason_bells"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cointransaction",
+            name="reason",
+            field=models.CharField(
+                choices=[
+                    ("roulette", "Roulette"),
+                    ("high_card", "High Card"),
+                    ("bells", "Bells"),
+                    ("black_jack", "Black Jack"),
+                    ("message", "Message"),
+                    ("daily_coins", "Daily Coins"),
+                    ("quest", "Quest"),
+                    ("bet", "Bet"),
+                    ("bet_payout", "Bet Payout"),
+                    ("attendance", "Attendance"),
+                    ("meeting", "Meeting"),
+                    ("other", "Other"),
+                ],
+                default="other",
+                max_length=20,
+            ),
+        ),
+    ]
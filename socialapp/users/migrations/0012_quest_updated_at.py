@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0011_cointransaction_reason_black_jack"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quest",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0012_quest_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patchnotes",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,28 +1,47 @@
-import math
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from functools import cached_property
+from itertools import islice
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import CharField, Sum, QuerySet, Q
+from django.db import connection, models, transaction
+from django.db.models import CharField, Sum, QuerySet
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+import markdown
+
+from socialapp.users import levels
+from socialapp.utils import DetailException, table_version
+
+
+def start_of_today() -> datetime:
+    return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
 
 
 class PatchNotes(models.Model):
     date = models.DateField(unique=True)
     text = models.TextField(help_text="You can use markdown here")
+    html = models.TextField(blank=True, editable=False, help_text="text rendered from markdown on save")
     title = models.CharField(max_length=100)
     version = models.CharField(max_length=40, blank=True)
     major = models.BooleanField(default=False)
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         verbose_name_plural = "Patch Notes"
 
+    @classmethod
+    def feed_state(cls) -> dict:
+        """ETag and last modification time of the whole feed"""
+        version, updated_at = table_version(cls)
+        return {"etag": f'"patch-notes-{version}"', "updated_at": updated_at}
+
     def save(self, *args, **kwargs):
+        self.html = markdown.markdown(self.text)
+        if update_fields := kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*update_fields, "html"}
         last_version = PatchNotes.objects.order_by("-date").first()
-        if not last_version:
-            return super().save(*args, **kwargs)
-        if self.id is None:
+        if last_version and self.id is None:
             last_version = last_version.version
             major_number, minor_number = last_version.split(".")
             this_major = int(major_number)
@@ -33,7 +52,7 @@ class PatchNotes(models.Model):
             else:
                 this_minor += 1
             self.version = f"{this_major}.{this_minor}"
-        return super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
 
 
 class User(AbstractUser):
@@ -52,62 +71,102 @@ class User(AbstractUser):
     exp = models.IntegerField(default=0)
     level = models.IntegerField(default=1)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=["-points", "id"], name="user_leaderboard_idx")]
+
     @property
     def exp_to_next_level(self) -> int:
-        return round(math.sqrt(self.level / 10) * 1000 + (self.level - 1) ** 2)
+        return levels.exp_to_next_level(self.level)
 
     def save(self, *args, **kwargs):
-        if self.exp >= self.exp_to_next_level:
-            self.exp -= self.exp_to_next_level
-            self.level += 1
+        self.level, self.exp = levels.apply_exp(self.level, self.exp)
         super().save(*args, **kwargs)
 
+    @cached_property
+    def recent_daily_quests(self) -> list:
+        """
+        Today's and yesterday's daily quests with their quest, fetched with one range query on (user, created_at).
+        Cached on this instance, so request.user runs it at most once per request.
+        """
+        today = start_of_today()
+        return list(
+            self.daily_quests.select_related("quest")
+            .filter(created_at__gte=today - timedelta(days=1), created_at__lt=today + timedelta(days=1))
+            .order_by("id")
+        )
+
+    def forget_daily_quests(self) -> None:
+        self.__dict__.pop("recent_daily_quests", None)
+
+    def started_today(self) -> list:
+        today = start_of_today()
+        return [daily_quest for daily_quest in self.recent_daily_quests if daily_quest.created_at >= today]
+
     def has_daily_quest(self) -> bool:
-        return self.daily_quests.filter(created_at__date=timezone.now()).exists()
+        return bool(self.started_today())
 
     def todays_quest(self) -> object | None:
-        today = timezone.now()
-        yesterday = today - timedelta(days=1)
-        queryset = self.daily_quests.filter(Q(created_at__date=today) | Q(created_at__date=yesterday, redeemed=False))
-        return queryset.first()
+        today = start_of_today()
+        for daily_quest in self.recent_daily_quests:
+            if daily_quest.created_at >= today or not daily_quest.redeemed:
+                return daily_quest
+        return None
 
     def tokens_redeemed(self) -> bool:
-        if quest := self.daily_quests.filter(created_at__date=timezone.now()).first():
-            return quest.redeemed
+        if started_today := self.started_today():
+            return started_today[0].redeemed
         return False
 
     def redeem_from_quest(self, daily_quest) -> None:
-        self.coins += daily_quest.quest.coins
-        self.points += daily_quest.quest.points
-        self.exp += daily_quest.quest.exp
-
-        self.save()
+        from socialapp.users import balance
+
+        with transaction.atomic():
+            if not DailyQuest.objects.filter(id=daily_quest.id, redeemed=False).update(redeemed=True):
+                raise DetailException("Rewards already redeemed")
+            quest = daily_quest.quest
+            balance.grant(
+                self,
+                coins=quest.coins,
+                points=quest.points,
+                exp=quest.exp,
+                reason=CoinTransaction.Reason.QUEST,
+            )
         daily_quest.redeemed = True
-        daily_quest.save(update_fields=["redeemed"])
 
     def redeem_from_attendance(self):
-        self.coins += 15
-        self.save(update_fields=["coins"])
+        from socialapp.users import balance
+
+        balance.credit(self, 15, reason=CoinTransaction.Reason.ATTENDANCE)
 
     @property
     def daily_coins_redeemed(self) -> bool:
         return self.daily_coins.filter(date=timezone.now()).exists()
 
+    @cached_property
+    def casino_totals(self) -> dict:
+        """Sums the per game CasinoStats rows, at most one row per game no matter how many spins"""
+        return self.casino_stats.aggregate(
+            coins_lost=Sum("coins_lost", default=0),
+            coins_won=Sum("coins_won", default=0),
+            wins=Sum("wins", default=0),
+            loses=Sum("loses", default=0),
+        )
+
     @property
     def coins_lost_in_casino(self) -> int:
-        return int(self.spin_set.filter(has_won=False).aggregate(Sum("amount", default=0))["amount__sum"])
+        return int(self.casino_totals["coins_lost"])
 
     @property
     def coins_won_in_casino(self) -> int:
-        return int(self.spin_set.filter(has_won=True).aggregate(Sum("amount", default=0))["amount__sum"])
+        return int(self.casino_totals["coins_won"])
 
     @property
     def casino_wins(self) -> int:
-        return self.spin_set.filter(has_won=True).count()
+        return int(self.casino_totals["wins"])
 
     @property
     def casino_loses(self) -> int:
-        return self.spin_set.filter(has_won=False).count()
+        return int(self.casino_totals["loses"])
 
     @property
     def has_unread_messages(self) -> bool:
@@ -125,6 +184,66 @@ class Message(models.Model):
     coins = models.IntegerField(default=100)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["receiver", "read"], name="message_inbox_idx")]
+
+    @classmethod
+    def broadcast(cls, recipients: QuerySet, message: str, coins: int, sender=None, chunk_size: int = 1000) -> int:
+        """Sends the same message to every user in ``recipients``, streaming their ids and inserting a chunk at a time"""
+        user_ids = recipients.order_by().values_list("id", flat=True).iterator(chunk_size=chunk_size)
+        sent = 0
+        while chunk := list(islice(user_ids, chunk_size)):
+            cls.objects.bulk_create(
+                cls(receiver_id=user_id, sender=sender, message=message, coins=coins) for user_id in chunk
+            )
+            sent += len(chunk)
+        return sent
+
+    @classmethod
+    def claim(cls, receiver_id: int, ids: list[int] | None = None) -> list[int]:
+        """
+        Marks the receiver's unread messages, or the chosen ones among them, read in one UPDATE and returns
+        the coins of the rows it flipped. RETURNING isn't available through the ORM, hence the raw SQL.
+        """
+        table, read = connection.ops.quote_name(cls._meta.db_table), connection.ops.quote_name("read")
+        sql = f"UPDATE {table} SET {read} = %s WHERE receiver_id = %s AND {read} = %s"
+        params = [True, receiver_id, False]
+        if ids:
+            sql += f" AND id IN ({', '.join(['%s'] * len(ids))})"
+            params += ids
+        with connection.cursor() as cursor:
+            cursor.execute(sql + " RETURNING coins", params)
+            return [coins for (coins,) in cursor.fetchall()]
+
+
+class CoinTransaction(models.Model):
+    """Ledger of every change of User.coins, written by socialapp.users.balance"""
+
+    class Reason(models.TextChoices):
+        ROULETTE = "roulette"
+        HIGH_CARD = "high_card"
+        BELLS = "bells"
+        BLACK_JACK = "black_jack"
+        MESSAGE = "message"
+        DAILY_COINS = "daily_coins"
+        QUEST = "quest"
+        BET = "bet"
+        BET_PAYOUT = "bet_payout"
+        ATTENDANCE = "attendance"
+        MEETING = "meeting"
+        OTHER = "other"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="coin_transactions")
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=Reason.choices, default=Reason.OTHER)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at"], name="coin_transaction_user_idx")]
+
+    def __str__(self):
+        return f"{self.user} {self.amount:+} {self.reason}"
+
 
 class DailyCoins(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_coins")
@@ -132,12 +251,15 @@ class DailyCoins(models.Model):
     amount = models.FloatField(default=0)
 
     def save(self, *args, **kwargs):
-        if self.id is None:
-            daily_coins = 50
-            self.user.coins += daily_coins
-            self.user.save(update_fields=["coins"])
-            self.amount = daily_coins
-        return super().save(*args, **kwargs)
+        if self.id is not None:
+            return super().save(*args, **kwargs)
+        from socialapp.users import balance
+
+        daily_coins = 50
+        self.amount = daily_coins
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            balance.credit(self.user, daily_coins, reason=CoinTransaction.Reason.DAILY_COINS)
 
 
 class Quest(models.Model):
@@ -151,9 +273,16 @@ class Quest(models.Model):
     points = models.IntegerField(default=10)
     exp = models.IntegerField(default=100)
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return f"{self.duration.total_seconds() / 60} min {self.title}"
 
+    @classmethod
+    def catalog_version(cls) -> str:
+        """Part of the cache key and ETag of the quest catalog"""
+        return table_version(cls)[0]
+
 
 class DailyQuest(models.Model):
     created_at = models.DateTimeField(blank=False, default=timezone.now)
@@ -162,6 +291,9 @@ class DailyQuest(models.Model):
     quest = models.ForeignKey(Quest, on_delete=models.CASCADE, related_name="daily_quests")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_quests")
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"], name="daily_quest_user_created_idx")]
+
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None, *args, **kwargs):
         if self.id is None:
             self.will_end_at = self.created_at + self.quest.duration
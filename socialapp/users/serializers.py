@@ -13,6 +13,8 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework import exceptions, serializers
 from rest_framework_simplejwt.settings import api_settings
 
+from socialapp.bets.models import Bet
+from socialapp.meetings.models import Meeting
 from socialapp.users.models import User, DailyQuest, Quest, PatchNotes, Message
 
 from django.conf import settings
@@ -36,6 +38,27 @@ class UserListSerializer(serializers.ModelSerializer[User]):
         fields = ["id", "username", "points"]
 
 
+class LeaderboardSerializer(serializers.ModelSerializer[User]):
+    class Meta:
+        model = User
+        fields = ["id", "username", "points", "level"]
+
+
+class LeaderboardRankSerializer(LeaderboardSerializer):
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ["rank"] + LeaderboardSerializer.Meta.fields
+
+
+class LeaderboardPositionSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    above = LeaderboardRankSerializer(many=True)
+    user = LeaderboardRankSerializer()
+    below = LeaderboardRankSerializer(many=True)
+
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
@@ -54,9 +77,22 @@ class ReadMessageSerializer(serializers.Serializer):
         return attrs
 
 
-class UserDetailSerializer(serializers.ModelSerializer):
-    unread_messages = MessageSerializer(many=True, read_only=True)
+class ClaimMessagesSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=100,
+        help_text="Messages to claim, defaults to every unread message",
+    )
 
+
+class ClaimedMessagesSerializer(serializers.Serializer):
+    claimed = serializers.IntegerField()
+    coins = serializers.IntegerField()
+
+
+class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = UserListSerializer.Meta.fields + [
@@ -70,7 +106,6 @@ class UserDetailSerializer(serializers.ModelSerializer):
             "casino_wins",
             "casino_loses",
             "has_unread_messages",
-            "unread_messages",
             "date_joined",
             "description",
         ]
@@ -103,6 +138,11 @@ class DailyQuestStartSerializer(serializers.ModelSerializer):
         attrs["user"] = user
         return super().validate(attrs)
 
+    def create(self, validated_data):
+        daily_quest = super().create(validated_data)
+        validated_data["user"].forget_daily_quests()
+        return daily_quest
+
 
 class QuestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -143,4 +183,37 @@ class DailyQuestStatusSerializer(serializers.ModelSerializer):
 class PatchNotesSerializer(serializers.ModelSerializer):
     class Meta:
         model = PatchNotes
-        fields = ["id", "date", "title", "version", "text"]
+        fields = ["id", "date", "title", "version", "text", "html"]
+
+
+class DashboardProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["id", "username", "points", "coins", "exp", "exp_to_next_level", "level"]
+
+
+class DashboardBetSerializer(serializers.ModelSerializer):
+    total = serializers.IntegerField(source="votes_total")
+    total_votes = serializers.IntegerField(source="votes_count")
+
+    class Meta:
+        model = Bet
+        fields = ["id", "text", "label_1", "label_2", "ratio_1", "ratio_2", "deadline", "total", "total_votes"]
+
+
+class DashboardMeetingSerializer(serializers.ModelSerializer):
+    place = serializers.CharField(source="place.name", default=None)
+    users = serializers.IntegerField(source="attendees_count")
+
+    class Meta:
+        model = Meeting
+        fields = ["id", "date", "place", "users", "pizza", "casino"]
+
+
+class DashboardSerializer(serializers.Serializer):
+    profile = DashboardProfileSerializer()
+    daily_coins_redeemed = serializers.BooleanField()
+    unread_messages_count = serializers.IntegerField()
+    quest = DailyQuestStatusSerializer(allow_null=True)
+    open_bets = DashboardBetSerializer(many=True)
+    meetings_to_confirm = DashboardMeetingSerializer(many=True)
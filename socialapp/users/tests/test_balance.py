@@ -0,0 +1,52 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APITestCase
+
+from socialapp.users import balance
+from socialapp.users.models import CoinTransaction
+from socialapp.users.tests.factories import UserFactory
+from socialapp.utils import DetailException
+
+
+class TestBalance(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+
+    def test_credit_writes_ledger(self):
+        balance.credit(self.user, 40, reason=CoinTransaction.Reason.MESSAGE)
+        self.assertEqual(self.user.coins, 540)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 540)
+        transaction = CoinTransaction.objects.get(user=self.user)
+        self.assertEqual((transaction.amount, transaction.reason), (40, CoinTransaction.Reason.MESSAGE))
+
+    def test_debit_guarded(self):
+        with self.assertRaises(DetailException):
+            balance.debit(self.user, 501)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 500)
+        self.assertFalse(CoinTransaction.objects.exists())
+
+    def test_zero_change_still_guarded(self):
+        with self.assertRaises(DetailException):
+            balance.change_balance(self.user, coins=0, require_coins=501)
+        balance.change_balance(self.user, coins=0, require_coins=500)
+        self.assertFalse(CoinTransaction.objects.exists())
+
+    def test_missing_user(self):
+        stale = type(self.user).objects.get(id=self.user.id)
+        self.user.delete()
+        for coins in (0, 10, -10):
+            with self.assertRaises(NotFound):
+                balance.change_balance(stale, coins=coins, require_coins=10)
+
+    def test_debit_does_not_overwrite_concurrent_change(self):
+        stale = type(self.user).objects.get(id=self.user.id)
+        balance.credit(self.user, 100)
+        balance.debit(stale, 50)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 550)
+
+    def test_grant_levels_up(self):
+        balance.grant(self.user, points=5, exp=self.user.exp_to_next_level + 10)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.level, self.user.exp, self.user.points), (2, 10, 5))
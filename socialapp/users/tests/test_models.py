@@ -1,9 +1,14 @@
+import math
 from datetime import timedelta
+from io import StringIO
 from unittest import TestCase
 
+from django.core.management import call_command
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 
+from socialapp.users import balance, levels
+from socialapp.users.models import Message, User, CoinTransaction
 from socialapp.users.tests.factories import UserFactory, QuestFactory, DailyQuestFactory
 
 
@@ -23,6 +28,35 @@ class TestUserModel(APITestCase):
         self.assertEqual(self.user.level, 2)
         self.assertEqual(self.user.exp, 100)
 
+    def test_user_multiple_lvl_ups_on_save(self):
+        self.user.exp = levels.total_exp(level=4, exp=30)
+        self.user.save()
+        self.assertEqual((self.user.level, self.user.exp), (4, 30))
+
+    def test_level_for_total_exp_matches_curve(self):
+        total = 0
+        for level in range(1, 50):
+            self.assertEqual(levels.level_for_total_exp(total), (level, 0))
+            self.assertEqual(levels.level_for_total_exp(total + 1), (level, 1))
+            total += round(math.sqrt(level / 10) * 1000 + (level - 1) ** 2)
+
+    def test_grant_many_levels_up_everyone(self):
+        other = UserFactory(level=3)
+        balance.grant_many([self.user.id, other.id], coins=10, exp=levels.total_exp(5, 0))
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.user.level, self.user.exp, self.user.coins), (5, 0, 510))
+        self.assertEqual(other.level, levels.level_for_total_exp(levels.total_exp(3, 0) + levels.total_exp(5, 0))[0])
+        self.assertEqual(CoinTransaction.objects.count(), 2)
+
+    def test_recalculate_levels_command(self):
+        User.objects.filter(id=self.user.id).update(exp=levels.total_exp(7, 5))
+        stdout = StringIO()
+        call_command("recalculate_levels", chunk_size=1, stdout=stdout)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.level, self.user.exp), (7, 5))
+        self.assertIn("Leveled up 1 users", stdout.getvalue())
+
     def test_user_tokens_redeemed_false(self):
         self.assertEqual(self.user.tokens_redeemed(), False)
 
@@ -34,6 +68,19 @@ class TestUserModel(APITestCase):
         DailyQuestFactory(user=self.user, created_at=timezone.now() - timedelta(days=1), redeemed=True)
         self.assertEqual(self.user.tokens_redeemed(), False)
 
+    def test_user_quest_state_is_one_query(self):
+        DailyQuestFactory(user=self.user, created_at=timezone.now() - timedelta(days=1))
+        DailyQuestFactory(user=self.user, created_at=timezone.now() - timedelta(days=3))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.user.has_daily_quest(), False)
+            self.assertEqual(self.user.tokens_redeemed(), False)
+            self.assertIsNotNone(self.user.todays_quest())
+            self.assertIsNotNone(self.user.todays_quest().quest)
+
+    def test_user_todays_quest_skips_redeemed_yesterday(self):
+        DailyQuestFactory(user=self.user, created_at=timezone.now() - timedelta(days=1), redeemed=True)
+        self.assertIsNone(self.user.todays_quest())
+
     def test_user_redeem_from_quest(self):
         daily = DailyQuestFactory(user=self.user)
         self.user.redeem_from_quest(daily)
@@ -46,3 +93,32 @@ class TestUserModel(APITestCase):
         self.user.redeem_from_attendance()
         self.user.refresh_from_db()
         self.assertEqual(self.user.coins, coins + 15)
+
+
+class TestBroadcast(APITestCase):
+    def setUp(self):
+        self.users = [UserFactory() for _ in range(5)]
+
+    def test_broadcast_inserts_in_chunks(self):
+        with self.assertNumQueries(4):
+            sent = Message.broadcast(User.objects.all(), "reward", 30, chunk_size=2)
+        self.assertEqual(sent, 5)
+        self.assertEqual(Message.objects.filter(message="reward", coins=30).count(), 5)
+
+    def test_broadcast_command(self):
+        User.objects.filter(id=self.users[0].id).update(is_active=False)
+        stdout = StringIO()
+        call_command("broadcast_message", "hello", coins=5, active_only=True, stdout=stdout)
+        self.assertIn("Sent 4 messages", stdout.getvalue())
+        self.assertEqual(Message.objects.count(), 4)
+        self.assertFalse(Message.objects.filter(receiver=self.users[0]).exists())
+
+    def test_broadcast_admin_action(self):
+        admin = UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        data = {"action": "write_message", "_selected_action": [user.id for user in self.users[:2]]}
+        response = self.client.post("/admin/users/user/", data=data)
+        self.assertContains(response, "Send a message")
+        response = self.client.post("/admin/users/user/", data={**data, "apply": "1", "message": "hi", "coins": 7})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Message.objects.filter(message="hi", coins=7, sender=admin).count(), 2)
@@ -1,9 +1,20 @@
 from datetime import timedelta
 from time import sleep
+from unittest.mock import patch
 
+from django.core.cache import cache
+from django.utils import timezone
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase, APIClient
 
+from socialapp.bets.models import Bet, Vote
+from socialapp.meetings.tests.factories import MeetingFactory, AttendanceFactory
+from socialapp.users.models import Message, User, PatchNotes
 from socialapp.users.tests.factories import UserFactory, QuestFactory, DailyQuestFactory
+from socialapp.pagination import KeysetPagination
+from socialapp.users.views import LeaderboardPagination
 
 
 class TestUserViewSet(APITestCase):
@@ -46,8 +57,171 @@ class TestUserViewSet(APITestCase):
         self.assertEqual(response.status_code, 400)
 
 
+class TestInbox(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.messages = [Message.objects.create(receiver=self.user, message=str(i), coins=10) for i in range(5)]
+        Message.objects.create(receiver=UserFactory(), message="not yours")
+
+    def test_profile_does_not_embed_messages(self):
+        response = self.client.get("/api/users/me/")
+        self.assertNotIn("unread_messages", response.data)
+        self.assertTrue(response.data["has_unread_messages"])
+
+    def test_inbox_pages(self):
+        response = self.client.get("/api/users/inbox/?page_size=3")
+        self.assertEqual([row["id"] for row in response.data["results"]], [m.id for m in self.messages[:1:-1]])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_inbox_unread(self):
+        Message.objects.filter(id=self.messages[0].id).update(read=True)
+        response = self.client.get("/api/users/inbox/?unread=true")
+        self.assertEqual(len(response.data["results"]), 4)
+
+    def test_claim_all_messages(self):
+        response = self.client.post("/api/users/claim_messages/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"claimed": 5, "coins": 50})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 550)
+        self.assertFalse(Message.objects.filter(receiver=self.user, read=False).exists())
+        response = self.client.post("/api/users/claim_messages/")
+        self.assertEqual(response.data, {"claimed": 0, "coins": 0})
+
+    def test_claim_messages_statements(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post("/api/users/claim_messages/")
+        writes = [query["sql"].split()[0] for query in queries.captured_queries if "users_message" in query["sql"]]
+        self.assertEqual(writes, ["UPDATE"])
+        self.assertEqual(len([query for query in queries.captured_queries if '"users_user"' in query["sql"]]), 1)
+
+    def test_claim_too_many_messages(self):
+        response = self.client.post("/api/users/claim_messages/", data={"ids": list(range(1, 102))}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_claim_chosen_messages(self):
+        ids = [self.messages[0].id, self.messages[1].id, Message.objects.get(message="not yours").id]
+        response = self.client.post("/api/users/claim_messages/", data={"ids": ids}, format="json")
+        self.assertEqual(response.data, {"claimed": 2, "coins": 20})
+        self.assertEqual(Message.objects.filter(read=True).count(), 2)
+
+
+class TestDashboard(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        DailyQuestFactory(user=self.user)
+
+    def add_data(self, count):
+        for _ in range(count):
+            bet = Bet.objects.create(started_by=UserFactory(), text="bet", deadline=timezone.now() + timedelta(days=1))
+            Vote.objects.create(bet=bet, user=UserFactory(), vote="a", amount=10)
+            meeting = MeetingFactory()
+            AttendanceFactory(meeting=meeting, user=self.user)
+            AttendanceFactory(meeting=meeting)
+            Message.objects.create(receiver=self.user, message="hi")
+
+    def get_dashboard(self):
+        self.client.force_authenticate(user=User.objects.get(id=self.user.id))
+        return self.client.get("/api/users/dashboard/")
+
+    def test_dashboard(self):
+        self.add_data(1)
+        voted_bet = Bet.objects.create(started_by=self.user, text="voted", deadline=timezone.now() + timedelta(days=1))
+        Vote.objects.create(bet=voted_bet, user=self.user, vote="b", amount=5)
+        response = self.client.get("/api/users/dashboard/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["profile"]["coins"], 500)
+        self.assertEqual(response.data["unread_messages_count"], 1)
+        self.assertFalse(response.data["daily_coins_redeemed"])
+        self.assertIsNotNone(response.data["quest"])
+        self.assertEqual([bet["total"] for bet in response.data["open_bets"]], [10])
+        self.assertEqual(response.data["meetings_to_confirm"][0]["users"], 2)
+
+    def test_dashboard_query_count_is_constant(self):
+        self.add_data(1)
+        with CaptureQueriesContext(connection) as few:
+            self.get_dashboard()
+        self.add_data(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.get_dashboard()
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.data["open_bets"]), 11)
+        self.assertEqual(len(response.data["meetings_to_confirm"]), 11)
+
+
+class TestLeaderboard(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = UserFactory(points=50)
+        self.client.force_authenticate(user=self.user)
+        self.others = [UserFactory(points=points) for points in (10, 50, 90, 90, 0)]
+
+    def test_leaderboard_ordered_by_points_and_id(self):
+        response = self.client.get("/api/users/leaderboard/")
+        self.assertEqual(response.status_code, 200)
+        rows = [(row["points"], row["id"]) for row in response.data["results"]]
+        self.assertEqual(rows, sorted(rows, key=lambda row: (-row[0], row[1])))
+        self.assertIsNone(response.data["next"])
+
+    def test_leaderboard_pages_with_cursor(self):
+        seen = []
+        url = "/api/users/leaderboard/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    def test_leaderboard_invalid_cursor(self):
+        response = self.client.get("/api/users/leaderboard/?cursor=abc")
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursors(self):
+        cursors = {
+            "/api/users/leaderboard/": [["abc", "x"], [10, None], [[1], 2]],
+            "/api/users/inbox/": [["x"], [{}]],
+            "/api/patch_notes/": [["notadate"], [1]],
+        }
+        for url, positions in cursors.items():
+            for position in positions:
+                response = self.client.get(url, {"cursor": KeysetPagination().encode_cursor(position)})
+                self.assertEqual(response.status_code, 404, (url, position))
+
+    def test_leaderboard_top_page_is_cached(self):
+        self.client.get("/api/users/leaderboard/")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/users/leaderboard/")
+        self.assertFalse([query for query in queries.captured_queries if query["sql"].startswith("SELECT")])
+        self.assertEqual(len(response.data["results"]), 6)
+
+    @override_settings(ALLOWED_HOSTS=["testserver", "first.example.com", "second.example.com"])
+    def test_cached_top_page_links_to_the_asking_host(self):
+        with patch.object(LeaderboardPagination, "page_size", 2):
+            self.client.get("/api/users/leaderboard/", HTTP_HOST="first.example.com")
+            response = self.client.get("/api/users/leaderboard/", HTTP_HOST="second.example.com")
+        self.assertTrue(response.data["next"].startswith("http://second.example.com/api/users/leaderboard/?cursor="))
+        self.assertEqual(self.client.get(response.data["next"]).data["results"][0]["id"], self.user.id)
+
+    def test_leaderboard_me(self):
+        response = self.client.get("/api/users/leaderboard/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["rank"], 3)
+        self.assertEqual([row["rank"] for row in response.data["above"]], [1, 2])
+        self.assertEqual([row["points"] for row in response.data["below"]], [50, 10, 0])
+        self.assertEqual(response.data["below"][0]["rank"], 4)
+
+
 class TestDailyQuestViewSet(APITestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = UserFactory()
         self.quest = QuestFactory(duration=timedelta(minutes=1))
@@ -58,6 +232,39 @@ class TestDailyQuestViewSet(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 1)
 
+    def test_choices_cached_until_quest_changes(self):
+        self.client.get("/api/quests/choices/")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/quests/choices/")
+        # only the version is read, the catalog itself comes from the cache
+        self.assertEqual(len([query for query in queries if "users_quest" in query["sql"]]), 1)
+        QuestFactory(title="new one")
+        response = self.client.get("/api/quests/choices/")
+        self.assertEqual(len(response.data), 2)
+
+    def test_choices_not_modified(self):
+        etag = self.client.get("/api/quests/choices/")["ETag"]
+        response = self.client.get("/api/quests/choices/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.quest.delete()
+        response = self.client.get("/api/quests/choices/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 0)
+
+    def test_choices_if_none_match_lists(self):
+        etag = self.client.get("/api/quests/choices/")["ETag"]
+        for header in (f'"other", W/{etag}', "*", f'"other", {etag}'):
+            response = self.client.get("/api/quests/choices/", HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304)
+        for header in (etag[:-2] + '"', '"other"', etag[:-1] + '0"'):
+            response = self.client.get("/api/quests/choices/", HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 200)
+
+    def test_choices_available_at_level(self):
+        QuestFactory(level_required=5)
+        response = self.client.get("/api/quests/choices/?available=true")
+        self.assertEqual([quest["id"] for quest in response.data], [self.quest.id])
+
     def test_start_daily_quest(self):
         response = self.client.post("/api/quests/start/", data={"quest": self.quest.id})
         self.assertEqual(response.status_code, 201)
@@ -83,7 +290,117 @@ class TestDailyQuestViewSet(APITestCase):
         response = self.client.post("/api/quests/redeem/")
         self.assertEqual(response.status_code, 400)
 
+    def test_status_resolves_quest_with_one_query(self):
+        DailyQuestFactory(quest=self.quest, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/quests/status/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if "users_dailyquest" in query["sql"]]), 1)
+
+    def test_status_not_started(self):
+        response = self.client.get("/api/quests/status/")
+        self.assertEqual(response.status_code, 400)
+
     def test_redeem_during(self):
         self.client.post("/api/quests/start/", data={"quest": self.quest.id})
         response = self.client.post("/api/quests/redeem/")
         self.assertEqual(response.status_code, 400)
+
+
+class TestPatchNotes(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        PatchNotes.objects.create(date="2024-07-01", title="first", text="# Hello", version="1.0")
+        for day in range(2, 5):
+            PatchNotes.objects.create(date=f"2024-07-0{day}", title="next", text="*fix*")
+        PatchNotes.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+    def test_patch_notes_rendered_and_paginated(self):
+        response = self.client.get("/api/patch_notes/?page_size=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([note["version"] for note in response.data["results"]], ["1.3", "1.2", "1.1"])
+        self.assertEqual(response.data["results"][0]["html"], "<p><em>fix</em></p>")
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["results"][0]["html"], "<h1>Hello</h1>")
+
+    def test_patch_notes_conditional_get(self):
+        response = self.client.get("/api/patch_notes/")
+        response = self.client.get("/api/patch_notes/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/api/patch_notes/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_patch_notes_modified_by_edit(self):
+        response = self.client.get("/api/patch_notes/")
+        note = PatchNotes.objects.get(version="1.0")
+        note.text = "# Hello again"
+        note.save()
+        response = self.client.get("/api/patch_notes/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][-1]["html"], "<h1>Hello again</h1>")
+
+    def test_patch_notes_cached_until_saved(self):
+        etag = self.client.get("/api/patch_notes/")["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/patch_notes/")
+        # only the feed state is read, the page itself comes from the cache
+        self.assertEqual(len([query for query in queries if "users_patchnotes" in query["sql"]]), 1)
+        PatchNotes.objects.create(date="2024-07-10", title="new", text="new", major=True)
+        response = self.client.get("/api/patch_notes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["version"], "2.0")
+
+
+class TestAttendanceStatsViews(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_attendance_stats(self):
+        AttendanceFactory(user=self.user, meeting=MeetingFactory(pizza=True))
+        response = self.client.get(f"/api/users/{self.user.id}/attendance_stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["attended"], response.data["pizza_nights"]), (1, 1))
+        self.assertEqual(response.data["drinking_ratio"], 1.0)
+
+    def test_user_without_meetings_has_empty_stats(self):
+        response = self.client.get(f"/api/users/{self.user.id}/attendance_stats/")
+        self.assertEqual(response.data["attended"], 0)
+        self.assertEqual(response.data["favourite_places"], [])
+
+    def test_many_users_attendance_stats_in_one_query(self):
+        users = UserFactory.create_batch(4)
+        meeting = MeetingFactory()
+        for user in users:
+            AttendanceFactory(user=user, meeting=meeting)
+        ids = ",".join(str(user.id) for user in [self.user, *users])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/users/attendance_stats/?ids={ids}")
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("SELECT")]), 1)
+        self.assertEqual([row["user"] for row in response.data], [user.id for user in users])
+
+    def test_companions(self):
+        friend, other = UserFactory.create_batch(2)
+        for users in ([friend, other], [friend]):
+            meeting = MeetingFactory()
+            for user in [self.user, *users]:
+                AttendanceFactory(user=user, meeting=meeting)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/users/{self.user.id}/companions/")
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("SELECT")]), 2)
+        self.assertEqual(
+            [(row["username"], row["meetings_together"]) for row in response.data],
+            [(friend.username, 2), (other.username, 1)],
+        )
+
+    def test_companions_of_missing_user(self):
+        for pk in ("abc", 0):
+            response = self.client.get(f"/api/users/{pk}/companions/")
+            self.assertEqual(response.status_code, 404)
+
+    def test_many_users_attendance_stats_invalid_ids(self):
+        for query in ("", "?ids=a,b", "?ids=" + ",".join(map(str, range(1, 102)))):
+            response = self.client.get(f"/api/users/attendance_stats/{query}")
+            self.assertEqual(response.status_code, 400)
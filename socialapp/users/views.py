@@ -1,5 +1,13 @@
+from bisect import bisect_right
+from operator import itemgetter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from drf_spectacular.utils import extend_schema
+from django.utils.http import http_date, parse_http_date_safe
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import GenericAPIView
@@ -10,8 +18,14 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from socialapp.users.models import User, DailyQuest, Quest, DailyCoins, PatchNotes
+from socialapp.bets.models import Bet, Vote
+from socialapp.meetings.models import Meeting, Attendance, AttendanceStats, Companionship
+from socialapp.meetings.serializers import AttendanceStatsSerializer, CompanionSerializer
+from socialapp.pagination import KeysetPagination
+from socialapp.users import balance
+from socialapp.users.models import User, DailyQuest, Quest, DailyCoins, PatchNotes, Message, CoinTransaction
 from socialapp.permissions import IsYouOrReadOnly
+from socialapp.utils import DetailException, etag_matches
 
 from socialapp.users.serializers import (
     UserListSerializer,
@@ -23,6 +37,12 @@ from socialapp.users.serializers import (
     UserDetailSerializer,
     DailyQuestRedeemSerializer,
     ReadMessageSerializer,
+    LeaderboardSerializer,
+    LeaderboardPositionSerializer,
+    DashboardSerializer,
+    MessageSerializer,
+    ClaimMessagesSerializer,
+    ClaimedMessagesSerializer,
 )
 
 from django.http import Http404
@@ -55,11 +75,63 @@ class SocialappConfirmEmailView(GenericAPIView):
         return Response({"detail": "Email confirmed"})
 
 
-@extend_schema(tags=["patch notes"], summary="List of patch notes ordered by date")
+class PatchNotesPagination(KeysetPagination):
+    ordering = ("-date",)
+    page_size = 20
+
+
+@extend_schema(
+    tags=["patch notes"],
+    summary="List of patch notes ordered by date",
+    parameters=[OpenApiParameter("cursor", str), OpenApiParameter("page_size", int)],
+)
 class PatchNotesView(ListModelMixin, GenericViewSet):
     permission_classes = [AllowAny]
     queryset = PatchNotes.objects.order_by("-date")
     serializer_class = PatchNotesSerializer
+    pagination_class = PatchNotesPagination
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    def list(self, request, *args, **kwargs):
+        state = PatchNotes.feed_state()
+        headers = {"ETag": state["etag"]}
+        if state["updated_at"]:
+            headers["Last-Modified"] = http_date(state["updated_at"].timestamp())
+        if self.not_modified(request, state):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        paginator = self.paginator
+        key = ":".join(
+            [
+                "patch_notes:feed",
+                state["etag"],
+                request.query_params.get(paginator.cursor_query_param, ""),
+                str(paginator.get_page_size(request)),
+            ]
+        )
+        if (data := cache.get(key)) is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, self.CACHE_TIMEOUT)
+        return Response(data, headers=headers)
+
+    @staticmethod
+    def not_modified(request, state: dict) -> bool:
+        if if_none_match := request.headers.get("If-None-Match"):
+            return etag_matches(state["etag"], if_none_match)
+        # HTTP dates have a resolution of a second and can't see a deleted note, the ETag covers both
+        if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        if not if_modified_since or not state["updated_at"]:
+            return False
+        return int(state["updated_at"].timestamp()) <= if_modified_since
+
+
+class LeaderboardPagination(KeysetPagination):
+    ordering = ("-points", "id")
+    page_size = 50
+
+
+class InboxPagination(KeysetPagination):
+    ordering = ("-id",)
+    page_size = 20
 
 
 @extend_schema(summary="Default actions to users")
@@ -69,7 +141,20 @@ class UserViewSet(RetrieveModelMixin, ListModelMixin, UpdateModelMixin, GenericV
     serializer_classes = {
         "list": UserListSerializer,
         "read_message": ReadMessageSerializer,
+        "leaderboard": LeaderboardSerializer,
+        "leaderboard_me": LeaderboardPositionSerializer,
+        "dashboard": DashboardSerializer,
+        "inbox": MessageSerializer,
+        "claim_messages": ClaimMessagesSerializer,
+        "attendance_stats": AttendanceStatsSerializer,
+        "attendance_stats_many": AttendanceStatsSerializer,
+        "companions": CompanionSerializer,
     }
+    ATTENDANCE_STATS_MAX_USERS = 100
+    COMPANIONS_LIMIT = 10
+    LEADERBOARD_CACHE_KEY = "users:leaderboard:top"
+    LEADERBOARD_CACHE_TIMEOUT = 60
+    LEADERBOARD_NEIGHBOURS = 5
 
     def get_serializer_class(self):
         return self.serializer_classes.get(self.action, UserDetailSerializer)
@@ -80,6 +165,125 @@ class UserViewSet(RetrieveModelMixin, ListModelMixin, UpdateModelMixin, GenericV
         serializer = self.get_serializer(request.user, context={"request": request})
         return Response(status=status.HTTP_200_OK, data=serializer.data)
 
+    @extend_schema(summary="Everything the home screen needs in one request")
+    @action(detail=False)
+    def dashboard(self, request):
+        user = request.user
+        now = timezone.now()
+        unread_messages = (
+            Message.objects.filter(receiver=OuterRef("id"), read=False)
+            .order_by()
+            .values("receiver")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        profile = User.objects.annotate(
+            daily_coins_today=Exists(DailyCoins.objects.filter(user=OuterRef("id"), date=now)),
+            unread_messages_count=Coalesce(Subquery(unread_messages), Value(0), output_field=IntegerField()),
+        ).get(id=user.id)
+        open_bets = (
+            Bet.objects.filter(rewards_granted=False, deadline__gt=now)
+            .exclude(Exists(Vote.objects.filter(bet=OuterRef("id"), user=user)))
+            .annotate(votes_total=Sum("votes__amount", default=0), votes_count=Count("votes"))
+            .order_by("deadline")
+        )
+        meetings_to_confirm = (
+            Meeting.objects.filter(
+                Exists(Attendance.objects.filter(meeting=OuterRef("id"), user=user, confirmed=False)),
+                confirmed_by_majority=False,
+                archived=False,
+            )
+            .select_related("place")
+            .annotate(attendees_count=Count("attendance"))
+            .order_by("-date")
+        )
+        data = {
+            "profile": profile,
+            "daily_coins_redeemed": profile.daily_coins_today,
+            "unread_messages_count": profile.unread_messages_count,
+            "quest": user.todays_quest(),
+            "open_bets": open_bets,
+            "meetings_to_confirm": meetings_to_confirm,
+        }
+        return Response(self.get_serializer(data).data)
+
+    @extend_schema(
+        tags=["leaderboard"],
+        summary="Users ordered by points, pass the returned cursor to get the next page",
+        parameters=[OpenApiParameter("cursor", str), OpenApiParameter("page_size", int)],
+    )
+    @action(detail=False, pagination_class=LeaderboardPagination)
+    def leaderboard(self, request):
+        paginator = self.paginator
+        is_top_page = not set(request.query_params) & {paginator.cursor_query_param, paginator.page_size_query_param}
+        if is_top_page and (top := cache.get(self.LEADERBOARD_CACHE_KEY)):
+            # only the cursor is cached, the link is built for the host asking now
+            paginator.request = request
+            return Response({"next": paginator.link_to(top["cursor"]), "results": top["results"]})
+        page = self.paginate_queryset(User.objects.only("id", "username", "points", "level"))
+        data = self.get_serializer(page, many=True).data
+        if is_top_page:
+            top = {"cursor": paginator.next_cursor(), "results": data}
+            cache.set(self.LEADERBOARD_CACHE_KEY, top, self.LEADERBOARD_CACHE_TIMEOUT)
+        return self.get_paginated_response(data)
+
+    @extend_schema(tags=["meetings"], summary="Meeting statistics of the user")
+    @action(detail=True, url_path="attendance_stats")
+    def attendance_stats(self, request, pk=None):
+        user = self.get_object()
+        stats = AttendanceStats.objects.filter(user=user).first() or AttendanceStats(user=user)
+        return Response(self.get_serializer(stats).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        tags=["meetings"],
+        summary="Meeting statistics of many users, users who never attended a meeting are left out",
+        parameters=[OpenApiParameter("ids", str, description="Comma separated user ids, at most 100", required=True)],
+        responses={200: AttendanceStatsSerializer(many=True)},
+    )
+    @action(detail=False, url_path="attendance_stats")
+    def attendance_stats_many(self, request):
+        try:
+            ids = {int(user_id) for user_id in request.query_params.get("ids", "").split(",") if user_id}
+        except ValueError:
+            raise DetailException("ids must be a comma separated list of numbers")
+        if not ids or len(ids) > self.ATTENDANCE_STATS_MAX_USERS:
+            raise DetailException(f"Give between 1 and {self.ATTENDANCE_STATS_MAX_USERS} ids")
+        stats = AttendanceStats.objects.filter(user_id__in=ids).order_by("user_id")
+        return Response(self.get_serializer(stats, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(tags=["meetings"], summary="People the user met with most often")
+    @action(detail=True)
+    def companions(self, request, pk=None):
+        companions = (
+            Companionship.objects.filter(user_id=self.get_object().id)
+            .select_related("companion")
+            .only("companion_id", "count", "companion__username")
+            .order_by("-count", "companion_id")[: self.COMPANIONS_LIMIT]
+        )
+        return Response(self.get_serializer(companions, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(tags=["leaderboard"], summary="Your rank and the users right above and below you")
+    @action(detail=False, url_path="leaderboard/me")
+    def leaderboard_me(self, request):
+        user = request.user
+        position = (user.points, user.id)
+        paginator = LeaderboardPagination()
+        users = User.objects.only("id", "username", "points", "level")
+        # an index-only range scan of user_leaderboard_idx, so the cost grows with the rank rather than the
+        # number of users, it is not O(log n); the neighbours are two LIMITed seeks on the same index
+        rank = User.objects.filter(paginator.before(position)).count() + 1
+        above = list(users.filter(paginator.before(position)).order_by("points", "-id")[: self.LEADERBOARD_NEIGHBOURS])
+        below = list(
+            users.filter(paginator.after(position)).order_by(*paginator.ordering)[: self.LEADERBOARD_NEIGHBOURS]
+        )
+        for offset, neighbour in enumerate(above, start=1):
+            neighbour.rank = rank - offset
+        for offset, neighbour in enumerate(below, start=1):
+            neighbour.rank = rank + offset
+        user.rank = rank
+        serializer = self.get_serializer({"rank": rank, "above": above[::-1], "user": user, "below": below})
+        return Response(serializer.data)
+
     @extend_schema(tags=["daily"], summary="Redeem daily coins")
     @action(detail=False, methods=["post"])
     def redeem_daily_coins(self, request):
@@ -90,17 +294,47 @@ class UserViewSet(RetrieveModelMixin, ListModelMixin, UpdateModelMixin, GenericV
         user.refresh_from_db()
         return Response(self.get_serializer(user).data, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        tags=["messages"],
+        summary="Your messages, newest first",
+        parameters=[OpenApiParameter("cursor", str), OpenApiParameter("unread", bool)],
+    )
+    @action(detail=False, pagination_class=InboxPagination)
+    def inbox(self, request):
+        messages = Message.objects.filter(receiver=request.user)
+        if request.query_params.get("unread") in ["true", "1"]:
+            messages = messages.filter(read=False)
+        page = self.paginate_queryset(messages)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @extend_schema(
+        tags=["messages"],
+        summary="Read all or chosen unread messages and claim their coins",
+        request=ClaimMessagesSerializer,
+        responses={200: ClaimedMessagesSerializer},
+    )
+    @action(detail=False, methods=["post"])
+    def claim_messages(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            # the read flag is flipped and re-checked by the same UPDATE, so a message can't be claimed twice
+            claimed = Message.claim(request.user.id, serializer.validated_data.get("ids"))
+            coins = sum(claimed)
+            if coins:
+                balance.credit(request.user, coins, reason=CoinTransaction.Reason.MESSAGE)
+        return Response(ClaimedMessagesSerializer({"claimed": len(claimed), "coins": coins}).data)
+
     @extend_schema(summary="Read message and claim rewards", request=ReadMessageSerializer, responses={204: None})
     @action(detail=False, methods=["post"])
     def read_message(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = request.user
         message = serializer.validated_data["id"]
-        user.coins += message.coins
-        message.read = True
-        user.save(update_fields=["coins"])
-        message.save()
+        with transaction.atomic():
+            if not Message.objects.filter(id=message.id, read=False).update(read=True):
+                return Response("Message already read", status=status.HTTP_400_BAD_REQUEST)
+            balance.credit(request.user, message.coins, reason=CoinTransaction.Reason.MESSAGE)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -120,13 +354,33 @@ class DailyQuestViewSet(GenericViewSet):
     def get_serializer_class(self):
         return self.serializer_classes.get(self.action, DailyQuestSerializer)
 
-    @extend_schema(request=None, responses=QuestSerializer(many=True), summary="List of possible daily quests")
+    CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+    def get_catalog(self, version: str) -> list:
+        """Serialized quests ordered by level_required, cached under the catalog version"""
+        key = f"quests:catalog:{version}"
+        if (catalog := cache.get(key)) is None:
+            catalog = list(self.get_serializer(Quest.objects.order_by("level_required", "id"), many=True).data)
+            cache.set(key, catalog, self.CATALOG_CACHE_TIMEOUT)
+        return catalog
+
+    @extend_schema(
+        request=None,
+        responses=QuestSerializer(many=True),
+        summary="List of possible daily quests",
+        parameters=[OpenApiParameter("available", bool, description="Only quests unlocked at your level")],
+    )
     @action(detail=False, methods=["get"], pagination_class=None)
     def choices(self, request):
-        serializer = self.get_serializer(
-            Quest.objects.order_by("level_required"), many=True, context={"request": request}
-        )
-        return Response(status=status.HTTP_200_OK, data=serializer.data)
+        version = Quest.catalog_version()
+        available = request.query_params.get("available") in ["true", "1"]
+        etag = f'"quests-{version}-{request.user.level}"' if available else f'"quests-{version}"'
+        if etag_matches(etag, request.headers.get("If-None-Match")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        catalog = self.get_catalog(version)
+        if available:
+            catalog = catalog[: bisect_right(catalog, request.user.level, key=itemgetter("level_required"))]
+        return Response(status=status.HTTP_200_OK, data=catalog, headers={"ETag": etag})
 
     @extend_schema(
         request=DailyQuestStartSerializer, responses={201: DailyQuestStartSerializer}, summary="Start a daily quest"
@@ -161,8 +415,7 @@ class DailyQuestViewSet(GenericViewSet):
     @extend_schema(request=None, responses={200: DailyQuestStatusSerializer}, summary="Status of a daily quest")
     @action(detail=False, methods=["get"])
     def status(self, request):
-        if request.user.todays_quest():
-            serializer = self.get_serializer(request.user.todays_quest(), context={"request": request})
+        if daily_quest := request.user.todays_quest():
+            serializer = self.get_serializer(daily_quest, context={"request": request})
             return Response(serializer.data)
-        if not request.user.has_daily_quest():
-            return Response({"detail": "Quest not started"}, status.HTTP_400_BAD_REQUEST)
+        return Response({"detail": "Quest not started"}, status.HTTP_400_BAD_REQUEST)
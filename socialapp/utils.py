@@ -1,3 +1,8 @@
+from collections.abc import Iterator
+from datetime import datetime
+
+from django.db.models import Count, Max, QuerySet
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.exceptions import APIException
 
@@ -13,3 +18,30 @@ class DetailException(APIException):
             self.detail = {field: detail}
         else:
             self.detail = {"detail": self.default_detail}
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Whether an If-None-Match header lists ``etag`` or ``*``, compared weakly as RFC 9110 asks for"""
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return "*" in etags or etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in etags}
+
+
+def id_chunks(queryset: QuerySet, chunk_size: int) -> Iterator[list[int]]:
+    """Ids of ``queryset`` in ascending chunks, each chunk is a seek past the last id of the previous one"""
+    last_id = 0
+    while ids := list(queryset.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size]):
+        yield ids
+        last_id = ids[-1]
+
+
+def table_version(model) -> tuple[str, datetime | None]:
+    """
+    Version of everything in ``model``'s table and its newest ``updated_at``, read in one aggregate query so
+    every process agrees on them. A save moves the newest updated_at and a delete the row count, changes
+    made with QuerySet.update() are not seen.
+    """
+    state = model.objects.aggregate(count=Count("pk"), updated=Max("updated_at"))
+    updated = int(state["updated"].timestamp() * 1_000_000) if state["updated"] else 0
+    return f"{state['count']}-{updated}", state["updated"]